@@ -4,7 +4,10 @@ from django.shortcuts import redirect
 from django.template.response import TemplateResponse
 from django.utils.html import format_html
 from django.urls import reverse
-from .models import Invoice, ExcelFile, Product, TTN, Price, FinalSample
+from django.db.models import Count
+from .models import (
+    Invoice, ExcelFile, Product, TTN, Price, PriceList, FinalSample, MatchMemory, IngestionRecord
+)
 
 
 
@@ -23,7 +26,7 @@ class ProductInline(admin.TabularInline):
 
     def excel_file_link(self, obj):
         url = reverse('admin:parser_excelfile_change', args=[obj.excel_file.id])
-        return format_html('<a href="{}">{}</a>', url, obj.excel_file.file.name.split('/')[-1])
+        return format_html('<a href="{}">{}</a>', url, obj.excel_file.display_name)
     excel_file_link.short_description = 'Файл'
 
 
@@ -89,11 +92,12 @@ class InvoiceAdmin(admin.ModelAdmin):
 class ExcelFileAdmin(admin.ModelAdmin):
     list_display = ('file_name', 'uploaded_at', 'processed', 'ttn_link', 'products_link')
     list_filter = ('processed', 'uploaded_at', 'ttn')
-    readonly_fields = ('uploaded_at', 'products_link', 'ttn_link')
+    search_fields = ('original_name', 'content_hash')
+    readonly_fields = ('uploaded_at', 'products_link', 'ttn_link', 'content_hash')
     actions = ['mark_as_processed']
 
     def file_name(self, obj):
-        return obj.file.name.split('/')[-1]
+        return obj.display_name
     file_name.short_description = 'Файл'
 
     def ttn_link(self, obj):
@@ -134,6 +138,22 @@ class ProductAdmin(admin.ModelAdmin):
     ttn_link.short_description = 'ТТН'
 
 
+@admin.register(PriceList)
+class PriceListAdmin(admin.ModelAdmin):
+    list_display = ('valid_from', 'name', 'prices_link', 'created_at')
+    search_fields = ('name',)
+    readonly_fields = ('content_hash', 'created_at')
+    ordering = ('-valid_from',)
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(prices_count=Count('prices'))
+
+    def prices_link(self, obj):
+        url = reverse('admin:parser_price_changelist') + f'?price_list__id__exact={obj.id}'
+        return format_html('<a href="{}">{} позиций</a>', url, obj.prices_count)
+    prices_link.short_description = 'Позиции'
+
+
 @admin.register(Price)
 class PriceAdmin(admin.ModelAdmin):
     list_display = (
@@ -146,19 +166,21 @@ class PriceAdmin(admin.ModelAdmin):
         'formatted_stock',
         'quantity',
         'price_clear',
+        'price_list',
         'created_at'
     )
     list_display_links = ('code', 'short_name')
     search_fields = ('code', 'article', 'name', 'type')
-    list_filter = ('type', 'created_at')
+    list_filter = ('price_list', 'type', 'created_at')
     list_per_page = 50
     ordering = ('code',)
+    list_select_related = ('price_list',)
     readonly_fields = ('created_at', 'updated_at')
     actions = ['delete_all_prices']
 
     fieldsets = (
         ('Основная информация', {
-            'fields': ('code', 'type', 'article', 'name')
+            'fields': ('price_list', 'code', 'type', 'article', 'name')
         }),
         ('Цены и остатки', {
             'fields': ('price1', 'price2', 'price_clear', 'stock', 'quantity')
@@ -250,4 +272,20 @@ class FinalSampleAdmin(admin.ModelAdmin):
     def short_product_name(self, obj):
         return obj.product_name[:50] + '...' if len(obj.product_name) > 50 else obj.product_name
 
-    short_product_name.short_description = 'Наименование'
\ No newline at end of file
+    short_product_name.short_description = 'Наименование'
+
+@admin.register(MatchMemory)
+class MatchMemoryAdmin(admin.ModelAdmin):
+    list_display = ('product_key', 'price', 'match_status', 'similarity', 'catalog_version', 'created_at')
+    list_filter = ('match_status',)
+    search_fields = ('product_key', 'price__code', 'price__article')
+    raw_id_fields = ('price',)
+
+
+@admin.register(IngestionRecord)
+class IngestionRecordAdmin(admin.ModelAdmin):
+    list_display = ('filename', 'state', 'attempts', 'excel_file', 'archived_path', 'updated_at')
+    list_filter = ('state',)
+    search_fields = ('filename', 'content_hash', 'error')
+    readonly_fields = ('created_at', 'updated_at')
+    raw_id_fields = ('excel_file',)
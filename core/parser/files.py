@@ -0,0 +1,28 @@
+# parser/files.py
+import hashlib
+import os
+from itertools import islice
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def file_sha256(path):
+    """SHA-256 содержимого файла (читается кусками, без загрузки целиком)"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def content_addressed_name(directory, content_hash, filename):
+    """Путь в хранилище по хэшу содержимого: <directory>/ab/abcdef....xlsx"""
+    extension = os.path.splitext(filename)[1].lower()
+    return f"{directory}/{content_hash[:2]}/{content_hash}{extension}"
+
+
+def batched(iterable, size):
+    """Списки по size элементов из итератора, не читая его целиком"""
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
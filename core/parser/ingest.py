@@ -0,0 +1,433 @@
+# parser/ingest.py
+"""Запись проверенных страниц накладных в БД с учётом журнала загрузки.
+
+Общая часть load_excels и watch_input: чтение и проверка файла
+(parser.invoices) идут где угодно, а всё, что ниже, выполняется только
+в основном процессе - он единственный пишет в БД.
+"""
+import heapq
+import multiprocessing
+import os
+import shutil
+import time
+from concurrent.futures import Future, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from datetime import date
+from xml.etree.ElementTree import ParseError
+
+from django.core.files import File
+from django.db import connections, transaction
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from parser.files import batched
+from parser.invoices import (
+    CHUNK_SIZE, FILENAME_PATTERN, InvoiceReadError, invoice_readers, iter_invoice_chunks, parse_invoice_file,
+    parse_invoice_filename
+)
+from parser.reporting import DETAIL, get_reporter
+from parser.xlsx_stream import UnsupportedWorkbook
+from parser.models import ExcelFile, Product, Invoice, TTN, IngestionRecord, excel_upload_to
+
+INPUT_DIR = 'parser/input'
+ARCHIVE_DIR = 'parser/archive'
+
+
+def sync_ledger(hashes):
+    """Записи журнала для файлов папки; новые и изменившиеся файлы - в pending"""
+    records = IngestionRecord.objects.in_bulk(list(hashes), field_name='filename')
+    new_records = [
+        IngestionRecord(filename=filename, content_hash=content_hash)
+        for filename, content_hash in hashes.items() if filename not in records
+    ]
+    IngestionRecord.objects.bulk_create(new_records)
+    for record in new_records:
+        records[record.filename] = record
+
+    changed = [
+        record for filename, record in records.items()
+        if record.content_hash != hashes[filename]
+    ]
+    for record in changed:
+        record.content_hash = hashes[record.filename]
+        record.state = 'pending'
+        record.error = ''
+        record.excel_file = None
+    IngestionRecord.objects.bulk_update(changed, ['content_hash', 'state', 'error', 'excel_file'])
+    return records
+
+
+def mark(record, state, **fields):
+    """Фиксирует состояние файла в журнале (вне транзакции загрузки файла)"""
+    record.state = state
+    for name, value in fields.items():
+        setattr(record, name, value)
+    record.save(update_fields=['state', 'updated_at', *fields])
+
+
+def archive_file(record):
+    """Переносит загруженный файл из папки input в архив"""
+    archive_dir = os.path.join(ARCHIVE_DIR, date.today().isoformat())
+    os.makedirs(archive_dir, exist_ok=True)
+    target = os.path.join(archive_dir, record.filename)
+    if os.path.exists(target):
+        name, extension = os.path.splitext(record.filename)
+        target = os.path.join(archive_dir, f"{name}_{record.content_hash[:8]}{extension}")
+    shutil.move(os.path.join(INPUT_DIR, record.filename), target)
+    record.archived_path = target
+    record.save(update_fields=['archived_path', 'updated_at'])
+    get_reporter().info('file_archived', f"📦 Файл перенесён в {target}", 'blue', file=record.filename, path=target)
+
+
+def fork_executor(workers, initializer=None, initargs=()):
+    """Пул процессов-обработчиков (fork, где он есть), запущенный целиком сразу.
+
+    Соединения с БД закрываются, чтобы дочерние процессы их не унаследовали,
+    и все workers процессов стартуют до того, как основной процесс откроет новое.
+    """
+    connections.close_all()
+    start_methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context('fork' if 'fork' in start_methods else None)
+    executor = ProcessPoolExecutor(
+        max_workers=workers, mp_context=context, initializer=initializer, initargs=initargs
+    )
+    wait([executor.submit(int) for _ in range(workers)])
+    return executor
+
+
+def submit_parse(executor, filepath):
+    """Отдаёт файл пулу на parse_invoice_file; если пул уже сломан - future с этой ошибкой"""
+    try:
+        return executor.submit(parse_invoice_file, filepath)
+    except BrokenProcessPool as e:
+        future = Future()
+        future.set_exception(e)
+        return future
+
+
+def parse_result(future, filepath):
+    """Результат чтения файла в пуле.
+
+    Сбой процесса-обработчика (BrokenProcessPool после OOM и т.п.) или любое
+    исключение из parse_invoice_file - ошибка только этого файла: save_file
+    запишет её в журнал, остальные файлы загружаются дальше.
+    """
+    try:
+        return future.result()
+    except Exception as e:
+        return {
+            'filepath': filepath, 'rows': [], 'errors': [], 'messages': [],
+            'error': f"Ошибка чтения файла: {e or type(e).__name__}",
+            'reader': None, 'row_count': 0, 'seconds': 0,
+        }
+
+
+def upload_key(filename, content_hash):
+    """Ключ загрузки файла: (хэш, номер ТТН, страница); None, если имя не по шаблону.
+
+    Одинаковое содержимое под другим именем - это другая страница или ТТН,
+    её товары нужны в БД; общим остаётся только файл в хранилище (store_file).
+    """
+    match = FILENAME_PATTERN.match(filename)
+    if not match:
+        return None
+    return content_hash, match.group('number'), int(match.group('page'))
+
+
+def find_duplicates(hashes):
+    """Уже загруженные файлы с тем же содержимым, ТТН и страницей: {имя файла: ExcelFile}"""
+    keys = {
+        filename: key for filename, content_hash in hashes.items()
+        if (key := upload_key(filename, content_hash))
+    }
+    loaded = {}
+    existing = ExcelFile.objects.filter(
+        content_hash__in={key[0] for key in keys.values()}, processed=True, ttn__isnull=False
+    ).select_related('ttn').order_by('id')
+    for excel_file in existing:
+        loaded.setdefault((excel_file.content_hash, excel_file.ttn.number, excel_file.page_number), excel_file)
+    return {filename: loaded[key] for filename, key in keys.items() if key in loaded}
+
+
+def skip_duplicate(record, existing, archive=False):
+    """Файл, уже загруженный в ту же ТТН и страницу: отмечаем в журнале и не читаем"""
+    get_reporter().info(
+        'file_duplicate', f"⏭ Файл уже загружен как {existing} (ExcelFile #{existing.pk}), пропущен", 'blue',
+        file=record.filename, excel_file=existing.pk
+    )
+    mark(record, 'done', excel_file=existing, error='')
+    if archive:
+        archive_file(record)
+
+
+def store_file(excel_file, filename, filepath):
+    """Сохраняет файл по хэшу содержимого; если такой уже лежит в хранилище - не копирует"""
+    storage_name = excel_upload_to(excel_file, filename)
+    if excel_file.file.storage.exists(storage_name):
+        excel_file.file.name = storage_name
+        excel_file.save()
+        return
+    with open(filepath, 'rb') as f:
+        excel_file.file.save(filename, File(f), save=True)
+
+
+def resolve_references(filenames):
+    """ТТН и накладные для файлов: существующие - одним запросом, недостающие - bulk_create.
+
+    Возвращает словарь: 'ttns' и 'invoices' - объекты по номеру, 'created_ttns'
+    и 'created_invoices' - номера созданных сейчас (их убирает drop_unused_references),
+    'announced' - о каких новых ТТН уже сообщено.
+    """
+    keys = {filename: parse_invoice_filename(filename) for filename in filenames}
+
+    ttn_dates = {}
+    for ttn_number, invoice_date, _ in keys.values():
+        ttn_dates.setdefault(ttn_number, invoice_date)
+    ttns = TTN.objects.in_bulk(list(ttn_dates), field_name='number')
+    created_ttns = set(ttn_dates) - set(ttns)
+    if created_ttns:
+        # ignore_conflicts: ТТН мог создать параллельный watch_input; ключи перечитываем
+        TTN.objects.bulk_create(
+            [TTN(number=number, date=ttn_dates[number], status='in_progress') for number in created_ttns],
+            ignore_conflicts=True
+        )
+        ttns = TTN.objects.in_bulk(list(ttn_dates), field_name='number')
+
+    invoice_keys = {
+        f"{ttn_number}_{page_number}": (ttn_number, invoice_date)
+        for ttn_number, invoice_date, page_number in keys.values()
+    }
+    invoices = Invoice.objects.in_bulk(list(invoice_keys), field_name='number')
+    created_invoices = set(invoice_keys) - set(invoices)
+    if created_invoices:
+        Invoice.objects.bulk_create(
+            [
+                Invoice(number=number, date=invoice_keys[number][1], ttn=ttns[invoice_keys[number][0]])
+                for number in created_invoices
+            ],
+            ignore_conflicts=True
+        )
+        invoices = Invoice.objects.in_bulk(list(invoice_keys), field_name='number')
+
+    return {
+        'ttns': ttns, 'invoices': invoices,
+        'created_ttns': created_ttns, 'created_invoices': created_invoices, 'announced': set(),
+    }
+
+
+def drop_unused_references(references):
+    """Удаляет созданные заранее ТТН и накладные, в которые так и не загрузился ни один файл"""
+    Invoice.objects.filter(number__in=references['created_invoices'], files__isnull=True).delete()
+    TTN.objects.filter(number__in=references['created_ttns'], excel_files__isnull=True).delete()
+
+
+def report_chunk(reporter, filename, chunk):
+    """Сообщения куска в порядке строк; принятые строки - только на уровне DETAIL"""
+    messages = chunk['messages']
+    if reporter.enabled(DETAIL):
+        accepted = (
+            (row_index, DETAIL, 'row_ok', f" ✅ Строка {row_index}: {name[:50]}...", 'green')
+            for row_index, name, _, _ in chunk['rows']
+        )
+        messages = heapq.merge(messages, accepted, key=lambda message: message[0])
+    for row_index, level, event, text, color in messages:
+        reporter.emit(event, text, color, level, file=filename, row=row_index)
+
+
+def write_chunks(filename, filepath, chunks, content_hash, references, progress=None):
+    """Пишет проверенные куски страницы; возвращает (ExcelFile, товаров, строк прочитано).
+
+    Товары вставляются по мере чтения. Если в файле нашлись ошибки, он
+    дочитывается (чтобы показать все ошибки) и откатывается целиком
+    вызывающим transaction.atomic.
+    """
+    reporter = get_reporter()
+    ttn_number, _, page_number = parse_invoice_filename(filename)
+    excel_file = None
+    created_count = 0
+    row_count = 0
+    validation_errors = []
+
+    for chunk in chunks:
+        report_chunk(reporter, filename, chunk)
+        row_count += chunk['row_count']
+        if progress is not None:
+            progress.advance(0, rows=chunk['row_count'])
+        validation_errors.extend(chunk['errors'])
+        if validation_errors or not chunk['rows']:
+            continue
+
+        if excel_file is None:
+            if references is None:
+                references = resolve_references([filename])
+            ttn = references['ttns'][ttn_number]
+            invoice = references['invoices'][f"{ttn_number}_{page_number}"]
+
+            if ttn_number in references['created_ttns'] and ttn_number not in references['announced']:
+                references['announced'].add(ttn_number)
+                reporter.info('ttn_created', f"➕ Создана новая ТТН: {ttn_number}", 'green', ttn=ttn_number)
+            else:
+                reporter.info('ttn_updated', f"↻ Обновляется существующая ТТН: {ttn_number}", 'blue', ttn=ttn_number)
+
+            # Создаем ExcelFile с привязкой к ТТН
+            excel_file = ExcelFile(
+                invoice=invoice,
+                ttn=ttn,
+                processed=False,
+                page_number=page_number,
+                original_name=filename,
+                content_hash=content_hash
+            )
+            store_file(excel_file, filename, filepath)
+
+        for rows in batched(chunk['rows'], CHUNK_SIZE):
+            Product.objects.bulk_create([
+                Product(
+                    invoice=invoice,
+                    excel_file=excel_file,
+                    ttn=ttn,
+                    name=name,
+                    quantity=quantity,
+                    price=price
+                )
+                for _, name, quantity, price in rows
+            ])
+            created_count += len(rows)
+
+    if excel_file is not None:
+        excel_file.products.fill_totals()
+
+    return excel_file, created_count, row_count, validation_errors
+
+
+def save_file(filename, parsed, content_hash, references=None, stats=None, progress=None):
+    """Пишет один файл в БД: всё или ничего (transaction.atomic - savepoint во внешней транзакции).
+
+    parsed - результат parse_invoice_file из процесса-обработчика; если None,
+    файл читается здесь же и пишется кусками по CHUNK_SIZE строк, так что
+    память не растёт с размером страницы. references - результат
+    resolve_references для пачки файлов; без него ТТН и накладная находятся
+    или создаются только для этого файла. stats - {'rows', 'seconds'} для итогов,
+    progress - parser.reporting.Progress, к которому прибавляются прочитанные строки.
+    """
+    reporter = get_reporter()
+    parse_invoice_filename(filename)  # неверное имя - ошибка до чтения файла
+
+    if parsed is not None:
+        if parsed['error']:
+            raise ValueError(parsed['error'])
+        filepath = parsed['filepath']
+        attempts = [(parsed['reader'], lambda make_rows: [parsed], None)]
+    else:
+        filepath = os.path.join(INPUT_DIR, filename)
+        attempts = [
+            (reader, lambda make_rows: iter_invoice_chunks(filepath, make_rows), make_rows)
+            for reader, make_rows in invoice_readers(filepath)
+        ]
+
+    for position, (reader, make_chunks, make_rows) in enumerate(attempts):
+        started = time.perf_counter()
+        try:
+            with transaction.atomic():
+                excel_file, created_count, row_count, validation_errors = write_chunks(
+                    filename, filepath, make_chunks(make_rows), content_hash, references, progress
+                )
+                seconds = parsed['seconds'] if parsed is not None else time.perf_counter() - started
+                if stats is not None:
+                    stats['rows'] += row_count
+                    stats['seconds'] += seconds
+
+                rate = row_count / seconds if seconds else 0
+                reporter.info(
+                    'file_read',
+                    f"📄 Прочитано строк: {row_count} за {seconds * 1000:.0f} мс "
+                    f"({rate:.0f} строк/с, {reader})",
+                    'cyan',
+                    file=filename, rows=row_count, seconds=round(seconds, 3), reader=reader
+                )
+
+                if validation_errors:
+                    raise ValueError(
+                        f"Найдены ошибки в {len(validation_errors)} строках:\n" +
+                        "\n".join(validation_errors[:5]) +
+                        ("\n..." if len(validation_errors) > 5 else "")
+                    )
+
+                if not created_count:
+                    raise ValueError("В файле не найдено данных для импорта.")
+
+                excel_file.processed = True
+                excel_file.save()
+
+                reporter.info(
+                    'file_loaded', f"✔ Файл успешно обработан. Добавлено товаров: {created_count}", 'green',
+                    file=filename, products=created_count
+                )
+                return excel_file, created_count
+        except (UnsupportedWorkbook, ParseError) as e:
+            # Потоковый читатель не справился посреди файла: записанное откатилось, читаем заново
+            if position == len(attempts) - 1:
+                raise InvoiceReadError(f"Ошибка чтения файла: {e}") from e
+            reporter.info(
+                'reader_fallback', f"↺ Читатель {reader} не справился ({e}), файл читается заново", 'yellow',
+                file=filename, reader=reader, error=str(e)
+            )
+
+
+def ingest_file(record, parsed, archive=False, references=None, stats=None, progress=None):
+    """Загружает прочитанный файл и ведёт его запись в журнале.
+
+    Возвращает (ExcelFile, число товаров) или None, если файл не загружен.
+    Если процесс упадёт во время записи, файл останется в processing,
+    и повторный запуск загрузит его заново: транзакция файла откатится целиком.
+    """
+    existing = find_duplicates({record.filename: record.content_hash}).get(record.filename)
+    if existing:
+        skip_duplicate(record, existing, archive)
+        return None
+
+    mark(record, 'processing', attempts=record.attempts + 1)
+    try:
+        excel_file, created_count = save_file(
+            record.filename, parsed, record.content_hash, references, stats, progress
+        )
+    except Exception as e:
+        mark(record, 'failed', error=str(e))
+        get_reporter().error('file_failed', f"\n🔥 ОШИБКА: {e}", file=record.filename, error=str(e))
+        return None
+
+    mark(record, 'done', excel_file=excel_file, error='')
+    if archive:
+        archive_file(record)
+    return excel_file, created_count
+
+
+def refresh_ttn_totals(ttn_numbers):
+    """Пересчитывает счётчики ТТН по данным в БД: один запрос с подзапросами и bulk_update"""
+    def count_of(queryset):
+        counts = queryset.filter(ttn=OuterRef('pk')).order_by().values('ttn').annotate(count=Count('*'))
+        return Coalesce(Subquery(counts.values('count')), 0)
+
+    ttns = list(
+        TTN.objects.filter(number__in=ttn_numbers).annotate(
+            products_count=count_of(Product.objects.all()),
+            files_count=count_of(ExcelFile.objects.filter(processed=True)),
+        )
+    )
+    now = timezone.now()
+    for ttn in ttns:
+        ttn.total_products = ttn.products_count
+        ttn.processed_files = ttn.files_count
+        ttn.status = 'completed'
+        ttn.updated_at = now  # bulk_update не трогает auto_now
+    TTN.objects.bulk_update(ttns, ['total_products', 'processed_files', 'status', 'updated_at'])
+
+    reporter = get_reporter()
+    for ttn in ttns:
+        reporter.info(
+            'ttn_completed',
+            f"✅ ТТН {ttn.number} завершена. Товаров: {ttn.total_products}, файлов: {ttn.processed_files}",
+            'green',
+            ttn=ttn.number, products=ttn.total_products, files=ttn.processed_files
+        )
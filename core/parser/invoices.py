@@ -0,0 +1,340 @@
+# parser/invoices.py
+import math
+import re
+import time
+from datetime import datetime
+from importlib import metadata
+from itertools import islice
+from xml.etree.ElementTree import ParseError
+
+import numpy as np
+from openpyxl import load_workbook
+
+from parser import sheet_cache, xlsx_stream
+from parser.reporting import DETAIL, NORMAL
+from parser.xlsx_stream import UnsupportedWorkbook, XlsxStreamReader
+
+FILENAME_PATTERN = re.compile(
+    r'^(?P<number>\d+?)_(?P<date>\d{2}-\d{2}-\d{4})_(?P<page>\d+)\.xlsx$'
+)
+# Ячейки, которые уже числа; bool сюда не входит: str(True) - не число
+NUMBER_TYPES = (int, float)
+PRICE_REL_TOL = 1e-4
+# Сколько строк страницы проверяется и пишется в БД за раз
+CHUNK_SIZE = 1000
+
+
+class InvoiceReadError(ValueError):
+    """Файл накладной не удалось прочитать"""
+
+
+def parse_invoice_filename(filename):
+    """Номер ТТН, дата и номер страницы из имени файла накладной"""
+    match = FILENAME_PATTERN.match(filename)
+    if not match:
+        raise ValueError("Имя файла не соответствует шаблону!")
+
+    date_str = match.group('date')
+    try:
+        date = datetime.strptime(date_str, "%d-%m-%Y").date()
+    except ValueError:
+        raise ValueError(f"Неверный формат даты: {date_str}")
+
+    return match.group('number'), date, match.group('page')
+
+
+def validate_header_row(row):
+    expected_headers = ['1', '2', '3', '4']
+    return all(str(cell).strip() == expected_headers[i] for i, cell in enumerate(row[:4]) if cell)
+
+
+def strict_float_conversion(value, row_index, field_name):
+    if value is None:
+        raise ValueError(f"Пустое значение в поле {field_name} (строка {row_index})")
+
+    original_value = str(value).strip()
+    if not original_value:
+        raise ValueError(f"Пустое значение в поле {field_name} (строка {row_index})")
+
+    try:
+        cleaned_value = original_value.replace(',', '.').replace(' ', '')
+        return float(cleaned_value)
+    except ValueError:
+        raise ValueError(
+            f"Невозможно преобразовать '{original_value}' в число "
+            f"(строка {row_index}, поле {field_name})"
+        )
+
+
+def validate_price_quantity_total(row, row_index):
+    try:
+        quantity = strict_float_conversion(row[2], row_index, "Количество")
+        price = strict_float_conversion(row[3], row_index, "Цена")
+        total = strict_float_conversion(row[4], row_index, "Стоимость")
+
+        calculated_price = total / quantity if quantity != 0 else 0
+        if not math.isclose(price, calculated_price, rel_tol=PRICE_REL_TOL):
+            raise ValueError(
+                f"Несоответствие цены и стоимости (строка {row_index}): "
+                f"цена={price}, но {total}/{quantity}≈{calculated_price:.2f}"
+            )
+    except (ValueError, ZeroDivisionError) as e:
+        raise ValueError(f"Ошибка проверки цены/стоимости: {e}")
+
+
+def openpyxl_rows(filepath):
+    """(номер строки, значения) через openpyxl - запасной путь для любых книг"""
+    wb = load_workbook(filepath, data_only=True)
+    try:
+        yield from enumerate(wb.active.iter_rows(min_row=1, values_only=True), start=1)
+    finally:
+        wb.close()
+
+
+def validate_row(row_index, row):
+    """Построчная проверка: (наименование, количество, цена) или исключение"""
+    name = str(row[0]).strip() if row[0] else None
+    if not name:
+        raise ValueError(f"Пустое наименование товара (строка {row_index})")
+
+    quantity = strict_float_conversion(row[2], row_index, "Количество")
+    price = strict_float_conversion(row[3], row_index, "Цена")
+
+    if len(row) > 4 and row[4]:
+        validate_price_quantity_total(row, row_index)
+    return name, quantity, price
+
+
+def float_column(cells, row_indexes, field_name):
+    """Колонка в float64 разом и ошибки strict_float_conversion по позициям.
+
+    Числовые ячейки берутся как есть, текстовые нормализуются (запятая, пробелы)
+    через np.char и приводятся одним astype. Поячеечно разбираются только
+    колонки с ошибками - чтобы получить те же сообщения, что и построчно.
+    """
+    numeric = np.fromiter((type(cell) in NUMBER_TYPES for cell in cells), dtype=bool, count=len(cells))
+    if numeric.all():
+        return np.array(cells, dtype=np.float64), {}
+
+    values = np.zeros(len(cells))
+    values[numeric] = [cell for cell, is_number in zip(cells, numeric) if is_number]
+    text_positions = np.flatnonzero(~numeric)
+    text = np.array(['' if cells[i] is None else str(cells[i]) for i in text_positions], dtype=str)
+    cleaned = np.char.replace(np.char.replace(np.char.strip(text), ',', '.'), ' ', '')
+    try:
+        values[text_positions] = cleaned.astype(np.float64)
+        return values, {}
+    except ValueError:
+        pass
+
+    errors = {}
+    for i in text_positions:
+        try:
+            values[i] = strict_float_conversion(cells[i], row_indexes[i], field_name)
+        except ValueError as e:
+            errors[i] = str(e)
+    return values, errors
+
+
+def validate_columns(data_rows):
+    """Проверяет строки с данными по колонкам: {позиция: (наименование, количество, цена) или ошибка}"""
+    row_indexes = [row_index for row_index, _ in data_rows]
+    names = [str(row[0]).strip() if row[0] else None for _, row in data_rows]
+    quantities, quantity_errors = float_column([row[2] for _, row in data_rows], row_indexes, "Количество")
+    prices, price_errors = float_column([row[3] for _, row in data_rows], row_indexes, "Цена")
+
+    # Стоимость проверяется только там, где она заполнена
+    has_total = np.fromiter(
+        (len(row) > 4 and bool(row[4]) for _, row in data_rows), dtype=bool, count=len(data_rows)
+    )
+    total_positions = np.flatnonzero(has_total)
+    totals = np.full(len(data_rows), np.nan)
+    totals[total_positions], total_column_errors = float_column(
+        [data_rows[i][1][4] for i in total_positions], [row_indexes[i] for i in total_positions], "Стоимость"
+    )
+    total_errors = {total_positions[i]: e for i, e in total_column_errors.items()}
+
+    # math.isclose(price, total / quantity, rel_tol) для всей колонки
+    with np.errstate(divide='ignore', invalid='ignore'):
+        calculated = np.where(quantities != 0, totals / quantities, 0)
+        close = (prices == calculated) | (
+            np.isfinite(prices) & np.isfinite(calculated)
+            & (np.abs(prices - calculated) <= PRICE_REL_TOL * np.maximum(np.abs(prices), np.abs(calculated)))
+        )
+    mismatch = has_total & ~close
+
+    quantities, prices, totals, calculated = (
+        quantities.tolist(), prices.tolist(), totals.tolist(), calculated.tolist()
+    )
+    results = {}
+    for i, row_index in enumerate(row_indexes):
+        if not names[i]:
+            results[i] = ValueError(f"Пустое наименование товара (строка {row_index})")
+        elif i in quantity_errors:
+            results[i] = ValueError(quantity_errors[i])
+        elif i in price_errors:
+            results[i] = ValueError(price_errors[i])
+        elif i in total_errors:
+            results[i] = ValueError(f"Ошибка проверки цены/стоимости: {total_errors[i]}")
+        elif mismatch[i]:
+            results[i] = ValueError(
+                f"Ошибка проверки цены/стоимости: Несоответствие цены и стоимости (строка {row_index}): "
+                f"цена={prices[i]}, но {totals[i]}/{quantities[i]}≈{calculated[i]:.2f}"
+            )
+        else:
+            results[i] = (names[i], quantities[i], prices[i])
+    return results
+
+
+def validate_invoice_rows(rows, result):
+    """Проверяет строки страницы накладной и складывает итог в result.
+
+    Числа проверяются по колонкам (validate_columns); сообщения и ошибки
+    те же и в том же порядке, что и при построчной проверке validate_row.
+    Сообщения - (номер строки, уровень, событие, текст, цвет); о принятых
+    строках сообщений нет, их выводит тот, кто пишет в БД (см. parser.ingest.report_chunk).
+    """
+    entries = []  # (номер строки, строка, позиция в data_rows; None - заголовок, -1 - построчно)
+    data_rows = []
+    for row_index, row in rows:
+        result['row_count'] += 1
+        if not any(row[:4]):
+            continue
+        # Строка номеров колонок начинается с '1' или с пустой ячейки; наименования - нет
+        first = row[0]
+        if (not first or str(first).strip() == '1') and validate_header_row(row):
+            entries.append((row_index, row, None))
+        elif len(row) < 4:
+            entries.append((row_index, row, -1))
+        else:
+            entries.append((row_index, row, len(data_rows)))
+            data_rows.append((row_index, row))
+
+    checked = validate_columns(data_rows) if data_rows else {}
+
+    messages, errors, valid_rows = result['messages'], result['errors'], result['rows']
+    for row_index, row, position in entries:
+        if position is None:
+            messages.append((
+                row_index, DETAIL, 'header_skipped',
+                f" ⚠️ Пропущена строка с номерами колонок (строка {row_index})", 'yellow'
+            ))
+            continue
+
+        if position < 0:
+            try:
+                outcome = validate_row(row_index, row)
+            except Exception as e:
+                outcome = e
+        else:
+            outcome = checked[position]
+
+        if isinstance(outcome, Exception):
+            messages.append((
+                row_index, NORMAL, 'row_error', f"❌ ОШИБКА ВАЛИДАЦИИ (строка {row_index}): {outcome}", 'red'
+            ))
+            messages.append((row_index, NORMAL, 'row_content', f"    Содержимое строки: {row[:5]}", 'yellow'))
+            errors.append(f"Строка {row_index}: {outcome}")
+        else:
+            name, quantity, price = outcome
+            valid_rows.append((row_index, name, quantity, price))
+
+
+# Читатели по порядку: потоковый, при UnsupportedWorkbook - openpyxl
+READERS = (
+    ('stream', XlsxStreamReader),
+    ('openpyxl', openpyxl_rows),
+)
+# Ключи читателей в кэше листов (parser.sheet_cache): меняются вместе с читателем или библиотекой
+READER_KEYS = {
+    'stream': f"invoice-stream-{xlsx_stream.VERSION}",
+    'openpyxl': f"invoice-openpyxl-{metadata.version('openpyxl')}",
+}
+
+
+def invoice_readers(filepath):
+    """Читатели страницы по порядку, как READERS: (имя, make_rows).
+
+    Страница, уже прочитанная одним из них, берётся из кэша листов - тогда
+    читатель один, и повторно файл не разбирается. Иначе прочитанная до конца
+    страница сохраняется в кэш.
+    """
+    keys = [READER_KEYS[reader] for reader, _ in READERS]
+    try:
+        key, rows, content_hash = sheet_cache.lookup(filepath, keys)
+    except OSError:
+        return READERS  # ошибку чтения файла покажет сам читатель
+    if rows is not None:
+        reader = READERS[keys.index(key)][0]
+        return ((f"{reader}, кэш", lambda filepath: rows),)
+
+    def cached(make_rows, key):
+        return lambda filepath: sheet_cache.recording(make_rows(filepath), content_hash, key)
+
+    return tuple((reader, cached(make_rows, key)) for (reader, make_rows), key in zip(READERS, keys))
+
+
+def iter_invoice_chunks(filepath, make_rows, chunk_size=CHUNK_SIZE):
+    """Проверенные куски страницы по chunk_size строк.
+
+    Каждый кусок - словарь rows/errors/messages/row_count, как у parse_invoice_file.
+    UnsupportedWorkbook и ParseError пробрасываются как есть (нужен другой
+    читатель), остальные ошибки чтения - InvoiceReadError.
+    """
+    try:
+        rows = iter(make_rows(filepath))
+    except (UnsupportedWorkbook, ParseError):
+        raise
+    except Exception as e:
+        raise InvoiceReadError(f"Ошибка чтения файла: {e}") from e
+
+    while True:
+        try:
+            batch = list(islice(rows, chunk_size))
+        except (UnsupportedWorkbook, ParseError):
+            raise
+        except Exception as e:
+            raise InvoiceReadError(f"Ошибка чтения файла: {e}") from e
+        if not batch:
+            return
+        chunk = {'rows': [], 'errors': [], 'messages': [], 'row_count': 0}
+        validate_invoice_rows(batch, chunk)
+        yield chunk
+
+
+def parse_invoice_file(filepath):
+    """Читает и проверяет страницу накладной целиком, не обращаясь к БД.
+
+    Вызывается в процессах-обработчиках load_excels и watch_input; в одном
+    процессе страница читается и пишется кусками (см. parser.ingest.save_file).
+    Возвращает словарь:
+      rows      - проверенные строки (номер строки, наименование, количество, цена)
+      errors    - ошибки валидации по строкам
+      messages  - сообщения в порядке строк: (номер строки, уровень, событие, текст, цвет)
+      error     - ошибка чтения файла целиком (или None)
+      reader    - чем прочитан файл ('stream' или 'openpyxl'; из кэша листов - с пометкой 'кэш')
+      row_count - сколько строк листа прочитано, seconds - за какое время
+    """
+    started = time.perf_counter()
+    readers = invoice_readers(filepath)
+    for position, (reader, make_rows) in enumerate(readers):
+        result = {
+            'filepath': filepath, 'rows': [], 'errors': [], 'messages': [], 'error': None,
+            'reader': reader, 'row_count': 0, 'seconds': 0,
+        }
+        try:
+            for chunk in iter_invoice_chunks(filepath, make_rows):
+                for key in ('rows', 'errors', 'messages'):
+                    result[key].extend(chunk[key])
+                result['row_count'] += chunk['row_count']
+            break
+        except (UnsupportedWorkbook, ParseError) as e:
+            if position == len(readers) - 1:
+                result['error'] = f"Ошибка чтения файла: {e}"
+            continue
+        except InvoiceReadError as e:
+            result['error'] = str(e)
+            break
+
+    result['seconds'] = time.perf_counter() - started
+    return result
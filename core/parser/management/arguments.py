@@ -0,0 +1,12 @@
+# parser/management/arguments.py
+"""Общие типы аргументов management-команд"""
+import argparse
+from datetime import datetime
+
+
+def date_argument(value):
+    """Дата аргумента в формате ДД-ММ-ГГГГ, как в именах файлов"""
+    try:
+        return datetime.strptime(value, "%d-%m-%Y").date()
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Неверный формат даты: {value} (нужно ДД-ММ-ГГГГ)")
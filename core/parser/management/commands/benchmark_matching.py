@@ -0,0 +1,297 @@
+# parser/management/commands/benchmark_matching.py
+import io
+import json
+import logging
+import os
+import platform
+import random
+import subprocess
+import time
+from collections import Counter
+from contextlib import contextmanager, redirect_stdout
+from datetime import date, datetime
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from termcolor import cprint
+
+from parser.management.commands import process_ttn
+from parser.matching import PriceIndex, clear_index_cache, normalize_article, parse_product_name, word_similarity
+from parser.models import TTN, Invoice, ExcelFile, Product, Price, PriceList, FinalSample
+
+BRAND_PREFIXES = ['F-', 'FK-', 'EF-', 'JCB-', 'RF-', 'F-', 'FK-']
+ARTICLE_SUFFIXES = ['', '', '', 'TH', 'P4', 'MPB', '+2', 'HB', 'D']
+NAME_WORDS = [
+    'Головка', 'торцевая', 'глубокая', 'ударная', 'Набор', 'головок', 'инструментов',
+    'Ключ', 'комбинированный', 'трещоточный', 'Бита', 'SPLINE', 'Домкрат', 'подкатной',
+    'гидравлический', 'Съемник', 'Удлинитель', 'карданный', 'Отвертка', 'шлицевая',
+    'Клещи', 'переставные', 'Набор', 'бит', 'для', 'мерседес', 'в', 'кейсе', 'двенадцатигранная',
+]
+NAME_SIZES = ['1/2"', '3/4"', '1/4"', '3/8"']
+NAME_TAIL = '; Страна ввоза: Китай; Сертификат:ЕАЭС RU С-СН.ПФ'
+# Подмена латиницы кириллицей, как в реальных накладных ('50814Р4' против 'F-50814P4')
+CYRILLIC_LOOKALIKES = str.maketrans({'P': 'Р', 'H': 'Н', 'B': 'В', 'T': 'Т'})
+# Методы PriceIndex, в которых проходит оценка кандидатов при match_product
+SCORING_METHODS = ['find_article_matches', 'find_text_match', 'find_fuzzy_article_match']
+# Дата синтетической версии прайса и TTN: позже любой реальной, чтобы TTN сопоставлялись именно с ней
+BENCH_DATE = date(2100, 1, 1)
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+@contextmanager
+def count_queries(stats):
+    """Считает SQL-запросы внутри блока в stats['queries']"""
+    def wrapper(execute, sql, params, many, context):
+        stats['queries'] += 1
+        return execute(sql, params, many, context)
+
+    with connection.execute_wrapper(wrapper):
+        yield
+
+
+class Command(BaseCommand):
+    help = (
+        "Бенчмарк сопоставления TTN с прайсом на синтетических данных. "
+        "Данные создаются в транзакции и откатываются; для чистых замеров "
+        "запускайте на отдельной БД без реального прайса."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--catalog-sizes',
+            type=int,
+            nargs='+',
+            default=[10_000],
+            help='Размеры синтетического прайса (по умолчанию: 10000)'
+        )
+        parser.add_argument(
+            '--ttn-sizes',
+            type=int,
+            nargs='+',
+            default=[1_000],
+            help='Число товаров в синтетической TTN (по умолчанию: 1000)'
+        )
+        parser.add_argument('--seed', type=int, default=42, help='Зерно генератора (по умолчанию: 42)')
+        parser.add_argument('--label', type=str, default='', help='Метка прогона в отчёте')
+        parser.add_argument(
+            '--output',
+            type=str,
+            default='parser/output/benchmarks',
+            help='Папка для JSON-отчёта (по умолчанию: parser/output/benchmarks)'
+        )
+
+    # --- генерация данных ---
+
+    def make_article(self):
+        digits = str(self.random.randint(10_000, 99_999_999))
+        return f"{digits}{self.random.choice(ARTICLE_SUFFIXES)}"
+
+    def make_name(self):
+        words = self.random.sample(NAME_WORDS, self.random.randint(3, 6))
+        return f"{' '.join(words)} {self.random.choice(NAME_SIZES)}, {self.random.randint(6, 46)}мм"
+
+    def grow_catalog(self, size):
+        """Дополняет синтетический прайс до size позиций"""
+        batch = []
+        while len(self.catalog) < size:
+            code = str(self.next_code)
+            self.next_code += 1
+            article = self.make_article()
+            price = Price(
+                price_list=self.price_list,
+                code=code,
+                type='Инструмент',
+                article=f"{self.random.choice(BRAND_PREFIXES)}{article}",
+                name=self.make_name(),
+                price1=self.random.randint(100, 50_000),
+                price2=0,
+                stock='10',
+                quantity=self.random.randint(0, 100),
+                price_clear=self.random.randint(100, 50_000),
+            )
+            price.fill_match_keys()
+            batch.append(price)
+            self.catalog.append((code, article, price.name))
+            if len(batch) >= 5000:
+                Price.objects.bulk_create(batch)
+                batch = []
+        if batch:
+            Price.objects.bulk_create(batch)
+
+    def make_product_name(self):
+        """Название строки накладной: в основном по прайсу, часть с ошибками и без совпадений"""
+        code, article, name = self.random.choice(self.catalog)
+        roll = self.random.random()
+        if roll < 0.70:
+            pass
+        elif roll < 0.80:
+            article = article.translate(CYRILLIC_LOOKALIKES)
+        elif roll < 0.88:
+            code = str(int(code) + 7_000_000)  # код с ошибкой, артикул верный
+        elif roll < 0.93:
+            article = self.make_article()  # совпадение только по словам названия
+        elif roll < 0.98:
+            code, article, name = str(self.random.randint(90_000_000, 99_999_999)), self.make_article(), self.make_name()
+        else:
+            return f"{self.make_name()}{NAME_TAIL}"  # без кода: не разбирается
+        return f"{code} {article} {name}{NAME_TAIL}"
+
+    def create_ttn(self, size):
+        number = f"BENCH{len(self.catalog)}x{size}"
+        ttn = TTN.objects.create(number=number, date=BENCH_DATE, status='completed')
+        invoice = Invoice.objects.create(number=f"{number}_1", date=BENCH_DATE, ttn=ttn)
+        excel_file = ExcelFile.objects.create(file=f"uploads/{number}_1.xlsx", invoice=invoice, ttn=ttn, processed=True)
+        products = []
+        for _ in range(size):
+            quantity = self.random.randint(1, 20)
+            price = self.random.randint(100, 50_000)
+            products.append(Product(
+                invoice=invoice, excel_file=excel_file, ttn=ttn,
+                name=self.make_product_name(),
+                quantity=quantity, price=price
+            ))
+        Product.objects.bulk_create(products, batch_size=5000)
+        excel_file.products.fill_totals()
+        return number, [product.name for product in products]
+
+    # --- замеры ---
+
+    def phase(self, name, func):
+        stats = {'queries': 0}
+        with count_queries(stats):
+            started = time.perf_counter()
+            value = func()
+            stats['seconds'] = round(time.perf_counter() - started, 4)
+        self.phases[name] = stats
+        return value
+
+    def timed(self, name, func, queries=True):
+        """Обёртка func, суммирующая время (и SQL-запросы) всех её вызовов в фазу name"""
+        stats = self.phases.setdefault(name, {'queries': 0, 'seconds': 0})
+
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                if not queries:
+                    return func(*args, **kwargs)
+                with count_queries(stats):
+                    return func(*args, **kwargs)
+            finally:
+                stats['seconds'] += time.perf_counter() - started
+
+        return wrapper
+
+    def run_case(self, catalog_size, ttn_size):
+        ttn_number, names = self.create_ttn(ttn_size)
+        self.phases = {}
+
+        # Каждый случай замеряется как отдельный запуск: индекс строится заново
+        clear_index_cache()
+        word_similarity.cache_clear()
+        index = self.phase(
+            'index_build', lambda: PriceIndex.load(Price.objects.filter(price_list=self.price_list))
+        )
+        parsed = self.phase('name_parsing', lambda: [parse_product_name(name) for name in names])
+        parsed = [item for item in parsed if item]
+
+        def lookup():
+            return [
+                (
+                    item,
+                    index.entries(item['code']),
+                    index.trigrams.candidates(normalize_article(item['article'])),
+                )
+                for item in parsed
+            ]
+
+        candidates = self.phase('candidate_lookup', lookup)
+
+        # Оценка замеряется внутри настоящего match_product: методы поиска подменяются
+        # на экземпляре индекса обёртками, суммирующими их время
+        for method in SCORING_METHODS:
+            setattr(index, method, self.timed('scoring', getattr(index, method), queries=False))
+        results = self.phase('match_total', lambda: [index.match_product(name) for name in names])
+
+        # Запись результатов (удаление старых строк, FinalSample, память) - отдельной фазой
+        command = process_ttn.Command()
+        command.save_results = self.timed('writes', command.save_results)
+        clear_index_cache()
+        word_similarity.cache_clear()
+        with redirect_stdout(io.StringIO()):
+            self.phase(
+                'command_first_run', lambda: call_command(command, '--ttn', ttn_number, '--no-memory', '--force')
+            )
+            self.phase('command_rerun', lambda: call_command('process_ttn', '--ttn', ttn_number))
+        for name in ('scoring', 'writes'):
+            self.phases[name]['seconds'] = round(self.phases[name]['seconds'], 4)
+
+        samples = FinalSample.objects.filter(ttn_number=ttn_number).count()
+        if samples != ttn_size:
+            raise CommandError(f"Ожидалось {ttn_size} строк FinalSample, записано {samples}")
+
+        total = self.phases['command_first_run']['seconds']
+        return {
+            'catalog_size': catalog_size,
+            'ttn_size': ttn_size,
+            'phases': self.phases,
+            'products_per_second': round(ttn_size / total, 1) if total else None,
+            'match_status': dict(Counter(result['status'] for result in results)),
+        }
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options['seed'])
+        self.catalog = []
+        self.next_code = 1_000_000
+        report = {
+            'label': options['label'],
+            'revision': git_revision(),
+            'created_at': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'database': connection.vendor,
+            'seed': options['seed'],
+            'results': [],
+        }
+
+        # Логи process_ttn на синтетике не нужны
+        logging.disable(logging.INFO)
+        try:
+            with transaction.atomic():
+                self.price_list = PriceList.objects.create(name='Бенчмарк', valid_from=BENCH_DATE)
+                for catalog_size in sorted(options['catalog_sizes']):
+                    cprint(f"\nПрайс: {catalog_size} позиций", 'cyan', attrs=['bold'])
+                    started = time.perf_counter()
+                    self.grow_catalog(catalog_size)
+                    cprint(f"Сгенерирован за {time.perf_counter() - started:.1f} с", 'cyan')
+
+                    for ttn_size in sorted(options['ttn_sizes']):
+                        result = self.run_case(catalog_size, ttn_size)
+                        report['results'].append(result)
+                        phases = ', '.join(
+                            f"{name}={stats['seconds']}с/{stats['queries']}q"
+                            for name, stats in result['phases'].items()
+                        )
+                        cprint(f"  TTN {ttn_size}: {phases}", 'green')
+
+                # Синтетические данные в БД не оставляем
+                transaction.set_rollback(True)
+        finally:
+            logging.disable(logging.NOTSET)
+
+        os.makedirs(options['output'], exist_ok=True)
+        suffix = f"_{options['label']}" if options['label'] else ''
+        filepath = os.path.join(
+            options['output'], f"matching_{datetime.now():%Y%m%d_%H%M%S}{suffix}.json"
+        )
+        with open(filepath, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+        self.stdout.write(self.style.SUCCESS(f"Результаты сохранены в {filepath}"))
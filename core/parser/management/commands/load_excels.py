@@ -1,211 +1,158 @@
 import os
-import re
-import math
-from datetime import datetime
-from django.core.management.base import BaseCommand
-from openpyxl import load_workbook
-from django.core.files import File
-from django.db import transaction
-from termcolor import cprint
-
-from parser.models import ExcelFile, Product, Invoice, TTN
-
-INPUT_DIR = 'parser/input'
-FILENAME_PATTERN = re.compile(
-    r'^(?P<number>\d+?)_(?P<date>\d{2}-\d{2}-\d{4})_(?P<page>\d+)\.xlsx$'
+import time
+from collections import deque
+from django.core.management.base import BaseCommand, CommandError
+
+from parser.files import file_sha256
+from parser.ingest import (
+    ARCHIVE_DIR, INPUT_DIR, drop_unused_references, find_duplicates, fork_executor, ingest_file, mark,
+    parse_result, refresh_ttn_totals, resolve_references, skip_duplicate, submit_parse, sync_ledger, upload_key
 )
+from parser.invoices import FILENAME_PATTERN
+from parser.reporting import add_reporting_arguments, reporting
+from parser.sheet_cache import add_cache_arguments, configure as configure_cache
 
 
-def validate_header_row(row):
-    expected_headers = ['1', '2', '3', '4']
-    return all(str(cell).strip() == expected_headers[i] for i, cell in enumerate(row[:4]) if cell)
-
-
-def strict_float_conversion(value, row_index, field_name):
-    if value is None:
-        raise ValueError(f"Пустое значение в поле {field_name} (строка {row_index})")
-
-    original_value = str(value).strip()
-    if not original_value:
-        raise ValueError(f"Пустое значение в поле {field_name} (строка {row_index})")
+class Command(BaseCommand):
+    help = "Загружает и парсит Excel-файлы с группировкой по ТТН"
 
-    try:
-        cleaned_value = original_value.replace(',', '.').replace(' ', '')
-        return float(cleaned_value)
-    except ValueError:
-        raise ValueError(
-            f"Невозможно преобразовать '{original_value}' в число "
-            f"(строка {row_index}, поле {field_name})"
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help='Число процессов для чтения и проверки файлов (по умолчанию: 1)'
         )
+        parser.add_argument(
+            '--resume',
+            action='store_true',
+            help='Продолжить прерванную загрузку: пропустить файлы, уже загруженные по журналу'
+        )
+        parser.add_argument(
+            '--archive',
+            action='store_true',
+            help=f'Переносить загруженные файлы из папки input в {ARCHIVE_DIR}/<дата>/'
+        )
+        add_cache_arguments(parser)
+        add_reporting_arguments(parser)
+
+    def iter_parsed(self, filepaths, workers):
+        """Результаты parse_invoice_file в порядке файлов.
+
+        В одном процессе отдаёт None: файл будет прочитан и записан кусками
+        прямо в save_file. В пуле одновременно читается не больше 2*workers
+        файлов, чтобы прочитанные, но ещё не записанные страницы не копились в памяти.
+        Сбой обработчика - ошибка чтения только этого файла (parse_result).
+        """
+        if workers <= 1 or len(filepaths) <= 1:
+            for _ in filepaths:
+                yield None
+            return
 
+        with fork_executor(min(workers, len(filepaths))) as executor:
+            pending = deque()
+            for filepath in filepaths:
+                pending.append((submit_parse(executor, filepath), filepath))
+                if len(pending) >= workers * 2:
+                    yield parse_result(*pending.popleft())
+            while pending:
+                yield parse_result(*pending.popleft())
 
-def validate_price_quantity_total(row, row_index):
-    try:
-        quantity = strict_float_conversion(row[2], row_index, "Количество")
-        price = strict_float_conversion(row[3], row_index, "Цена")
-        total = strict_float_conversion(row[4], row_index, "Стоимость")
-
-        calculated_price = total / quantity if quantity != 0 else 0
-        if not math.isclose(price, calculated_price, rel_tol=1e-4):
-            raise ValueError(
-                f"Несоответствие цены и стоимости (строка {row_index}): "
-                f"цена={price}, но {total}/{quantity}≈{calculated_price:.2f}"
-            )
-    except (ValueError, ZeroDivisionError) as e:
-        raise ValueError(f"Ошибка проверки цены/стоимости: {e}")
+    def handle(self, *args, **options):
+        configure_cache(options)
+        with reporting(options) as reporter:
+            self.load(reporter, options)
 
+    def load(self, reporter, options):
+        workers = options['workers']
+        if workers < 1:
+            raise CommandError("--workers должно быть не меньше 1")
 
-class Command(BaseCommand):
-    help = "Загружает и парсит Excel-файлы с группировкой по ТТН"
-
-    def handle(self, *args, **options):
         if not os.path.exists(INPUT_DIR):
             os.makedirs(INPUT_DIR, exist_ok=True)
-            cprint(f"Создана папка {INPUT_DIR}", 'yellow')
+            reporter.info('folder_created', f"Создана папка {INPUT_DIR}", 'yellow', path=INPUT_DIR)
 
         files = [f for f in os.listdir(INPUT_DIR) if f.endswith('.xlsx')]
         if not files:
-            cprint("Нет .xlsx файлов в папке input", 'yellow')
+            reporter.info('no_files', "Нет .xlsx файлов в папке input", 'yellow')
             return
 
-        ttn_data = {}
-
-        for filename in files:
-            filepath = os.path.join(INPUT_DIR, filename)
-            cprint(f"\nОбработка файла: {filename}", 'cyan', attrs=['bold'])
-
-            try:
-                with transaction.atomic():
-                    match = FILENAME_PATTERN.match(filename)
-                    if not match:
-                        raise ValueError("Имя файла не соответствует шаблону!")
-
-                    ttn_number = match.group('number')
-                    date_str = match.group('date')
-                    page_number = match.group('page')
-
-                    try:
-                        date = datetime.strptime(date_str, "%d-%m-%Y").date()
-                    except ValueError:
-                        raise ValueError(f"Неверный формат даты: {date_str}")
-
-                    # Создаем или получаем ТТН
-                    ttn, created = TTN.objects.get_or_create(
-                        number=ttn_number,
-                        defaults={
-                            'date': date,
-                            'status': 'in_progress'
-                        }
-                    )
-
-                    if created:
-                        cprint(f"➕ Создана новая ТТН: {ttn_number}", 'green')
+        read_stats = {'rows': 0, 'seconds': 0}
+        started = time.perf_counter()
+
+        hashes = {f: file_sha256(os.path.join(INPUT_DIR, f)) for f in files}
+        ledger = sync_ledger(hashes)
+        if options['resume']:
+            done = [f for f in files if ledger[f].state == 'done']
+            files = [f for f in files if ledger[f].state != 'done']
+            interrupted = sum(1 for f in files if ledger[f].state == 'processing')
+            reporter.info(
+                'resume',
+                f"Продолжение загрузки: пропущено загруженных файлов {len(done)}, "
+                f"осталось {len(files)} (прерванных {interrupted})",
+                'cyan',
+                done=len(done), remaining=len(files), interrupted=interrupted
+            )
+
+        # Файлы с неподходящим именем не читаем: save_file всё равно их отклонит.
+        # Файлы, уже загруженные в ту же ТТН и страницу (или повторяющиеся в этой папке), тоже не читаем
+        valid = [f for f in files if FILENAME_PATTERN.match(f)]
+        keys = {f: upload_key(f, hashes[f]) for f in valid}
+        duplicates = find_duplicates({f: hashes[f] for f in valid})
+        first_by_key = {}
+        for filename in valid:
+            if filename not in duplicates:
+                first_by_key.setdefault(keys[filename], filename)
+        to_parse = [f for f in valid if first_by_key.get(keys[f]) == f]
+        parsed_files = self.iter_parsed([os.path.join(INPUT_DIR, f) for f in to_parse], workers)
+
+        # ТТН и накладные для всех файлов - одним запросом, недостающие - пачкой;
+        # те, что останутся без файлов (ошибки в файлах, прерванный запуск), удаляются в конце
+        references = resolve_references(to_parse)
+
+        # Чтение и проверка идут параллельно, запись в БД - только здесь, по одному файлу
+        ttn_numbers = set()
+        loaded = {}  # ключ загрузки -> ExcelFile, загруженный в этом запуске
+        progress = reporter.progress("Загрузка накладных", total=len(files), unit='файлов')
+        try:
+            for filename in files:
+                reporter.info(
+                    'file_started', f"\nОбработка файла: {filename}", 'cyan', attrs=['bold'], file=filename
+                )
+                record = ledger[filename]
+                key = keys.get(filename)
+                if filename in duplicates:
+                    skip_duplicate(record, duplicates[filename], options['archive'])
+                elif filename in valid and first_by_key[key] != filename:
+                    # Копия файла выше в этой папке: он уже обработан в этом цикле
+                    first = first_by_key[key]
+                    if key in loaded:
+                        skip_duplicate(record, loaded[key], options['archive'])
                     else:
-                        cprint(f"↻ Обновляется существующая ТТН: {ttn_number}", 'blue')
-
-                    # Создаем Invoice с привязкой к ТТН
-                    invoice, _ = Invoice.objects.get_or_create(
-                        number=f"{ttn_number}_{page_number}",
-                        defaults={
-                            'date': date,
-                            'ttn': ttn
-                        }
-                    )
-
-                    # Создаем ExcelFile с привязкой к ТТН
-                    excel_file = ExcelFile(
-                        invoice=invoice,
-                        ttn=ttn,
-                        processed=False,
-                        page_number=page_number
-                    )
-                    with open(filepath, 'rb') as f:
-                        excel_file.file.save(filename, File(f), save=True)
-
-                    wb = load_workbook(excel_file.file.path, data_only=True)
-                    ws = wb.active
-
-                    products_to_create = []
-                    validation_errors = []
-
-                    for row_index, row in enumerate(ws.iter_rows(min_row=1, values_only=True), start=1):
-                        if not any(row[:4]):
-                            continue
-
-                        if validate_header_row(row):
-                            cprint(f" ⚠️ Пропущена строка с номерами колонок (строка {row_index})", 'yellow')
-                            continue
-
-                        try:
-                            name = str(row[0]).strip() if row[0] else None
-                            if not name:
-                                raise ValueError(f"Пустое наименование товара (строка {row_index})")
-
-                            quantity = strict_float_conversion(row[2], row_index, "Количество")
-                            price = strict_float_conversion(row[3], row_index, "Цена")
-
-                            if len(row) > 4 and row[4]:
-                                validate_price_quantity_total(row, row_index)
-
-                            products_to_create.append(
-                                Product(
-                                    invoice=invoice,
-                                    excel_file=excel_file,
-                                    ttn=ttn,
-                                    name=name,
-                                    quantity=quantity,
-                                    price=price,
-                                    full_price=round(quantity * price, 2)
-                                )
-                            )
-                            cprint(f" ✅ Строка {row_index}: {name[:50]}...", 'green')
-
-                        except Exception as e:
-                            cprint(f"❌ ОШИБКА ВАЛИДАЦИИ (строка {row_index}): {e}", 'red')
-                            cprint(f"    Содержимое строки: {row[:5]}", 'yellow')
-                            validation_errors.append(f"Строка {row_index}: {e}")
-                            continue
-
-                    if validation_errors:
-                        raise ValueError(
-                            f"Найдены ошибки в {len(validation_errors)} строках:\n" +
-                            "\n".join(validation_errors[:5]) +
-                            ("\n..." if len(validation_errors) > 5 else "")
-                        )
-
-                    if not products_to_create:
-                        raise ValueError("В файле не найдено данных для импорта.")
-
-                    Product.objects.bulk_create(products_to_create)
-
-                    # Обновляем статистику по ТТН
-                    if ttn_number not in ttn_data:
-                        ttn_data[ttn_number] = {
-                            'total_products': 0,
-                            'files': set()
-                        }
-
-                    ttn_data[ttn_number]['total_products'] += len(products_to_create)
-                    ttn_data[ttn_number]['files'].add(filename)
-
-                    excel_file.processed = True
-                    excel_file.save()
-
-                    cprint(f"✔ Файл успешно обработан. Добавлено товаров: {len(products_to_create)}", 'green')
-
-            except Exception as e:
-                cprint(f"\n🔥 ОШИБКА: {e}", 'red')
-                continue
-
-        # Финальное обновление ТТН
-        for ttn_number, data in ttn_data.items():
-            try:
-                ttn = TTN.objects.get(number=ttn_number)
-                ttn.total_products = data['total_products']
-                ttn.processed_files = len(data['files'])
-                ttn.status = 'completed'
-                ttn.save()
-                cprint(f"✅ ТТН {ttn_number} завершена. Товаров: {data['total_products']}, файлов: {len(data['files'])}",
-                       'green')
-            except Exception as e:
-                cprint(f"⚠️ Ошибка обновления ТТН {ttn_number}: {e}", 'yellow')
\ No newline at end of file
+                        error = f"Содержимое совпадает с файлом {first}, который не загружен"
+                        reporter.info('file_duplicate', f"⏭ {error}", 'blue', file=filename, same_as=first)
+                        mark(record, 'failed', error=error)
+                else:
+                    parsed = next(parsed_files) if filename in valid else None
+                    result = ingest_file(record, parsed, options['archive'], references, read_stats, progress)
+                    if result:
+                        loaded[key] = result[0]
+                        ttn_numbers.add(result[0].ttn.number)
+                progress.advance()
+            progress.finish()
+        finally:
+            drop_unused_references(references)
+
+        elapsed = time.perf_counter() - started
+        if read_stats['seconds']:
+            reporter.info(
+                'summary',
+                f"\nЧтение: {read_stats['rows']} строк, "
+                f"{read_stats['rows'] / read_stats['seconds']:.0f} строк/с на процесс; "
+                f"всего {read_stats['rows'] / elapsed:.0f} строк/с с записью в БД",
+                'cyan',
+                rows=read_stats['rows'], read_seconds=round(read_stats['seconds'], 3), seconds=round(elapsed, 3)
+            )
+
+        # Счётчики ТТН считаются по БД, а не по файлам этого запуска
+        refresh_ttn_totals(ttn_numbers)
@@ -1,13 +1,18 @@
 import os
-import re
+import hashlib
 import logging
+from collections import Counter, deque
 from logging.handlers import RotatingFileHandler
 
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
 from django.db import transaction
-from termcolor import cprint
-from difflib import SequenceMatcher
-from parser.models import TTN, Product, Price, FinalSample
+from parser.ingest import fork_executor
+from parser.management.arguments import date_argument
+from parser.matching import (
+    PriceIndex, catalog_prefix, init_worker, match_products, parse_product_name, product_key
+)
+from parser.models import TTN, Product, FinalSample, MatchMemory, PriceList
+from parser.reporting import add_reporting_arguments, reporting
 
 os.makedirs('parser/logs', exist_ok=True)
 
@@ -26,217 +31,492 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Сколько ключей запрашивать из памяти сопоставлений за один запрос
+MEMORY_LOOKUP_CHUNK = 500
 
-class Command(BaseCommand):
-    help = "Обрабатывает TTN с улучшенным поиском и логированием"
-
-    def parse_product_name(self, name):
-        """Улучшенный парсер названия продукта"""
-        try:
-            clean_name = re.sub(r';.*$', '', name).strip()
-
-            match = re.match(r'^(\d+)\s+([^\s]+)\s+(.+)$', clean_name)
-            if match:
-                return {
-                    'code': match.group(1),
-                    'article': match.group(2),
-                    'name': match.group(3).strip()
-                }
-
-            match = re.match(r'^(\d+)\s+(.+?)\s+([^\s]+)$', clean_name)
-            if match:
-                return {
-                    'code': match.group(1),
-                    'article': match.group(3),
-                    'name': match.group(2).strip()
-                }
-
-            match = re.match(r'^(\d+)\s+(.+)$', clean_name)
-            if match:
-                return {
-                    'code': match.group(1),
-                    'article': '',
-                    'name': match.group(2).strip()
-                }
-
-            return None
-        except Exception as e:
-            logger.error(f"Ошибка разбора имени: {name} - {str(e)}")
-            return None
 
-    def article_similarity(self, a, b):
-        """Улучшенное сравнение артикулов"""
-        if not a or not b:
-            return 0
+def sample_fingerprint(product, catalog_version):
+    """Отпечаток данных товара и версии прайса, по которым построена строка FinalSample"""
+    raw = f"{product.name}|{product.quantity!r}|{product.price!r}|{product.full_price!r}|{catalog_version}"
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
 
-        a_clean = re.sub(r'[^a-zA-Z0-9]', '', a).lower()
-        b_clean = re.sub(r'[^a-zA-Z0-9]', '', b).lower()
 
-        if a_clean == b_clean:
-            return 1.0
-
-        if a_clean in b_clean or b_clean in a_clean:
-            return 0.9
-
-        return SequenceMatcher(None, a_clean, b_clean).ratio()
-
-    def text_name_similarity(self, name1, name2):
-        """Сравнение названий по словам и совпавшим символам"""
-        def normalize(text):
-            return re.sub(r'[^\w\s]', '', text.lower()).split()
-
-        words1 = normalize(name1)
-        words2 = normalize(name2)
-
-        matches = []
-        for w1 in words1:
-            for w2 in words2:
-                sim = SequenceMatcher(None, w1, w2).ratio()
-                if sim >= 0.5:
-                    matches.append((w1, w2, sim))
-
-        return matches
-
-    def find_price_matches(self, code, article):
-        """Поиск всех возможных совпадений в прайсе с логированием"""
-        prices = Price.objects.filter(code=code)
-        matches = []
-
-        for price in prices:
-            similarity = self.article_similarity(price.article, article)
-            if similarity >= 0.5:
-                matches.append({
-                    'price': price,
-                    'similarity': similarity,
-                    'details': f"{price.code} {price.article} ({price.name[:30]}...)"
-                })
-
-        if prices.exists() and not matches:
-            logger.debug(f"Для кода {code} найдены в прайсе, но нет подходящих артикулов:")
-            for p in prices:
-                logger.debug(f"- {p.article} (ID: {p.id})")
-
-        return matches
-
-    def handle(self, *args, **options):
-        ttn_number = input("Введите номер TTN для обработки: ").strip()
-        logger.info(f"Начало обработки TTN {ttn_number}")
+class Command(BaseCommand):
+    help = "Обрабатывает TTN с улучшенным поиском и логированием"
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--ttn',
+            action='append',
+            dest='ttn_numbers',
+            default=[],
+            help='Номер TTN для обработки (можно указать несколько раз)'
+        )
+        parser.add_argument(
+            '--all-pending',
+            action='store_true',
+            help='Обработать все TTN в статусе "в обработке"/"завершена" без строк FinalSample'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help='Число процессов для сопоставления TTN (по умолчанию: 1)'
+        )
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Полностью заменить результаты TTN (иначе пересчитываются только изменившиеся товары)'
+        )
+        parser.add_argument(
+            '--no-memory',
+            action='store_true',
+            help='Не брать результаты из памяти сопоставлений (сопоставить всё заново)'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Сколько строк FinalSample копить перед записью в БД (по умолчанию: 1000)'
+        )
+        parser.add_argument(
+            '--price-date',
+            type=date_argument,
+            help='Сопоставлять с версией прайса, действующей на эту дату (ДД-ММ-ГГГГ), а не на дату TTN'
+        )
+        add_reporting_arguments(parser)
+
+    def get_ttn_numbers(self, options):
+        """Список TTN из аргументов, либо интерактивный ввод одного номера"""
+        ttn_numbers = [number.strip() for number in options['ttn_numbers'] if number.strip()]
+
+        if options['all_pending']:
+            pending = (
+                TTN.objects
+                .filter(status__in=['in_progress', 'completed'])
+                .exclude(number__in=FinalSample.objects.values('ttn_number'))
+                .order_by('date', 'number')
+                .values_list('number', flat=True)
+            )
+            ttn_numbers.extend(pending)
+
+        if not ttn_numbers and not options['all_pending']:
+            ttn_numbers = [input("Введите номер TTN для обработки: ").strip()]
+
+        # Убираем повторы, сохраняя порядок
+        return list(dict.fromkeys(ttn_numbers))
+
+    def load_products(self, ttn_number):
+        """TTN и её товары для сопоставления или None, если обрабатывать нечего"""
         try:
             ttn = TTN.objects.get(number=ttn_number)
         except TTN.DoesNotExist:
             error_msg = f"TTN с номером {ttn_number} не найдена"
-            cprint(f"❌ {error_msg}", 'red')
+            self.reporter.error('ttn_not_found', f"❌ {error_msg}", ttn=ttn_number)
             logger.error(error_msg)
-            return
+            return None
 
-        products = Product.objects.filter(ttn=ttn).order_by('id')
+        products = list(
+            Product.objects
+            .filter(ttn=ttn)
+            .order_by('id')
+            .only('id', 'name', 'quantity', 'price', 'full_price')
+        )
         if not products:
             error_msg = f"Для TTN {ttn_number} нет товаров"
-            cprint(f"ℹ️ {error_msg}", 'yellow')
+            self.reporter.info('ttn_empty', f"ℹ️ {error_msg}", 'yellow', ttn=ttn_number)
             logger.warning(error_msg)
+            return None
+
+        return ttn, products
+
+    def price_list_for(self, ttn_date):
+        """Версия прайса, действующая на дату TTN (или на --price-date)"""
+        on_date = self.price_date or ttn_date
+        if on_date not in self.price_lists:
+            self.price_lists[on_date] = PriceList.objects.in_effect(on_date)
+        return self.price_lists[on_date]
+
+    def select_index(self, price_list):
+        """Индекс версии прайса; каждая версия загружается один раз за запуск"""
+        key = price_list.pk
+        if key in self.indexes:
+            return self.indexes[key]
+
+        # Дальше поиск идёт только по индексу в памяти
+        index = PriceIndex.current(price_list)
+        self.indexes[key] = index
+        self.reporter.info(
+            'price_list', f"💲 {price_list}: {index.size} позиций", 'cyan',
+            price_list=key, valid_from=price_list.valid_from, size=index.size
+        )
+        logger.info(f"Прайс загружен в память: {price_list}, {index.size} позиций")
+
+        # Память для прежних состояний этой версии прайса больше не действительна
+        stale = (
+            MatchMemory.objects
+            .filter(catalog_version__startswith=catalog_prefix(price_list))
+            .exclude(catalog_version=index.version)
+            .delete()[0]
+        )
+        if stale:
+            logger.info(f"Удалено устаревших записей памяти сопоставлений: {stale}")
+        return index
+
+    def build_sample(self, ttn_number, product, match_status, price=None):
+        """Готовит (но не сохраняет) строку FinalSample"""
+        sample = FinalSample(
+            ttn_number=ttn_number,
+            product=product,
+            fingerprint=sample_fingerprint(product, self.price_index.version),
+            product_name=product.name,
+            product_quantity=product.quantity,
+            product_price=product.price,
+            product_full_price=product.full_price,
+            match_status=match_status
+        )
+        if price is not None:
+            sample.price_code = price.code
+            sample.price_type = price.type
+            sample.price_article = price.article
+            sample.price_name = price.name
+            sample.price1 = price.price1
+            sample.price2 = price.price2
+            sample.price_clear = price.price_clear
+        return sample
+
+    def add_sample(self, sample):
+        self.pending_samples.append(sample)
+        if len(self.pending_samples) >= self.batch_size:
+            self.flush_samples()
+
+    def flush_samples(self):
+        """Записывает накопленные строки одним bulk_create"""
+        if not self.pending_samples:
+            return
+        FinalSample.objects.bulk_create(self.pending_samples, batch_size=self.batch_size)
+        self.saved_samples += len(self.pending_samples)
+        self.pending_samples = []
+
+    def recall_matches(self, products):
+        """Делит товары на известные по памяти сопоставлений и требующие поиска.
+
+        Возвращает ключи товаров, готовые результаты {id товара: результат}
+        и список (id, название) для сопоставления.
+        """
+        keys = {product.id: product_key(product.name) for product in products}
+        remembered = {}
+
+        if self.use_memory:
+            unique_keys = list(set(keys.values()))
+            for start in range(0, len(unique_keys), MEMORY_LOOKUP_CHUNK):
+                rows = MatchMemory.objects.filter(
+                    catalog_version=self.price_index.version,
+                    product_key__in=unique_keys[start:start + MEMORY_LOOKUP_CHUNK]
+                ).values_list('product_key', 'price_id', 'match_status', 'similarity')
+                for key, price_id, status, similarity in rows:
+                    remembered[key] = (price_id, status, similarity)
+
+        results = {}
+        pending = []
+        for product in products:
+            memory = remembered.get(keys[product.id])
+            price = self.price_index.price(memory[0]) if memory and memory[0] else None
+            if memory and (price or memory[0] is None):
+                price_id, status, similarity = memory
+                results[product.id] = {
+                    'parsed': parse_product_name(product.name),
+                    'status': status,
+                    'price_id': price_id,
+                    'price_code': price.code if price else None,
+                    'price_article': price.article if price else None,
+                    'similarity': similarity,
+                    'word_matches': [],
+                    'from_memory': True,
+                }
+            else:
+                pending.append((product.id, product.name))
+
+        if remembered:
+            logger.info(f"Из памяти сопоставлений: {len(results)} из {len(products)} товаров")
+        return keys, results, pending
+
+    def remember_matches(self, keys, results):
+        """Сохраняет новые результаты в память сопоставлений"""
+        memories = {}
+        for product_id, result in results.items():
+            if result.get('from_memory'):
+                continue
+            key = keys[product_id]
+            memories[key] = MatchMemory(
+                product_key=key,
+                catalog_version=self.price_index.version,
+                price_id=result['price_id'],
+                match_status=result['status'],
+                similarity=result['similarity']
+            )
+        if memories:
+            MatchMemory.objects.bulk_create(
+                memories.values(), batch_size=self.batch_size, ignore_conflicts=True
+            )
+
+    def report_result(self, log_prefix, product, result):
+        """Логирование результата сопоставления одного товара; на экран - только с -v 2"""
+        parsed = result['parsed']
+        status = result['status']
+        fields = {'product': product.id, 'status': status, 'price_code': result['price_code']}
+
+        if not parsed:
+            error_msg = f"{log_prefix} Не удалось разобрать название"
+            self.reporter.detail('product_unparsed', f"❌ {error_msg}", 'red', **fields)
+            logger.error(f"{error_msg}: {product.name[:200]}")
             return
 
-        cprint(f"\nНачинаем обработку {len(products)} товаров...", 'cyan')
-        logger.info(f"Найдено {len(products)} товаров для обработки")
+        if status in ('full', 'partial'):
+            log_msg = f"{log_prefix} Совпадение ({result['similarity']:.0%}): {parsed['code']} | Продукт: '{parsed['article']}' ≈ Прайс: '{result['price_article']}'"
+            if result['price_code'] != parsed['code']:
+                log_msg += f" (по артикулу, код в прайсе: {result['price_code']})"
+            if result.get('from_memory'):
+                log_msg += " [из памяти]"
+            if status == 'full':
+                self.reporter.detail('product_matched', f"✅ {log_msg}", 'green', **fields)
+            else:
+                self.reporter.detail('product_matched', f"⚠️ {log_msg}", 'yellow', **fields)
+            logger.info(log_msg)
+            return
+
+        if logger.isEnabledFor(logging.DEBUG):
+            entries = self.price_index.entries(parsed['code'])
+            if entries:
+                logger.debug(f"Для кода {parsed['code']} найдены в прайсе, но нет подходящих артикулов:")
+                for entry in entries:
+                    logger.debug(f"- {entry.article} (ID: {entry.id})")
+
+        if status == 'textual' and result.get('from_memory'):
+            log_msg = f"{log_prefix} 🔍 Доп. совпадение по тексту [из памяти]: {result['price_code']} {result['price_article']}"
+            self.reporter.detail('product_matched', log_msg, 'blue', **fields)
+            logger.info(log_msg)
+        elif status == 'textual':
+            log_msg = f"{log_prefix} 🔍 Доп. совпадение по тексту: найдено {len(result['word_matches'])} совпавших слов."
+            for w1, w2, sim in result['word_matches']:
+                log_msg += f"\n   \"{w1}\" ≈ \"{w2}\" ({sim:.0%})"
+            self.reporter.detail('product_matched', log_msg, 'blue', **fields)
+            logger.info(log_msg)
+        else:
+            log_msg = f"{log_prefix} ❌ Нет совпадений даже по тексту для: {parsed['code']} {parsed['article']}"
+            self.reporter.detail('product_unmatched', log_msg, 'red', **fields)
+            logger.warning(log_msg)
+
+    def plan_ttn(self, ttn_number, products):
+        """Какие товары пересчитать и какие строки FinalSample удалить.
+
+        Строка актуальна, если она привязана к товару и её отпечаток совпадает
+        с текущими данными товара и версией прайса. Остальные строки TTN
+        (старые, дубли, от удалённых товаров) заменяются.
+        """
+        if self.force:
+            return products, None
+
+        current = {}
+        stale_ids = []
+        samples = FinalSample.objects.filter(ttn_number=ttn_number).values_list('id', 'product_id', 'fingerprint')
+        for sample_id, product_id, fingerprint in samples:
+            if product_id is None or product_id in current:
+                stale_ids.append(sample_id)
+            else:
+                current[product_id] = (sample_id, fingerprint)
+
+        changed = []
+        for product in products:
+            sample = current.pop(product.id, None)
+            if sample and sample[1] == sample_fingerprint(product, self.price_index.version):
+                continue
+            if sample:
+                stale_ids.append(sample[0])
+            changed.append(product)
+
+        # Что осталось - строки товаров, которых в TTN больше нет
+        stale_ids.extend(sample_id for sample_id, _ in current.values())
+        return changed, stale_ids
+
+    def delete_samples(self, ttn_number, stale_ids):
+        """Удаляет заменяемые строки: всю TTN (stale_ids=None) или по списку id"""
+        if stale_ids is None:
+            return FinalSample.objects.filter(ttn_number=ttn_number).delete()[0]
+        deleted = 0
+        for start in range(0, len(stale_ids), MEMORY_LOOKUP_CHUNK):
+            deleted += FinalSample.objects.filter(id__in=stale_ids[start:start + MEMORY_LOOKUP_CHUNK]).delete()[0]
+        return deleted
+
+    def save_results(self, ttn_number, products, stale_ids, keys, results):
+        """Заменяет результаты TTN в FinalSample в отдельной транзакции"""
+        total = len(products)
+        self.saved_samples = 0
+        statuses = Counter()
+        progress = self.reporter.progress(f"TTN {ttn_number}", total=total, unit='товаров')
 
         with transaction.atomic():
+            deleted = self.delete_samples(ttn_number, stale_ids)
+            if deleted:
+                logger.info(f"Удалено устаревших строк FinalSample: {deleted}")
+
             for idx, product in enumerate(products, 1):
-                log_prefix = f"[{idx}/{len(products)}]"
+                result = results[product.id]
+                log_prefix = f"[{idx}/{total}]"
                 logger.info(f"{log_prefix} Обработка: {product.name[:100]}...")
 
-                parsed = self.parse_product_name(product.name)
-                if not parsed:
-                    FinalSample.objects.create(
-                        ttn_number=ttn_number,
-                        product_name=product.name,
-                        product_quantity=product.quantity,
-                        product_price=product.price,
-                        product_full_price=product.full_price,
-                        match_status='none'
-                    )
-                    error_msg = f"{log_prefix} Не удалось разобрать название"
-                    cprint(f"❌ {error_msg}", 'red')
-                    logger.error(f"{error_msg}: {product.name[:200]}")
+                self.report_result(log_prefix, product, result)
+                statuses[result['status']] += 1
+                price = self.price_index.price(result['price_id']) if result['price_id'] else None
+                self.add_sample(self.build_sample(ttn_number, product, result['status'], price))
+                progress.advance()
+
+            self.flush_samples()
+            self.remember_matches(keys, results)
+
+        progress.finish()
+        logger.info(f"Обработка TTN {ttn_number} завершена, записано строк: {self.saved_samples}")
+        self.reporter.info(
+            'ttn_processed',
+            f"\nОбработка TTN {ttn_number} завершена! Полных совпадений: {statuses['full']}, "
+            f"частичных: {statuses['partial']}, по тексту: {statuses['textual']}, "
+            f"без совпадений: {statuses['none']}",
+            'cyan', attrs=['bold'],
+            ttn=ttn_number, products=total, saved=self.saved_samples, statuses=dict(statuses)
+        )
+
+    def start_ttn(self, ttn_number):
+        """Товары TTN к пересчёту и строки к удалению; None, если делать нечего.
+
+        Выбирает self.price_index - версию прайса, с которой сопоставляется TTN.
+        """
+        logger.info(f"Начало обработки TTN {ttn_number}")
+        loaded = self.load_products(ttn_number)
+        if not loaded:
+            return None
+        ttn, products = loaded
+        price_list = self.price_list_for(ttn.date)
+        if price_list is None:
+            # Сопоставлять с более поздним прайсом нельзя: цены в нём уже другие
+            on_date = self.price_date or ttn.date
+            error_msg = f"Нет версии прайса, действующей на {on_date.strftime('%d.%m.%Y')}, TTN {ttn_number} пропущена"
+            self.reporter.error('no_price_list', f"❌ {error_msg}", ttn=ttn_number, date=on_date)
+            logger.warning(error_msg)
+            return None
+        self.price_index = self.select_index(price_list)
+
+        changed, stale_ids = self.plan_ttn(ttn_number, products)
+        if not changed and not stale_ids:
+            self.reporter.info(
+                'ttn_unchanged', f"\n✔ TTN {ttn_number} без изменений, пересчёт не нужен", 'green', ttn=ttn_number
+            )
+            logger.info(f"TTN {ttn_number} без изменений: {len(products)} товаров уже обработаны")
+            return None
+
+        skipped = len(products) - len(changed)
+        self.reporter.info(
+            'ttn_started', f"\nНачинаем обработку {len(changed)} товаров TTN {ttn_number}...", 'cyan',
+            ttn=ttn_number, changed=len(changed), skipped=skipped
+        )
+        if skipped:
+            self.reporter.info('ttn_skipped', f"Без изменений (пропущено): {skipped}", 'cyan', ttn=ttn_number)
+        logger.info(f"Найдено {len(products)} товаров, к обработке: {len(changed)}, без изменений: {skipped}")
+        return changed, stale_ids
+
+    def process_sequential(self, ttn_numbers):
+        for ttn_number in ttn_numbers:
+            job = self.start_ttn(ttn_number)
+            if not job:
+                continue
+            products, stale_ids = job
+            init_worker(self.price_index)
+            keys, results, pending = self.recall_matches(products)
+            results.update(match_products(pending))
+            self.save_results(ttn_number, products, stale_ids, keys, results)
+
+    def process_parallel(self, ttn_numbers, workers):
+        """Сопоставление в процессах-обработчиках, запись в БД только здесь.
+
+        TTN группируются по версии прайса: индекс версии передаётся пулу один раз.
+        """
+        for numbers in self.group_by_price_list(ttn_numbers):
+            self.match_in_pool(numbers, workers)
+
+    def group_by_price_list(self, ttn_numbers):
+        """Номера TTN по версиям прайса, в исходном порядке; товары здесь не загружаются"""
+        dates = dict(TTN.objects.filter(number__in=ttn_numbers).values_list('number', 'date'))
+        groups = {}
+        for ttn_number in ttn_numbers:
+            # Ненайденные TTN попадают в любую группу: start_ttn сообщит о них и пропустит
+            price_list = self.price_list_for(dates[ttn_number]) if ttn_number in dates else None
+            groups.setdefault(price_list.pk if price_list else None, []).append(ttn_number)
+        return groups.values()
+
+    def match_in_pool(self, ttn_numbers, workers):
+        """TTN одной версии прайса: планирование и запись здесь, поиск - в пуле.
+
+        TTN планируются по мере того, как пул берёт задания: спланированных, но
+        ещё не записанных TTN не больше 2*workers, как и файлов в load_excels.
+        """
+        executor = None
+        pending = deque()
+        try:
+            for ttn_number in ttn_numbers:
+                job = self.start_ttn(ttn_number)
+                if not job:
                     continue
+                products, stale_ids = job
+                keys, results, to_match = self.recall_matches(products)
+                if executor is None:
+                    executor = fork_executor(min(workers, len(ttn_numbers)), init_worker, (self.price_index,))
+                future = executor.submit(match_products, to_match)
+                pending.append((ttn_number, products, stale_ids, keys, results, future))
+                if len(pending) >= workers * 2:
+                    self.save_matched(*pending.popleft())
+            while pending:
+                self.save_matched(*pending.popleft())
+        finally:
+            if executor is not None:
+                executor.shutdown(cancel_futures=True)
+
+    def save_matched(self, ttn_number, products, stale_ids, keys, results, future):
+        try:
+            results.update(future.result())
+        except Exception as e:
+            self.reporter.error(
+                'ttn_failed', f"🔥 Ошибка сопоставления TTN {ttn_number}: {e}", ttn=ttn_number, error=str(e)
+            )
+            logger.exception(f"Ошибка сопоставления TTN {ttn_number}")
+            return
+        self.save_results(ttn_number, products, stale_ids, keys, results)
+
+    def handle(self, *args, **options):
+        with reporting(options) as reporter:
+            self.reporter = reporter
+            self.process(options)
+
+    def process(self, options):
+        self.batch_size = max(1, options['batch_size'])
+        self.pending_samples = []
+        self.saved_samples = 0
+        self.use_memory = not options['no_memory']
+        self.force = options['force']
+        workers = options['workers']
+        if workers < 1:
+            raise CommandError("--workers должно быть не меньше 1")
+
+        ttn_numbers = self.get_ttn_numbers(options)
+        if not ttn_numbers:
+            self.reporter.info('no_ttns', "Нет TTN для обработки", 'yellow')
+            return
+
+        # Версия прайса выбирается для каждой TTN по её дате (start_ttn)
+        self.price_date = options['price_date']
+        self.price_lists = {}  # дата -> PriceList
+        self.indexes = {}      # id PriceList -> PriceIndex
+        self.price_index = None
 
-                logger.debug(f"Разобрано: код={parsed['code']}, артикул={parsed['article']}, название={parsed['name'][:50]}...")
-
-                matches = self.find_price_matches(parsed['code'], parsed['article'])
-
-                if matches:
-                    best_match = max(matches, key=lambda x: x['similarity'])
-                    similarity = best_match['similarity']
-                    price_match = best_match['price']
-
-                    status = 'full' if similarity >= 0.85 else 'partial'
-                    FinalSample.objects.create(
-                        ttn_number=ttn_number,
-                        price_code=price_match.code,
-                        price_type=price_match.type,
-                        price_article=price_match.article,
-                        price_name=price_match.name,
-                        price1=price_match.price1,
-                        price2=price_match.price2,
-                        price_clear=price_match.price_clear,
-                        product_name=product.name,
-                        product_quantity=product.quantity,
-                        product_price=product.price,
-                        product_full_price=product.full_price,
-                        match_status=status
-                    )
-                    log_msg = f"{log_prefix} Совпадение ({similarity:.0%}): {parsed['code']} | Продукт: '{parsed['article']}' ≈ Прайс: '{price_match.article}'"
-                    if status == 'full':
-                        cprint(f"✅ {log_msg}", 'green')
-                    else:
-                        cprint(f"⚠️ {log_msg}", 'yellow')
-                    logger.info(log_msg)
-
-                else:
-                    prices = Price.objects.filter(code=parsed['code'])
-                    best_text_match = None
-                    best_match_info = []
-                    max_matches = 0
-
-                    for price in prices:
-                        word_matches = self.text_name_similarity(parsed['name'], price.name)
-                        if len(word_matches) > max_matches:
-                            max_matches = len(word_matches)
-                            best_text_match = price
-                            best_match_info = word_matches
-
-                    if best_text_match and max_matches >= 2:
-                        FinalSample.objects.create(
-                            ttn_number=ttn_number,
-                            price_code=best_text_match.code,
-                            price_type=best_text_match.type,
-                            price_article=best_text_match.article,
-                            price_name=best_text_match.name,
-                            price1=best_text_match.price1,
-                            price2=best_text_match.price2,
-                            price_clear=best_text_match.price_clear,
-                            product_name=product.name,
-                            product_quantity=product.quantity,
-                            product_price=product.price,
-                            product_full_price=product.full_price,
-                            match_status='textual'
-                        )
-                        log_msg = f"{log_prefix} 🔍 Доп. совпадение по тексту: найдено {max_matches} совпавших слов."
-                        for w1, w2, sim in best_match_info:
-                            log_msg += f"\n   \"{w1}\" ≈ \"{w2}\" ({sim:.0%})"
-                        cprint(log_msg, 'blue')
-                        logger.info(log_msg)
-                    else:
-                        FinalSample.objects.create(
-                            ttn_number=ttn_number,
-                            product_name=product.name,
-                            product_quantity=product.quantity,
-                            product_price=product.price,
-                            match_status='none'
-                        )
-                        log_msg = f"{log_prefix} ❌ Нет совпадений даже по тексту для: {parsed['code']} {parsed['article']}"
-                        cprint(log_msg, 'red')
-                        logger.warning(log_msg)
-
-        logger.info(f"Обработка TTN {ttn_number} завершена")
-        cprint(f"\nОбработка TTN {ttn_number} завершена!", 'cyan', attrs=['bold'])
+        if workers > 1 and len(ttn_numbers) > 1:
+            self.process_parallel(ttn_numbers, workers)
+        else:
+            self.process_sequential(ttn_numbers)
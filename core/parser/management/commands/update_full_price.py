@@ -1,14 +1,84 @@
+import time
+
 from django.core.management.base import BaseCommand
+from termcolor import cprint
+
+from parser.management.arguments import date_argument
 from parser.models import Product
 
+
 class Command(BaseCommand):
-    help = "Обновляет поле full_price для всех товаров"
+    help = (
+        "Обновляет поля total и full_price товаров. Обновление идёт кусками "
+        "по id (keyset), каждый кусок - один UPDATE; прерванный запуск "
+        "продолжается с --after-id"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--ttn',
+            action='append',
+            dest='ttn_numbers',
+            default=[],
+            help='Только товары этой ТТН (можно указать несколько раз)'
+        )
+        parser.add_argument(
+            '--since',
+            type=date_argument,
+            help='Только товары, загруженные с этой даты (ДД-ММ-ГГГГ)'
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=50000,
+            help='Сколько товаров обновлять одним запросом (по умолчанию: 50000)'
+        )
+        parser.add_argument(
+            '--after-id',
+            type=int,
+            default=0,
+            help='Начать с товаров, чей id больше этого (продолжение прерванного запуска)'
+        )
 
     def handle(self, *args, **options):
+        products = Product.objects.exclude(quantity__isnull=True).exclude(price__isnull=True)
+        if options['ttn_numbers']:
+            products = products.filter(ttn__number__in=options['ttn_numbers'])
+        if options['since']:
+            products = products.filter(created_at__date__gte=options['since'])
+        chunk_size = max(options['chunk_size'], 1)
+
+        total = products.filter(pk__gt=options['after_id']).count()
+        if not total:
+            cprint("Нет товаров для обновления", 'yellow')
+            return
+
+        started = time.perf_counter()
         updated = 0
-        for product in Product.objects.all():
-            if product.quantity is not None and product.price is not None:
-                product.full_price = round(product.quantity * product.price, 2)
-                product.save(update_fields=["full_price"])
-                updated += 1
-        self.stdout.write(self.style.SUCCESS(f"Обновлено {updated} товаров."))
+        last_id = options['after_id']
+        while True:
+            # Граница куска - id chunk_size-го товара после last_id; UPDATE идёт по диапазону id
+            boundary = (
+                products.filter(pk__gt=last_id)
+                .order_by('pk')
+                .values_list('pk', flat=True)[chunk_size - 1:chunk_size]
+                .first()
+            )
+            chunk = products.filter(pk__gt=last_id)
+            if boundary is not None:
+                chunk = chunk.filter(pk__lte=boundary)
+            updated += chunk.fill_totals()
+            if boundary is None:
+                break
+            last_id = boundary
+
+            elapsed = time.perf_counter() - started
+            cprint(
+                f"  … {updated}/{total} товаров ({updated / elapsed:.0f} в секунду), "
+                f"последний id {last_id}",
+                'blue'
+            )
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Обновлено {updated} товаров за {time.perf_counter() - started:.1f} с."
+        ))
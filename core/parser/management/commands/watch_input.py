@@ -0,0 +1,250 @@
+# parser/management/commands/watch_input.py
+import os
+import signal
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+
+from parser.files import file_sha256
+from parser.ingest import (
+    INPUT_DIR, find_duplicates, fork_executor, ingest_file, parse_result, refresh_ttn_totals, skip_duplicate,
+    submit_parse, sync_ledger
+)
+from parser.invoices import FILENAME_PATTERN
+from parser.models import PriceList, price_list_date
+from parser.reporting import add_reporting_arguments, reporting
+from parser.sheet_cache import add_cache_arguments, configure as configure_cache
+
+PRICES_DIR = os.path.join(INPUT_DIR, 'input_prices')
+
+
+def scan_folder(directory, extensions):
+    """{путь: (размер, mtime)} файлов папки без вложенных каталогов"""
+    if not os.path.isdir(directory):
+        return {}
+    files = {}
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if not entry.is_file() or entry.name.startswith(('~$', '.')):
+                continue
+            if not entry.name.lower().endswith(extensions):
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue  # файл успели убрать
+            files[entry.path] = (stat.st_size, stat.st_mtime_ns)
+    return files
+
+
+class Command(BaseCommand):
+    help = (
+        "Следит за папками input и input_prices и загружает новые файлы, "
+        "как только они дописаны. Остановка - Ctrl+C или SIGTERM: "
+        "файлы, которые уже читаются, будут дописаны в БД."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=2,
+            help='Число процессов для чтения и проверки накладных (по умолчанию: 2)'
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=1.0,
+            help='Как часто проверять папки, в секундах (по умолчанию: 1)'
+        )
+        parser.add_argument(
+            '--settle',
+            type=float,
+            default=2.0,
+            help='Сколько секунд размер и время изменения файла не должны меняться (по умолчанию: 2)'
+        )
+        parser.add_argument(
+            '--archive',
+            action='store_true',
+            help='Переносить загруженные накладные в архив, как load_excels --archive'
+        )
+        parser.add_argument(
+            '--price-mode',
+            choices=['skip', 'upsert'],
+            default='skip',
+            help='Режим загрузки прайсов, как load_prices2 --mode (по умолчанию: skip)'
+        )
+        add_cache_arguments(parser)
+        add_reporting_arguments(parser)
+
+    def request_stop(self, signum, frame):
+        if self.stopping:
+            raise KeyboardInterrupt
+        self.stopping = True
+        self.reporter.info(
+            'stopping', "\nОстановка: дочитываем начатые файлы (повторный сигнал - прервать сразу)", 'yellow'
+        )
+
+    def make_executor(self, workers):
+        # Ctrl+C обрабатывает только основной процесс: обработчики дочитывают свои файлы
+        return fork_executor(workers, signal.signal, (signal.SIGINT, signal.SIG_IGN))
+
+    def stable_files(self, settle):
+        """Файлы, которые не менялись settle секунд и ещё не загружены в этой версии"""
+        now = time.monotonic()
+        current = {
+            **scan_folder(INPUT_DIR, ('.xlsx',)),
+            **scan_folder(PRICES_DIR, ('.xls', '.xlsx')),
+        }
+        # Удалённые и перенесённые файлы забываем
+        for path in set(self.observed) - set(current):
+            del self.observed[path]
+        for path in set(self.loaded) - set(current):
+            del self.loaded[path]
+
+        ready = []
+        for path, signature in current.items():
+            if self.loaded.get(path) == signature or path in self.queued:
+                continue
+            seen_signature, since = self.observed.get(path, (None, now))
+            if seen_signature != signature or signature[0] == 0:
+                self.observed[path] = (signature, now)  # файл ещё пишется
+                continue
+            if now - since >= settle:
+                del self.observed[path]
+                ready.append((path, signature))
+        return sorted(ready)
+
+    def load_prices(self, path):
+        """Загружает прайс, если этот файл ещё не загружен в свою версию (например, до перезапуска)"""
+        self.reporter.info(
+            'price_file_started', f"\n💲 Прайс: {os.path.basename(path)}", 'cyan', attrs=['bold'], path=path
+        )
+        try:
+            valid_from = price_list_date(path)
+            if valid_from and PriceList.objects.filter(valid_from=valid_from, content_hash=file_sha256(path)).exists():
+                self.reporter.info(
+                    'price_file_unchanged', "⏭ Этот файл уже загружен в версию прайса, пропущен", 'blue', path=path
+                )
+                return
+            call_command(
+                'load_prices2', file=path, mode=self.price_mode, no_cache=self.no_cache,
+                verbosity=self.reporter.verbosity
+            )
+        except Exception as e:
+            self.reporter.error('price_file_failed', f"🔥 Ошибка загрузки прайса {path}: {e}", path=path, error=str(e))
+
+    def submit_invoice(self, executor, path):
+        """Проверяет журнал и дубликаты, затем отдаёт накладную на чтение"""
+        filename = os.path.basename(path)
+        self.reporter.info('file_found', f"\n📥 Новый файл: {filename}", 'cyan', attrs=['bold'], file=filename)
+        content_hash = file_sha256(path)
+        record = sync_ledger({filename: content_hash})[filename]
+        if record.state == 'done':
+            self.reporter.info('file_done_before', "⏭ Файл уже загружен по журналу, пропущен", 'blue', file=filename)
+            return
+        existing = find_duplicates({filename: content_hash}).get(filename)
+        if existing:
+            skip_duplicate(record, existing, self.archive)
+            return
+
+        if FILENAME_PATTERN.match(filename) and executor is not None:
+            self.in_flight[submit_parse(executor, path)] = (record, path)
+            return
+        # В одном процессе файл читается и пишется кусками прямо в save_file
+        self.write_invoice(record, None)
+
+    def write_invoice(self, record, parsed):
+        self.reporter.info(
+            'file_started', f"\nЗапись файла: {record.filename}", 'cyan', attrs=['bold'], file=record.filename
+        )
+        result = ingest_file(record, parsed, self.archive)
+        if result:
+            refresh_ttn_totals([result[0].ttn.number])
+
+    def collect(self, timeout):
+        """Пишет в БД прочитанные файлы; ждёт не дольше timeout"""
+        if not self.in_flight:
+            time.sleep(timeout)
+            return
+        done, _ = wait(list(self.in_flight), timeout=timeout, return_when=FIRST_COMPLETED)
+        for future in done:
+            record, path = self.in_flight.pop(future)
+            if isinstance(future.exception(), BrokenProcessPool):
+                self.pool_broken = True
+            self.write_invoice(record, parse_result(future, path))
+
+    def handle(self, *args, **options):
+        configure_cache(options)
+        with reporting(options) as reporter:
+            self.reporter = reporter
+            self.watch(options)
+
+    def watch(self, options):
+        workers = options['workers']
+        if workers < 1:
+            raise CommandError("--workers должно быть не меньше 1")
+        os.makedirs(PRICES_DIR, exist_ok=True)
+
+        self.archive = options['archive']
+        self.price_mode = options['price_mode']
+        self.no_cache = options['no_cache']
+        self.stopping = False
+        self.observed = {}   # путь -> ((размер, mtime), с какого момента не меняется)
+        self.loaded = {}     # путь -> (размер, mtime) при загрузке
+        self.in_flight = {}  # future чтения -> (запись журнала, путь)
+        self.pool_broken = False
+        self.queued = set()
+        queue = deque()      # устоявшиеся файлы в порядке появления
+
+        executor = self.make_executor(workers) if workers > 1 else None
+        signal.signal(signal.SIGINT, self.request_stop)
+        signal.signal(signal.SIGTERM, self.request_stop)
+        self.reporter.info(
+            'watch_started',
+            f"👀 Слежу за {INPUT_DIR} и {PRICES_DIR} "
+            f"(процессов: {workers}, проверка каждые {options['interval']} с)",
+            'cyan', attrs=['bold'],
+            workers=workers, interval=options['interval']
+        )
+        try:
+            while not self.stopping:
+                for path, signature in self.stable_files(options['settle']):
+                    queue.append((path, signature))
+                    self.queued.add(path)
+
+                # Прайсы пишутся сразу, накладные читаются в пуле не более чем 2*workers за раз
+                while queue and len(self.in_flight) < workers * 2 and not self.stopping:
+                    path, signature = queue.popleft()
+                    self.queued.discard(path)
+                    self.loaded[path] = signature
+                    if os.path.dirname(path) == PRICES_DIR:
+                        self.load_prices(path)
+                    else:
+                        self.submit_invoice(executor, path)
+
+                self.collect(options['interval'])
+
+                # Обработчик умер (например, его убил OOM): пул больше не принимает задачи,
+                # файлы из него уже записаны в журнал с ошибкой - запускаем новый пул
+                if self.pool_broken and not self.in_flight:
+                    self.reporter.error('pool_restarted', "Пул обработчиков сломан, запускаем новый")
+                    executor.shutdown(cancel_futures=True)
+                    executor = self.make_executor(workers)
+                    self.pool_broken = False
+
+            # Корректная остановка: новые файлы не берём, начатые дописываем
+            while self.in_flight:
+                self.collect(options['interval'])
+        except KeyboardInterrupt:
+            self.reporter.error(
+                'interrupted', "Прервано: недочитанные файлы остались в журнале и загрузятся при следующем запуске"
+            )
+        finally:
+            if executor is not None:
+                executor.shutdown(cancel_futures=True)
+            self.reporter.info('watch_stopped', "Наблюдение остановлено", 'cyan')
@@ -0,0 +1,412 @@
+# parser/matching.py
+import hashlib
+import heapq
+import re
+import sys
+from collections import Counter, defaultdict
+from difflib import SequenceMatcher
+from functools import lru_cache
+
+ARTICLE_CLEAN_RE = re.compile(r'[^a-zA-Z0-9]')
+NAME_CLEAN_RE = re.compile(r'[^\w\s]')
+
+PRICE_INDEX_FIELDS = (
+    'id', 'code', 'type', 'article', 'name', 'price1', 'price2', 'price_clear',
+    'article_normalized', 'name_tokens'
+)
+
+# Сколько кандидатов отбирает триграммный индекс для точной оценки
+TRIGRAM_TOP_K = 20
+# Минимальная длина артикула для поиска по всему прайсу (без учёта кода)
+FUZZY_ARTICLE_MIN_LENGTH = 4
+# Порог похожести артикула, если код товара в прайсе не найден
+FUZZY_ARTICLE_THRESHOLD = 0.85
+
+# Размер кэша попарной похожести слов
+WORD_SIMILARITY_CACHE_SIZE = 200_000
+
+# Индекс прайса внутри процесса-обработчика (см. init_worker)
+_worker_index = None
+# Загруженные индексы по версиям прайса (id PriceList, None - весь прайс);
+# у каждого - отпечаток состояния, из которого он построен
+_cached_indexes = {}
+
+
+def normalize_article(value):
+    """Нормализует артикул для сравнения"""
+    if not value:
+        return ''
+    return ARTICLE_CLEAN_RE.sub('', value).lower()
+
+
+def normalize_name(value):
+    """Разбивает наименование на нормализованные слова"""
+    if not value:
+        return []
+    return [sys.intern(word) for word in NAME_CLEAN_RE.sub('', value.lower()).split()]
+
+
+def parse_product_name(name):
+    """Разбирает название из накладной на код, артикул и наименование"""
+    clean_name = re.sub(r';.*$', '', name).strip()
+
+    match = re.match(r'^(\d+)\s+([^\s]+)\s+(.+)$', clean_name)
+    if match:
+        return {
+            'code': match.group(1),
+            'article': match.group(2),
+            'name': match.group(3).strip()
+        }
+
+    match = re.match(r'^(\d+)\s+(.+?)\s+([^\s]+)$', clean_name)
+    if match:
+        return {
+            'code': match.group(1),
+            'article': match.group(3),
+            'name': match.group(2).strip()
+        }
+
+    match = re.match(r'^(\d+)\s+(.+)$', clean_name)
+    if match:
+        return {
+            'code': match.group(1),
+            'article': '',
+            'name': match.group(2).strip()
+        }
+
+    return None
+
+
+def product_key(name):
+    """Ключ товара для памяти сопоставлений: хэш нормализованных кода, артикула и названия.
+
+    Результат сопоставления зависит только от этих нормализованных частей,
+    поэтому одинаковые ключи при одной версии прайса дают одинаковый результат.
+    """
+    parsed = parse_product_name(name)
+    if parsed:
+        parts = (parsed['code'], normalize_article(parsed['article']), ' '.join(normalize_name(parsed['name'])))
+    else:
+        parts = ('', '', ' '.join(normalize_name(name)))
+    return hashlib.sha1('|'.join(parts).encode('utf-8')).hexdigest()
+
+
+def article_similarity(a_clean, b_clean):
+    """Сравнение уже нормализованных артикулов"""
+    if not a_clean or not b_clean:
+        return 0
+
+    if a_clean == b_clean:
+        return 1.0
+
+    if a_clean in b_clean or b_clean in a_clean:
+        return 0.9
+
+    return SequenceMatcher(None, a_clean, b_clean).ratio()
+
+
+def article_trigrams(article_clean):
+    """Множество триграмм нормализованного артикула (с границами строки)"""
+    padded = f"^{article_clean}$"
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+@lru_cache(maxsize=WORD_SIMILARITY_CACHE_SIZE)
+def word_similarity(w1, w2):
+    """Похожесть двух слов (с кэшем: словарь поставщиков повторяется)"""
+    if w1 == w2:
+        return 1.0
+    # ratio() не может превысить 2*min/(len1+len2): короткое слово против длинного
+    # заведомо не дотянет до порога, SequenceMatcher можно не запускать
+    if 2 * min(len(w1), len(w2)) < 0.5 * (len(w1) + len(w2)):
+        return 0.0
+    return SequenceMatcher(None, w1, w2).ratio()
+
+
+def words_similarity(words1, words2):
+    """Сравнение двух наборов слов: список пар с похожестью >= 0.5"""
+    matches = []
+    for w1 in words1:
+        for w2 in words2:
+            sim = word_similarity(w1, w2)
+            if sim >= 0.5:
+                matches.append((w1, w2, sim))
+    return matches
+
+
+class PriceEntry:
+    """Позиция прайса с нормализованными полями (Price.article_normalized/name_tokens)"""
+    __slots__ = ('id', 'code', 'article', 'name', 'article_clean', 'name_words')
+
+    def __init__(self, price):
+        self.id = price.id
+        self.code = price.code
+        self.article = price.article
+        self.name = price.name
+        self.article_clean = price.article_normalized
+        self.name_words = [sys.intern(word) for word in price.name_tokens.split()]
+
+    def __getstate__(self):
+        return tuple(getattr(self, slot) for slot in self.__slots__)
+
+    def __setstate__(self, state):
+        for slot, value in zip(self.__slots__, state):
+            setattr(self, slot, value)
+
+
+class TrigramIndex:
+    """Инвертированный индекс триграмм по нормализованным артикулам.
+
+    Возвращает top-k кандидатов по числу общих триграмм, не перебирая весь прайс.
+    Слишком частые триграммы пропускаются, если в запросе есть более редкие.
+    """
+
+    def __init__(self, entries):
+        self.entries = []
+        self.postings = defaultdict(list)
+        for entry in entries:
+            if not entry.article_clean:
+                continue
+            position = len(self.entries)
+            self.entries.append(entry)
+            for gram in article_trigrams(entry.article_clean):
+                self.postings[gram].append(position)
+        self.postings = dict(self.postings)
+        self.max_posting = max(1000, len(self.entries) // 20)
+
+    def candidates(self, article_clean, limit=TRIGRAM_TOP_K):
+        """До limit позиций с наибольшим числом общих триграмм"""
+        if not article_clean:
+            return []
+
+        postings = sorted(
+            (self.postings[gram] for gram in article_trigrams(article_clean) if gram in self.postings),
+            key=len
+        )
+        if not postings:
+            return []
+
+        selective = [posting for posting in postings if len(posting) <= self.max_posting]
+        counts = Counter()
+        for posting in selective or postings[:1]:
+            counts.update(posting)
+
+        best = heapq.nlargest(limit, counts.items(), key=lambda item: item[1])
+        return [self.entries[position] for position, _ in best]
+
+
+def rank_by_trigrams(entries, article_clean, limit=TRIGRAM_TOP_K):
+    """Сужает небольшой список позиций до limit по общим триграммам"""
+    if len(entries) <= limit or not article_clean:
+        return entries
+    grams = article_trigrams(article_clean)
+    return heapq.nlargest(
+        limit, entries,
+        key=lambda entry: len(grams & article_trigrams(entry.article_clean))
+    )
+
+
+class PriceIndex:
+    """Прайс, загруженный в память одним запросом и сгруппированный по коду.
+
+    Сам индекс не зависит от Django и передаётся в процессы-обработчики;
+    объекты Price остаются только в основном процессе (self.prices).
+    """
+
+    def __init__(self, prices):
+        self.by_code = defaultdict(list)
+        self.by_article = defaultdict(list)
+        self.prices = {}
+        entries = []
+        for price in prices:
+            entry = PriceEntry(price)
+            entries.append(entry)
+            self.by_code[price.code].append(entry)
+            if entry.article_clean:
+                self.by_article[entry.article_clean].append(entry)
+            self.prices[price.id] = price
+        self.size = len(self.prices)
+        self.trigrams = TrigramIndex(entries)
+        self.version = None
+
+    def __getstate__(self):
+        return {
+            'by_code': dict(self.by_code),
+            'by_article': dict(self.by_article),
+            'size': self.size,
+            'trigrams': self.trigrams,
+            'version': self.version,
+        }
+
+    def __setstate__(self, state):
+        self.by_code = defaultdict(list, state['by_code'])
+        self.by_article = defaultdict(list, state['by_article'])
+        self.size = state['size']
+        self.trigrams = state['trigrams']
+        self.version = state['version']
+        self.prices = {}
+
+    @classmethod
+    def load(cls, queryset=None):
+        """Загружает прайс из БД: позиции queryset, по умолчанию - все"""
+        from parser.models import Price
+
+        if queryset is None:
+            queryset = Price.objects.all()
+        queryset = queryset.only(*PRICE_INDEX_FIELDS).order_by()
+        return cls(queryset.iterator(chunk_size=5000))
+
+    @classmethod
+    def current(cls, price_list=None):
+        """Индекс версии прайса (None - всех позиций); перестраивается только при изменении прайса"""
+        from parser.models import Price
+
+        key = price_list.pk if price_list is not None else None
+        version = catalog_version(price_list)
+        index = _cached_indexes.get(key)
+        if index is None or index.version != version:
+            queryset = Price.objects.filter(price_list=price_list) if price_list is not None else None
+            index = cls.load(queryset)
+            index.version = version
+            _cached_indexes[key] = index
+        return index
+
+    def entries(self, code):
+        return self.by_code.get(code, ())
+
+    def price(self, price_id):
+        return self.prices.get(price_id)
+
+    def find_article_matches(self, code, article):
+        """Все позиции с таким кодом и похожим артикулом (>= 0.5)"""
+        article_clean = normalize_article(article)
+        matches = []
+        for entry in rank_by_trigrams(self.entries(code), article_clean):
+            similarity = article_similarity(entry.article_clean, article_clean)
+            if similarity >= 0.5:
+                matches.append((entry, similarity))
+        return matches
+
+    def find_text_match(self, code, name):
+        """Позиция с таким кодом и наибольшим числом совпавших слов"""
+        words = normalize_name(name)
+        best_entry = None
+        best_info = []
+        for entry in self.entries(code):
+            word_matches = words_similarity(words, entry.name_words)
+            if len(word_matches) > len(best_info):
+                best_entry = entry
+                best_info = word_matches
+        return best_entry, best_info
+
+    def find_fuzzy_article_match(self, article):
+        """Лучшая позиция по артикулу во всём прайсе (код не найден или с ошибкой)"""
+        article_clean = normalize_article(article)
+        if len(article_clean) < FUZZY_ARTICLE_MIN_LENGTH:
+            return None, 0
+
+        # Точное совпадение нормализованного артикула - поиск по ключу, без оценки
+        exact = self.by_article.get(article_clean)
+        if exact:
+            return exact[0], 1.0
+
+        best_entry, best_similarity = None, 0
+        for entry in self.trigrams.candidates(article_clean):
+            similarity = article_similarity(entry.article_clean, article_clean)
+            if similarity > best_similarity:
+                best_entry, best_similarity = entry, similarity
+
+        if best_similarity < FUZZY_ARTICLE_THRESHOLD:
+            return None, 0
+        return best_entry, best_similarity
+
+    def match_product(self, name):
+        """Сопоставляет одно название из накладной с прайсом.
+
+        Возвращает словарь со статусом ('full', 'partial', 'textual', 'none'),
+        id найденной позиции и деталями для логирования.
+        """
+        parsed = parse_product_name(name)
+        result = {
+            'parsed': parsed,
+            'status': 'none',
+            'price_id': None,
+            'price_code': None,
+            'price_article': None,
+            'similarity': 0,
+            'word_matches': [],
+        }
+        if not parsed:
+            return result
+
+        matches = self.find_article_matches(parsed['code'], parsed['article'])
+        if matches:
+            entry, similarity = max(matches, key=lambda x: x[1])
+            result.update(
+                status='full' if similarity >= 0.85 else 'partial',
+                price_id=entry.id,
+                price_code=entry.code,
+                price_article=entry.article,
+                similarity=similarity,
+            )
+            return result
+
+        entry, word_matches = self.find_text_match(parsed['code'], parsed['name'])
+        if entry and len(word_matches) >= 2:
+            result.update(
+                status='textual',
+                price_id=entry.id,
+                price_code=entry.code,
+                price_article=entry.article,
+                word_matches=word_matches,
+            )
+            return result
+
+        # Код не дал результата: ищем артикул по всему прайсу через триграммы.
+        # Код при этом не совпал, поэтому такое совпадение не бывает полным.
+        entry, similarity = self.find_fuzzy_article_match(parsed['article'])
+        if entry:
+            result.update(
+                status='partial',
+                price_id=entry.id,
+                price_code=entry.code,
+                price_article=entry.article,
+                similarity=similarity,
+            )
+        return result
+
+
+def catalog_version(price_list=None):
+    """Отпечаток состояния версии прайса (None - всего прайса): меняется при любом импорте в неё.
+
+    Начинается с id версии и двоеточия - по этому префиксу чистится память сопоставлений.
+    """
+    from django.db.models import Count, Max
+    from parser.models import Price
+
+    prices = Price.objects.all()
+    if price_list is not None:
+        prices = prices.filter(price_list=price_list)
+    stats = prices.aggregate(count=Count('id'), last_id=Max('id'), updated=Max('updated_at'))
+    updated = stats['updated'].isoformat() if stats['updated'] else ''
+    return f"{catalog_prefix(price_list)}{stats['count']}:{stats['last_id'] or 0}:{updated}"
+
+
+def catalog_prefix(price_list):
+    return f"{price_list.pk if price_list is not None else 'all'}:"
+
+
+def clear_index_cache():
+    """Сбрасывает кэш индексов: следующий PriceIndex.current() загрузит прайс заново"""
+    _cached_indexes.clear()
+
+
+def init_worker(index):
+    """Инициализация процесса-обработчика: сохраняет индекс прайса"""
+    global _worker_index
+    _worker_index = index
+
+
+def match_products(products):
+    """Сопоставляет список (id, название) по индексу процесса-обработчика"""
+    return [(product_id, _worker_index.match_product(name)) for product_id, name in products]
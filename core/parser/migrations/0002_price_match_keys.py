@@ -0,0 +1,57 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:29
+
+import re
+
+from django.db import migrations, models
+
+# Копия нормализации из parser.matching на момент миграции: её дальнейшие
+# изменения не должны менять то, что делает эта миграция
+ARTICLE_CLEAN_RE = re.compile(r'[^a-zA-Z0-9]')
+NAME_CLEAN_RE = re.compile(r'[^\w\s]')
+
+
+def normalize_article(value):
+    if not value:
+        return ''
+    return ARTICLE_CLEAN_RE.sub('', value).lower()
+
+
+def normalize_name(value):
+    if not value:
+        return []
+    return NAME_CLEAN_RE.sub('', value.lower()).split()
+
+
+def fill_price_match_keys(apps, schema_editor):
+    Price = apps.get_model('parser', 'Price')
+    batch = []
+    for price in Price.objects.only('id', 'article', 'name').iterator(chunk_size=2000):
+        price.article_normalized = normalize_article(price.article)
+        price.name_tokens = ' '.join(normalize_name(price.name))
+        batch.append(price)
+        if len(batch) >= 2000:
+            Price.objects.bulk_update(batch, ['article_normalized', 'name_tokens'])
+            batch = []
+    if batch:
+        Price.objects.bulk_update(batch, ['article_normalized', 'name_tokens'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('parser', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='price',
+            name='article_normalized',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=100, verbose_name='Артикул (нормализованный)'),
+        ),
+        migrations.AddField(
+            model_name='price',
+            name='name_tokens',
+            field=models.TextField(blank=True, default='', editable=False, verbose_name='Слова наименования'),
+        ),
+        migrations.RunPython(fill_price_match_keys, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:30
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('parser', '0002_price_match_keys'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MatchMemory',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('product_key', models.CharField(max_length=40, verbose_name='Ключ товара')),
+                ('catalog_version', models.CharField(max_length=100, verbose_name='Версия прайса')),
+                ('match_status', models.CharField(max_length=20, verbose_name='Статус соответствия')),
+                ('similarity', models.FloatField(default=0, verbose_name='Похожесть')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Создано')),
+                ('price', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='parser.price', verbose_name='Позиция прайса')),
+            ],
+            options={
+                'verbose_name': 'Память сопоставлений',
+                'verbose_name_plural': 'Память сопоставлений',
+                'constraints': [models.UniqueConstraint(fields=('catalog_version', 'product_key'), name='parser_matchmemory_version_key_uniq')],
+            },
+        ),
+    ]
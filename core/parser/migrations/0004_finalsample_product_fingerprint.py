@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:32
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('parser', '0003_matchmemory'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='finalsample',
+            name='fingerprint',
+            field=models.CharField(blank=True, default='', max_length=40, verbose_name='Отпечаток'),
+        ),
+        migrations.AddField(
+            model_name='finalsample',
+            name='product',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='final_samples', to='parser.product', verbose_name='Товар'),
+        ),
+    ]
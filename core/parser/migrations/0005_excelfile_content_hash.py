@@ -0,0 +1,63 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:37
+
+import hashlib
+import os
+
+import parser.models
+from django.db import migrations, models
+
+# Копия parser.files.file_sha256 на момент миграции: её дальнейшие
+# изменения не должны менять то, что делает эта миграция
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def fill_content_hashes(apps, schema_editor):
+    """Хэши и исходные имена для уже загруженных файлов; сами файлы не переносятся"""
+    ExcelFile = apps.get_model('parser', 'ExcelFile')
+    batch = []
+    for excel_file in ExcelFile.objects.only('id', 'file').iterator(chunk_size=500):
+        excel_file.original_name = os.path.basename(excel_file.file.name)
+        try:
+            excel_file.content_hash = file_sha256(excel_file.file.path)
+        except OSError:
+            excel_file.content_hash = ''  # файла нет на диске
+        batch.append(excel_file)
+        if len(batch) >= 500:
+            ExcelFile.objects.bulk_update(batch, ['original_name', 'content_hash'])
+            batch = []
+    if batch:
+        ExcelFile.objects.bulk_update(batch, ['original_name', 'content_hash'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('parser', '0004_finalsample_product_fingerprint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='excelfile',
+            name='content_hash',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=64, verbose_name='SHA-256 содержимого'),
+        ),
+        migrations.AddField(
+            model_name='excelfile',
+            name='original_name',
+            field=models.CharField(blank=True, default='', max_length=255, verbose_name='Исходное имя файла'),
+        ),
+        migrations.AlterField(
+            model_name='excelfile',
+            name='file',
+            field=models.FileField(upload_to=parser.models.excel_upload_to, verbose_name='Файл Excel'),
+        ),
+        migrations.RunPython(fill_content_hashes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:39
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('parser', '0005_excelfile_content_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IngestionRecord',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('filename', models.CharField(max_length=255, unique=True, verbose_name='Имя файла')),
+                ('content_hash', models.CharField(blank=True, default='', max_length=64, verbose_name='SHA-256 содержимого')),
+                ('state', models.CharField(choices=[('pending', 'Ожидает'), ('processing', 'Обрабатывается'), ('done', 'Загружен'), ('failed', 'Ошибка')], db_index=True, default='pending', max_length=20, verbose_name='Состояние')),
+                ('error', models.TextField(blank=True, default='', verbose_name='Ошибка')),
+                ('attempts', models.PositiveIntegerField(default=0, verbose_name='Попыток')),
+                ('archived_path', models.CharField(blank=True, default='', max_length=500, verbose_name='Путь в архиве')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Создано')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Обновлено')),
+                ('excel_file', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='ingestion_records', to='parser.excelfile', verbose_name='Загруженный файл')),
+            ],
+            options={
+                'verbose_name': 'Журнал загрузки',
+                'verbose_name_plural': 'Журнал загрузки',
+                'ordering': ['-updated_at'],
+            },
+        ),
+    ]
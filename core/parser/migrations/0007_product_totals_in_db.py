@@ -0,0 +1,21 @@
+from django.db import migrations
+from django.db.models import F
+from django.db.models.functions import Round
+
+
+def fill_product_totals(apps, schema_editor):
+    """Сумма и стоимость для всех товаров одним UPDATE: bulk_create оставлял total пустым"""
+    Product = apps.get_model('parser', 'Product')
+    amount = Round(F('quantity') * F('price'), 2)
+    Product.objects.update(total=amount, full_price=amount)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('parser', '0006_ingestionrecord'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_product_totals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:04
+
+from django.db import migrations, models
+from django.db.models import Min
+
+
+def drop_duplicate_codes(apps, schema_editor):
+    """Перед уникальным индексом оставляем по каждому коду первую загруженную позицию.
+
+    Её же до сих пор и находил импорт (дубли пропускались), так что прайс не меняется.
+    """
+    Price = apps.get_model('parser', 'Price')
+    first_ids = Price.objects.order_by().values('code').annotate(first_id=Min('id')).values('first_id')
+    Price.objects.exclude(code=None).exclude(id__in=first_ids).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('parser', '0007_product_totals_in_db'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_duplicate_codes, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='price',
+            constraint=models.UniqueConstraint(fields=('code',), name='parser_price_code_uniq'),
+        ),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:20
+
+import datetime
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# Дата версии для позиций, загруженных до появления версий: раньше любого
+# настоящего прайса, так что она действует, только пока других версий нет
+INITIAL_PRICE_LIST_DATE = datetime.date(1900, 1, 1)
+
+
+def attach_initial_price_list(apps, schema_editor):
+    """Существующие позиции - в одну начальную версию; память сопоставлений - заново"""
+    Price = apps.get_model('parser', 'Price')
+    PriceList = apps.get_model('parser', 'PriceList')
+    MatchMemory = apps.get_model('parser', 'MatchMemory')
+
+    if Price.objects.exists():
+        price_list = PriceList.objects.create(name='Прайс до версий', valid_from=INITIAL_PRICE_LIST_DATE)
+        Price.objects.update(price_list=price_list)
+    # Версии памяти теперь привязаны к версии прайса, старые записи не подойдут
+    MatchMemory.objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('parser', '0008_price_code_unique'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PriceList',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(blank=True, default='', max_length=255, verbose_name='Файл прайса')),
+                ('valid_from', models.DateField(unique=True, verbose_name='Действует с')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Создано')),
+            ],
+            options={
+                'verbose_name': 'Версия прайса',
+                'verbose_name_plural': 'Версии прайса',
+                'ordering': ['-valid_from'],
+            },
+        ),
+        migrations.RemoveConstraint(
+            model_name='price',
+            name='parser_price_code_uniq',
+        ),
+        migrations.AddField(
+            model_name='price',
+            name='price_list',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='prices', to='parser.pricelist', verbose_name='Версия прайса'),
+        ),
+        migrations.RunPython(attach_initial_price_list, migrations.RunPython.noop),
+    ]
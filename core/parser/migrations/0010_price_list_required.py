@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    """Отдельно от 0009: в PostgreSQL нельзя менять таблицу в той же транзакции,
+    где по ней остались отложенные проверки внешнего ключа после заполнения"""
+
+    dependencies = [
+        ('parser', '0009_price_lists'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='price',
+            name='price_list',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='prices', to='parser.pricelist', verbose_name='Версия прайса'),
+        ),
+        migrations.AddConstraint(
+            model_name='price',
+            constraint=models.UniqueConstraint(fields=('price_list', 'code'), name='parser_price_list_code_uniq'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('parser', '0010_price_list_required'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pricelist',
+            name='content_hash',
+            field=models.CharField(blank=True, default='', max_length=64, verbose_name='SHA-256 последнего загруженного файла'),
+        ),
+    ]
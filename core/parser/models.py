@@ -1,4 +1,15 @@
+import math
+import os
+import re
+from datetime import datetime
+from decimal import ROUND_HALF_UP, Decimal
+
 from django.db import models
+from django.db.models import F
+from django.db.models.functions import Round
+
+from parser.files import content_addressed_name
+from parser.matching import normalize_article, normalize_name
 
 
 class TTN(models.Model):
@@ -47,8 +58,17 @@ class Invoice(models.Model):
         return f"{self.number} от {self.date}"
 
 
+def excel_upload_to(instance, filename):
+    """Файлы накладных хранятся по хэшу содержимого: одинаковые файлы - один путь"""
+    if instance.content_hash:
+        return content_addressed_name('uploads', instance.content_hash, filename)
+    return f'uploads/{filename}'
+
+
 class ExcelFile(models.Model):
-    file = models.FileField("Файл Excel", upload_to='uploads/')
+    file = models.FileField("Файл Excel", upload_to=excel_upload_to)
+    original_name = models.CharField("Исходное имя файла", max_length=255, blank=True, default='')
+    content_hash = models.CharField("SHA-256 содержимого", max_length=64, blank=True, default='', db_index=True)
     uploaded_at = models.DateTimeField("Загружен", auto_now_add=True)
     processed = models.BooleanField("Обработан", default=False)
     invoice = models.ForeignKey(
@@ -69,8 +89,36 @@ class ExcelFile(models.Model):
     )
     page_number = models.PositiveIntegerField("Номер страницы", null=True, blank=True)
 
+    @property
+    def display_name(self):
+        return self.original_name or os.path.basename(self.file.name)
+
     def __str__(self):
-        return self.file.name
+        return self.display_name
+
+
+def round_amount(value):
+    """round(value, 2) с округлением половины от нуля, как ROUND в SQLite.
+
+    SQLite округляет десятичную запись числа из 15 значащих цифр, поэтому
+    2.675 (в двоичном виде 2.67499...) даёт 2.68, а не 2.67, как round().
+    """
+    if value is None or not math.isfinite(value):
+        return None if value is None or math.isnan(value) else value
+    if abs(value) >= 1e15:
+        return value  # у таких чисел нет долей копейки
+    return float(Decimal(f"{value:.15g}").quantize(Decimal('0.01'), ROUND_HALF_UP))
+
+
+class ProductQuerySet(models.QuerySet):
+    def fill_totals(self):
+        """Сумма и стоимость одним UPDATE в БД: round(количество * цена, 2).
+
+        Для массовых путей (bulk_create не вызывает save); Product.save
+        считает то же самое через round_amount.
+        """
+        amount = Round(F('quantity') * F('price'), 2)
+        return self.update(total=amount, full_price=amount)
 
 
 class Product(models.Model):
@@ -101,14 +149,94 @@ class Product(models.Model):
     full_price = models.FloatField("Стоимость (авто)", blank=True, null=True)
     created_at = models.DateTimeField("Создано", auto_now_add=True)
 
+    objects = ProductQuerySet.as_manager()
+
     def save(self, *args, **kwargs):
-        self.total = round(self.quantity * self.price, 2)
+        # Так же, как fill_totals после массовой вставки, но без лишних запросов
+        if self.quantity is None or self.price is None:
+            self.total = self.full_price = None
+        else:
+            self.total = self.full_price = round_amount(self.quantity * self.price)
+        update_fields = kwargs.get('update_fields')
+        if update_fields:
+            kwargs['update_fields'] = {*update_fields, 'total', 'full_price'}
         super().save(*args, **kwargs)
 
     def __str__(self):
         return f"{self.name[:50]} ({self.quantity} шт. x {self.price} руб.)"
 
+# Дата прайса в имени файла: price_22-04-2025.xlsx
+PRICE_LIST_DATE_PATTERN = re.compile(r'(?P<date>\d{2}-\d{2}-\d{4})')
+
+
+def price_list_date(filename):
+    """Дата, с которой действует прайс, из имени файла; None, если даты в имени нет"""
+    match = PRICE_LIST_DATE_PATTERN.search(os.path.basename(filename))
+    if not match:
+        return None
+    try:
+        return datetime.strptime(match.group('date'), "%d-%m-%Y").date()
+    except ValueError:
+        return None
+
+
+class PriceListQuerySet(models.QuerySet):
+    def in_effect(self, on_date):
+        """Версия прайса, действующая на дату: последняя с датой не позже on_date.
+
+        None, если дата раньше всех версий или версий нет: цены более позднего
+        прайса к этой дате не относятся.
+        """
+        return self.filter(valid_from__lte=on_date).order_by('-valid_from').first()
+
+
+class PriceList(models.Model):
+    """Версия прайса: позиции одного прайс-листа, действующие с его даты"""
+    name = models.CharField("Файл прайса", max_length=255, blank=True, default='')
+    valid_from = models.DateField("Действует с", unique=True)
+    content_hash = models.CharField("SHA-256 последнего загруженного файла", max_length=64, blank=True, default='')
+    created_at = models.DateTimeField("Создано", auto_now_add=True)
+
+    objects = PriceListQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = "Версия прайса"
+        verbose_name_plural = "Версии прайса"
+        ordering = ['-valid_from']
+
+    def __str__(self):
+        return f"Прайс от {self.valid_from.strftime('%d.%m.%Y')}"
+
+
+# Поля позиции прайса, которые импорт берёт из файла (ключ позиции - версия и code)
+PRICE_IMPORT_FIELDS = ['type', 'article', 'name', 'price1', 'price2', 'stock', 'quantity', 'price_clear']
+
+
+class PriceQuerySet(models.QuerySet):
+    def upsert(self, prices):
+        """Вставляет позиции и обновляет существующие с тем же кодом в версии одним запросом.
+
+        Сверку с БД делает вызывающий код (parser.prices.importer.version_changes):
+        сюда передаются только новые и изменившиеся позиции, остальные не
+        трогаются - их updated_at, а с ним и версия прайса, остаются прежними.
+        """
+        for price in prices:
+            price.fill_match_keys()
+        self.bulk_create(
+            prices,
+            update_conflicts=True,
+            unique_fields=['price_list', 'code'],
+            update_fields=[*PRICE_IMPORT_FIELDS, 'article_normalized', 'name_tokens', 'updated_at']
+        )
+
+
 class Price(models.Model):
+    price_list = models.ForeignKey(
+        PriceList,
+        verbose_name="Версия прайса",
+        on_delete=models.CASCADE,
+        related_name='prices'
+    )
     code = models.CharField(
         max_length=100,
         blank=True,
@@ -128,13 +256,41 @@ class Price(models.Model):
     stock = models.TextField("Остаток")
     quantity = models.IntegerField("Количество", default=0)
     price_clear = models.DecimalField("Цена за ед товара.", max_digits=10, decimal_places=2)
+    # Ключи сопоставления: считаются при импорте, чтобы process_ttn не делал это каждый раз
+    article_normalized = models.CharField(
+        "Артикул (нормализованный)",
+        max_length=100,
+        blank=True,
+        default='',
+        db_index=True,
+        editable=False
+    )
+    name_tokens = models.TextField("Слова наименования", blank=True, default='', editable=False)
     created_at = models.DateTimeField("Создано", auto_now_add=True)
     updated_at = models.DateTimeField("Обновлено", auto_now=True)
 
+    objects = PriceQuerySet.as_manager()
+
     class Meta:
         verbose_name = "Прайс"
         verbose_name_plural = "Прайсы"
         ordering = ['code']
+        constraints = [
+            models.UniqueConstraint(fields=['price_list', 'code'], name='parser_price_list_code_uniq'),
+        ]
+
+    def fill_match_keys(self):
+        """Заполняет нормализованные ключи сопоставления"""
+        self.article_normalized = normalize_article(self.article)
+        self.name_tokens = ' '.join(normalize_name(self.name))
+
+    def save(self, *args, **kwargs):
+        self.fill_match_keys()
+        # Ключи считаются из article и name: при частичном сохранении пишутся вместе с ними
+        update_fields = kwargs.get('update_fields')
+        if update_fields:
+            kwargs['update_fields'] = {*update_fields, 'article_normalized', 'name_tokens'}
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return f"{self.code} - {self.name[:50]}"
@@ -145,6 +301,17 @@ from django.db import models
 
 class FinalSample(models.Model):
     ttn_number = models.CharField("Номер ТТН", max_length=50)
+    product = models.ForeignKey(
+        Product,
+        verbose_name="Товар",
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='final_samples'
+    )
+    # Отпечаток данных товара и версии прайса: по нему повторный запуск
+    # process_ttn понимает, что строка актуальна и пересчитывать её не нужно
+    fingerprint = models.CharField("Отпечаток", max_length=40, blank=True, default='')
     price_code = models.CharField("Код из прайса", max_length=50, blank=True, null=True)
     price_type = models.CharField("Тип из прайса", max_length=100, blank=True, null=True)
     price_article = models.CharField("Артикул из прайса", max_length=100, blank=True, null=True)
@@ -171,4 +338,74 @@ class FinalSample(models.Model):
         ]
 
     def __str__(self):
-        return f"{self.ttn_number} - {self.product_name[:50]}"
\ No newline at end of file
+        return f"{self.ttn_number} - {self.product_name[:50]}"
+
+class MatchMemory(models.Model):
+    """Результат сопоставления товара с прайсом, запомненный для версии прайса"""
+    product_key = models.CharField("Ключ товара", max_length=40)
+    catalog_version = models.CharField("Версия прайса", max_length=100)
+    price = models.ForeignKey(
+        Price,
+        verbose_name="Позиция прайса",
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='+'
+    )
+    match_status = models.CharField("Статус соответствия", max_length=20)
+    similarity = models.FloatField("Похожесть", default=0)
+    created_at = models.DateTimeField("Создано", auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Память сопоставлений"
+        verbose_name_plural = "Память сопоставлений"
+        constraints = [
+            models.UniqueConstraint(
+                fields=['catalog_version', 'product_key'],
+                name='parser_matchmemory_version_key_uniq'
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.product_key} -> {self.price_id} ({self.match_status})"
+
+
+class IngestionRecord(models.Model):
+    """Журнал загрузки файла из папки input: состояние и ошибка последней попытки"""
+    STATE_CHOICES = [
+        ('pending', 'Ожидает'),
+        ('processing', 'Обрабатывается'),
+        ('done', 'Загружен'),
+        ('failed', 'Ошибка')
+    ]
+
+    filename = models.CharField("Имя файла", max_length=255, unique=True)
+    content_hash = models.CharField("SHA-256 содержимого", max_length=64, blank=True, default='')
+    state = models.CharField(
+        "Состояние",
+        max_length=20,
+        choices=STATE_CHOICES,
+        default='pending',
+        db_index=True
+    )
+    error = models.TextField("Ошибка", blank=True, default='')
+    attempts = models.PositiveIntegerField("Попыток", default=0)
+    excel_file = models.ForeignKey(
+        ExcelFile,
+        verbose_name="Загруженный файл",
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='ingestion_records'
+    )
+    archived_path = models.CharField("Путь в архиве", max_length=500, blank=True, default='')
+    created_at = models.DateTimeField("Создано", auto_now_add=True)
+    updated_at = models.DateTimeField("Обновлено", auto_now=True)
+
+    class Meta:
+        verbose_name = "Журнал загрузки"
+        verbose_name_plural = "Журнал загрузки"
+        ordering = ['-updated_at']
+
+    def __str__(self):
+        return f"{self.filename} ({self.get_state_display()})"
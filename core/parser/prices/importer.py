@@ -0,0 +1,347 @@
+# parser/prices/importer.py
+"""Импорт файла прайса в версию PriceList: разбор строк и запись кусками.
+
+Общий для load_prices, load_prices2 и watch_input. Файл читается читателем
+из parser.prices.readers, куски по CHUNK_SIZE строк чистятся по колонкам
+(clean_chunk) и пишутся bulk_create (режим skip) или Price.objects.upsert.
+"""
+import os
+from decimal import Context, Decimal
+from itertools import compress, repeat
+from operator import itemgetter
+
+import numpy as np
+import pandas as pd
+from django.db import models, transaction
+from django.db.models.functions import Cast
+
+from parser.files import batched, file_sha256
+from parser.models import PRICE_IMPORT_FIELDS, Price, PriceList, price_list_date
+from parser.prices.readers import PriceReadError, iter_price_rows
+from parser.reporting import DETAIL, get_reporter
+
+# Сколько строк прайса проверяется и вставляется за раз
+CHUNK_SIZE = 5000
+# Колонки файла прайса по порядку
+PRICE_FIELDS = ['code', 'type', 'article', 'name', 'price1', 'price2', 'stock', 'quantity', 'price_clear']
+
+
+def filled_cells(values):
+    """Заполненные ячейки: не пустые и не ложные (0, False и '' - пустые, как в файле без значения)"""
+    return values.notna() & values.astype(bool)
+
+
+def text_column(column):
+    """str(значение).strip() для заполненных ячеек, '' для пустых"""
+    return column.astype(str).str.strip().where(filled_cells(column), '')
+
+
+def number_column(column):
+    """Числа колонки: запятая - десятичный разделитель, пустое и нечисловое - 0.
+
+    Значения приводятся через str, как раньше float(str(value)): True и даты
+    числом не считаются.
+    """
+    text = column.astype(str).str.replace(',', '.', regex=False).str.strip()
+    return pd.to_numeric(text, errors='coerce').fillna(0.0).to_numpy(dtype=np.float64)
+
+
+def int_column(column):
+    """Целые колонки: дробная часть отбрасывается, бесконечность - 0"""
+    numbers = np.trunc(number_column(column))
+    numbers[~np.isfinite(numbers)] = 0
+    return numbers.astype(np.int64)
+
+
+def stock_column(column):
+    """Остаток: числа - целые без '.0', текст - без пробелов по краям, пустое - ''"""
+    stock = pd.Series('', index=column.index, dtype=object)
+    present = column.notna()
+    numeric = present & column.map(type).isin((int, float, bool))
+    text = present & ~numeric
+    stock[text] = column[text].astype(str).str.strip()
+
+    numbers = column[numeric].astype(np.float64)
+    stock[numeric] = column[numeric].astype(str)
+    integral = numbers.index[(numbers == np.trunc(numbers)) & np.isfinite(numbers)]
+    stock[integral] = numbers[integral].astype(np.int64).astype(str)
+    return stock
+
+
+def in_codes(column, codes):
+    """Маска: значение колонки есть в множестве codes.
+
+    Хэш множества уже построен, Series.isin строил бы его заново на каждый кусок.
+    """
+    return np.fromiter(map(codes.__contains__, column.tolist()), dtype=bool, count=len(column))
+
+
+def build_prices(columns, price_list):
+    """Price версии price_list из колонок {имя поля: значения}.
+
+    Позиционный конструктор модели заметно быстрее разбора kwargs на каждую
+    строку; поля, которых нет в columns, получают значения по умолчанию.
+    """
+    columns = {**columns, 'price_list_id': repeat(price_list.pk)}
+    values = [
+        columns[field.attname] if field.attname in columns else repeat(field.get_default())
+        for field in Price._meta.concrete_fields
+    ]
+    return [Price(*row) for row in zip(*values)]
+
+
+def price_frame(chunk):
+    """Кусок (номер строки, значения) -> DataFrame с колонками PRICE_FIELDS; индекс - номера строк"""
+    df = pd.DataFrame([values for _, values in chunk], index=[row_idx for row_idx, _ in chunk], dtype=object)
+    df = df.reindex(columns=range(len(PRICE_FIELDS)))
+    df.columns = PRICE_FIELDS
+    return df
+
+
+def price_columns(df):
+    """Очищенные колонки строк df: {имя поля Price: значения}"""
+    return {
+        'code': text_column(df['code']).tolist(),
+        'type': text_column(df['type']).tolist(),
+        'article': text_column(df['article']).astype(object).where(filled_cells(df['article']), None).tolist(),
+        'name': text_column(df['name']).tolist(),
+        'price1': number_column(df['price1']).tolist(),
+        'price2': number_column(df['price2']).tolist(),
+        'stock': stock_column(df['stock']).tolist(),
+        'quantity': int_column(df['quantity']).tolist(),
+        'price_clear': number_column(df['price_clear']).tolist(),
+    }
+
+
+def stored_decimals(field, values, digits=None):
+    """Числа values так, как их отдаёт DecimalField field: до decimal_places знаков.
+
+    Django переводит float в Decimal из digits значащих цифр (при записи -
+    max_digits, при чтении из SQLite - 15) и округляет до decimal_places
+    половиной к чётному. Обычно это rint(x * 100) / 100; значения рядом с
+    половиной последнего знака (там важно и первое округление) считаются
+    через Decimal. Бесконечность и nan - nan: такая строка всегда считается
+    изменившейся, и ошибку, как и раньше, выдаст запись в БД.
+    """
+    digits = digits or field.max_digits
+    scale = 10.0 ** field.decimal_places
+    scaled = values * scale
+    stored = np.rint(scaled) / scale
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        # Шаг первого округления до digits значащих цифр в единицах scaled
+        step = 10.0 ** (np.floor(np.log10(np.abs(values))) + 1 - digits) * scale
+        near_half = np.abs(np.abs(scaled - np.trunc(scaled)) - 0.5) <= np.maximum(step, 1e-6)
+    finite = np.isfinite(scaled)
+    stored[~finite] = np.nan
+    context = Context(prec=digits)
+    quantum = Decimal(1).scaleb(-field.decimal_places)
+    for i in np.flatnonzero(near_half & finite):
+        stored[i] = float(context.create_decimal_from_float(float(values[i])).quantize(quantum))
+    return stored
+
+
+def version_frame(price_list):
+    """Позиции версии price_list: DataFrame PRICE_IMPORT_FIELDS с индексом по коду.
+
+    Дробные поля читаются из БД как float, без конвертеров Django на каждую
+    ячейку, и приводятся к тому же виду, что и при чтении модели (stored_decimals).
+    """
+    decimals = {
+        name: Price._meta.get_field(name) for name in PRICE_IMPORT_FIELDS
+        if isinstance(Price._meta.get_field(name), models.DecimalField)
+    }
+    rows = (
+        Price.objects
+        .filter(price_list=price_list)
+        .annotate(**{f'{name}_float': Cast(name, models.FloatField()) for name in decimals})
+        .values_list('code', *(f'{name}_float' if name in decimals else name for name in PRICE_IMPORT_FIELDS))
+    )
+    current = pd.DataFrame(list(rows), columns=['code', *PRICE_IMPORT_FIELDS], dtype=object)
+    for name, field in decimals.items():
+        # NULL -> nan: отличается от любого числа
+        current[name] = stored_decimals(field, np.array(current[name].tolist(), dtype=np.float64), digits=15)
+    return current.set_index('code')
+
+
+def version_changes(columns, current):
+    """Маски (новые, изменившиеся) строк куска относительно позиций версии current (version_frame).
+
+    Кусок объединяется (merge по коду) с позициями версии, и PRICE_IMPORT_FIELDS
+    сравниваются целыми колонками: дробные - в том виде, в каком окажутся в БД.
+    """
+    # При how='left' строки идут в порядке куска: i-я строка merged - i-я строка columns
+    merged = pd.DataFrame(columns, dtype=object).merge(
+        current, left_on='code', right_index=True, how='left', suffixes=('', '_db'), indicator=True
+    )
+    inserted = (merged['_merge'] == 'left_only').to_numpy()
+
+    changed = np.zeros(len(merged), dtype=bool)
+    for name in PRICE_IMPORT_FIELDS:
+        field = Price._meta.get_field(name)
+        if isinstance(field, models.DecimalField):
+            new = stored_decimals(field, np.array(columns[name], dtype=np.float64))
+            changed |= new != merged[f'{name}_db'].to_numpy(dtype=np.float64)
+        else:
+            changed |= merged[name].to_numpy() != merged[f'{name}_db'].to_numpy()
+    return inserted, changed & ~inserted
+
+
+def clean_chunk(chunk, stats, seen_codes, existing_codes, price_list, current=None):
+    """Price версии price_list для строк куска, которые нужно записать.
+
+    Сначала чистится только колонка кода: строки без кода, коды, которые уже
+    есть в версии (existing_codes, режим skip), и повторы кода в файле
+    (seen_codes - коды предыдущих кусков) отсеиваются целиком. Остальные
+    колонки чистятся только для оставшихся строк. В режиме upsert
+    existing_codes - None, а current - позиции версии (version_frame): строки
+    сверяются с ними по колонкам, и объекты Price создаются только для новых
+    и изменившихся строк.
+    """
+    reporter = get_reporter()
+    details = reporter.enabled(DETAIL)
+    messages = []  # построчные сообщения для -v 2, в порядке строк
+
+    df = price_frame(chunk)
+    code = text_column(df['code'])
+    missing = code == ''
+    # Строка без кода - ошибка, если в ней заполнено хоть что-то; пустые строки пропускаются молча
+    no_code = missing[missing].index[filled_cells(df[missing]).any(axis=1)]
+    errors = [(row_idx, f"Строка {row_idx}: отсутствует код") for row_idx in no_code]
+    candidates = code[~missing]
+
+    if existing_codes is not None:
+        # Повтор кода, добавленного выше в этом же файле, - тоже «уже существует»
+        exists = in_codes(candidates, existing_codes) | candidates.duplicated()
+        stats['exists'] += int(exists.sum())
+        if details:
+            messages.extend(
+                (row_idx, 'price_exists', f"⏩ Пропуск: код {value} уже существует", 'blue', value)
+                for row_idx, value in candidates[exists].items()
+            )
+        candidates = candidates[~exists]
+
+    duplicate = candidates.duplicated() | in_codes(candidates, seen_codes)
+    for row_idx, value in candidates[duplicate].items():
+        errors.append((row_idx, f"Строка {row_idx}: дублирующийся код в файле ({value})"))
+        if details:
+            messages.append(
+                (row_idx, 'price_duplicate', f"⚠️ Пропуск дублирующегося кода в файле: {value}", 'yellow', value)
+            )
+    codes = candidates[~duplicate]
+    seen_codes.update(codes)
+
+    if not len(codes):
+        prices = []
+    elif existing_codes is None:
+        columns = price_columns(df.loc[codes.index])
+        inserted, updated = version_changes(columns, current)
+        write = inserted | updated
+        stats['new'] += int(inserted.sum())
+        stats['updated'] += int(updated.sum())
+        stats['unchanged'] += len(codes) - int(write.sum())
+        prices = build_prices({name: list(compress(values, write)) for name, values in columns.items()}, price_list)
+    else:
+        prices = build_prices(price_columns(df.loc[codes.index]), price_list)
+
+    if existing_codes is not None:
+        for price in prices:
+            price.fill_match_keys()
+        existing_codes.update(codes)
+        stats['new'] += len(prices)
+        if details:
+            messages.extend(
+                (row_idx, 'price_added', f"✅ Добавлен: {price.code} (артикул: {price.article or 'нет'})", 'green',
+                 price.code)
+                for row_idx, price in zip(codes.index, prices)
+            )
+
+    stats['errors'].extend(message for _, message in sorted(errors, key=itemgetter(0)))
+    for row_idx, event, text, color, value in sorted(messages, key=itemgetter(0)):
+        reporter.detail(event, text, color, row=row_idx, code=value)
+    return prices
+
+
+def import_price_file(filepath, mode='skip', valid_from=None, reader='auto'):
+    """Загружает файл прайса в версию с датой valid_from (по умолчанию - из имени файла).
+
+    Весь файл - одна транзакция: при ошибке не остаётся ни половины позиций,
+    ни пустой версии прайса. Возвращает stats (new/exists/updated/unchanged/errors)
+    или None, если файл не загружен; ошибки выводятся через reporter.
+    """
+    reporter = get_reporter()
+    filename = os.path.basename(filepath)
+    reporter.info('file_started', f"\nОбработка файла: {filename}", 'cyan', attrs=['bold'], file=filename)
+
+    valid_from = valid_from or price_list_date(filename)
+    if valid_from is None:
+        reporter.error(
+            'file_failed', "❌ В имени файла нет даты прайса (price_ДД-ММ-ГГГГ): укажите --valid-from",
+            file=filename
+        )
+        return None
+
+    def on_fallback(name, error):
+        reporter.info(
+            'reader_fallback', f"↪️ Читатель {name} не справился ({error}), пробуем следующий", 'yellow',
+            file=filename, reader=name, error=str(error)
+        )
+
+    content_hash = file_sha256(filepath)
+    upsert = mode == 'upsert'
+    stats = {'new': 0, 'exists': 0, 'updated': 0, 'unchanged': 0, 'errors': []}
+    seen_codes = set()
+    progress = reporter.progress(filename)
+    try:
+        with transaction.atomic():
+            price_list, created = PriceList.objects.get_or_create(
+                valid_from=valid_from, defaults={'name': filename}
+            )
+            reporter.info(
+                'price_list', f"💲 {price_list}{' (новая версия)' if created else ''}", 'cyan',
+                file=filename, price_list=price_list.pk, valid_from=valid_from, created=created
+            )
+            # В режиме upsert нужны сами позиции версии - с ними сверяется каждый кусок;
+            # коды в файле не повторяются, так что записанные куски сверку не меняют
+            if upsert:
+                existing_codes, current = None, version_frame(price_list)
+            else:
+                existing_codes = set(Price.objects.filter(price_list=price_list).values_list('code', flat=True))
+                current = None
+            rows = iter_price_rows(filepath, reader, progress, on_fallback)
+            for chunk in batched(rows, CHUNK_SIZE):
+                prices = clean_chunk(chunk, stats, seen_codes, existing_codes, price_list, current)
+                if upsert:
+                    Price.objects.upsert(prices)
+                else:
+                    Price.objects.bulk_create(prices)
+                progress.advance(len(chunk))
+            price_list.content_hash = content_hash
+            price_list.save(update_fields=['content_hash'])
+    except PriceReadError as e:
+        reporter.error('file_failed', f"❌ Ошибка чтения файла: {e}", file=filename, error=str(e))
+        return None
+    except Exception as e:
+        reporter.error('file_failed', f"🔥 Ошибка при сохранении в БД: {e}", file=filename, error=str(e))
+        return None
+    progress.finish()
+
+    if upsert:
+        counts = f"Обновлено: {stats['updated']}\nБез изменений: {stats['unchanged']}\n"
+    else:
+        counts = f"Пропущено существующих: {stats['exists']}\n"
+    reporter.info(
+        'file_summary',
+        f"\nИтоги по файлу {filename}:\n"
+        f"Добавлено новых: {stats['new']}\n"
+        f"{counts}"
+        f"Ошибок: {len(stats['errors'])}",
+        'cyan',
+        file=filename, mode=mode, new=stats['new'], exists=stats['exists'],
+        updated=stats['updated'], unchanged=stats['unchanged'], errors=len(stats['errors'])
+    )
+
+    if stats['errors']:
+        reporter.info('file_errors', "\nПоследние ошибки:", 'yellow', file=filename)
+        for err in stats['errors'][:5]:
+            reporter.info('file_error', f"• {err}", 'red', file=filename)
+    return stats
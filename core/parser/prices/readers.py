@@ -0,0 +1,192 @@
+# parser/prices/readers.py
+"""Читатели прайсов: строки листа без заголовка в одном виде для всех форматов.
+
+Читатель - функция (путь, progress) -> итератор (номер строки, значения первых
+PRICE_COLUMNS ячеек). Пустые ячейки - None, целые числа - int, как у openpyxl,
+поэтому разбор строк (parser.prices.importer) от читателя не зависит.
+progress (parser.reporting.Progress) получает число строк, если оно известно
+заранее. Прочитанный до конца лист сохраняется в parser.sheet_cache, и повторное
+чтение того же файла берёт строки оттуда. Модуль не обращается к Django.
+"""
+import os
+import time
+from importlib import metadata
+from xml.etree.ElementTree import ParseError
+
+import xlrd
+from openpyxl import load_workbook
+
+from parser import sheet_cache, xlsx_stream
+from parser.xlsx_stream import UnsupportedWorkbook, XlsxStreamReader
+
+# Код, тип, артикул, наименование, цена 1, цена 2, остаток, количество, цена за единицу
+PRICE_COLUMNS = 9
+# Версия функций-читателей ниже: увеличивается, если меняются отдаваемые ими значения
+READERS_VERSION = 1
+
+
+class PriceReadError(Exception):
+    """Файл прайса не удалось прочитать"""
+
+
+def stream_rows(filepath, progress=None):
+    """xlsx без openpyxl (parser.xlsx_stream); на необычных книгах - UnsupportedWorkbook"""
+    for row_index, values in XlsxStreamReader(filepath, max_columns=PRICE_COLUMNS):
+        if row_index > 1:
+            yield row_index, values
+
+
+def openpyxl_rows(filepath, progress=None):
+    """xlsx через openpyxl в режиме read_only: лист не загружается целиком"""
+    wb = load_workbook(filepath, read_only=True, data_only=True)
+    try:
+        # В read_only размер листа берётся из его заголовка и может отсутствовать
+        if progress is not None and wb.active.max_row:
+            progress.total = wb.active.max_row - 1
+        rows = wb.active.iter_rows(min_row=2, max_col=PRICE_COLUMNS, values_only=True)
+        yield from enumerate(rows, start=2)
+    finally:
+        wb.close()
+
+
+def xlrd_rows(filepath, progress=None):
+    """xls через xlrd; формат всё равно держится в памяти целиком"""
+    book = xlrd.open_workbook(filepath, on_demand=True)
+    try:
+        sheet = book.sheet_by_index(0)
+        if progress is not None:
+            progress.total = sheet.nrows - 1
+        for row_idx in range(1, sheet.nrows):
+            cells = sheet.row_slice(row_idx, 0, min(sheet.ncols, PRICE_COLUMNS))
+            yield row_idx + 1, [xls_cell_value(cell) for cell in cells]
+    finally:
+        book.release_resources()
+
+
+def xls_cell_value(cell):
+    if cell.ctype in (xlrd.XL_CELL_EMPTY, xlrd.XL_CELL_BLANK):
+        return None
+    if cell.ctype == xlrd.XL_CELL_NUMBER and cell.value == int(cell.value):
+        return int(cell.value)
+    return cell.value
+
+
+def pandas_rows(filepath, progress=None):
+    """xlsx и xls через pandas.read_excel.
+
+    dtype=object: pandas не выводит тип колонки (код не превращается в float
+    из-за пустых ячеек), значения остаются такими, какими их отдал движок;
+    пустыми считаются только пустые ячейки, а не строки вроде 'n/a' и 'NULL'.
+    """
+    import pandas as pd
+
+    df = pd.read_excel(
+        filepath, header=None, skiprows=1, usecols=range(PRICE_COLUMNS), dtype=object,
+        keep_default_na=False, na_values=['']
+    )
+    if progress is not None:
+        progress.total = len(df)
+    df = df.where(df.notna(), None)
+    for position, values in enumerate(df.itertuples(index=False, name=None)):
+        yield position + 2, values
+
+
+READERS = {
+    'stream': stream_rows,
+    'openpyxl': openpyxl_rows,
+    'xlrd': xlrd_rows,
+    'pandas': pandas_rows,
+}
+# Читатели по расширению, от быстрого к медленному (см. load_prices2 --benchmark-readers).
+# Следующий берётся, если предыдущий не справился с книгой (UnsupportedWorkbook).
+# pandas читает тем же openpyxl/xlrd, но медленнее - только по явному выбору.
+ROUTES = {
+    '.xlsx': ('stream', 'openpyxl'),
+    '.xls': ('xlrd',),
+}
+
+
+def reader_key(name):
+    """Ключ читателя для кэша листов: версия наших функций и версия библиотеки"""
+    library = xlsx_stream.VERSION if name == 'stream' else metadata.version(name)
+    return f"price{READERS_VERSION}-{name}-{library}"
+
+
+def readers_for(filepath, reader='auto'):
+    """Имена читателей для файла по порядку; reader - явный выбор или 'auto'"""
+    if reader != 'auto':
+        return (reader,)
+    extension = os.path.splitext(filepath)[1].lower()
+    try:
+        return ROUTES[extension]
+    except KeyError:
+        raise PriceReadError(f"Неизвестный формат прайса: {extension or 'без расширения'}")
+
+
+def iter_price_rows(filepath, reader='auto', progress=None, on_fallback=None):
+    """(номер строки, значения) прайса первым подходящим читателем.
+
+    Если читатель не справился с книгой (UnsupportedWorkbook, например, ячейка
+    с датой посреди листа), следующий продолжает со строки после последней
+    отданной: номера строк у всех читателей - номера строк листа.
+    on_fallback(читатель, ошибка) вызывается при переходе. Прочие ошибки
+    чтения - PriceReadError. Лист, уже прочитанный одним из читателей names,
+    берётся из кэша.
+    """
+    names = readers_for(filepath, reader)
+    try:
+        _, cached, content_hash = sheet_cache.lookup(filepath, [reader_key(name) for name in names])
+    except OSError as e:
+        raise PriceReadError(str(e)) from e
+    if cached is not None:
+        if progress is not None:
+            progress.total = len(cached)
+        yield from cached
+        return
+
+    # Лист пишется в кэш по мере чтения, а сохраняется - под ключом читателя,
+    # который дочитал его до конца
+    writer = sheet_cache.SheetWriter(content_hash)
+    try:
+        last_index = 1
+        for position, name in enumerate(names):
+            try:
+                for row_index, values in READERS[name](filepath, progress):
+                    if row_index <= last_index:
+                        continue
+                    last_index = row_index
+                    writer.add((row_index, values))
+                    yield row_index, values
+                writer.commit(reader_key(name))
+                return
+            except (UnsupportedWorkbook, ParseError) as e:
+                if position == len(names) - 1:
+                    raise PriceReadError(str(e)) from e
+                if on_fallback is not None:
+                    on_fallback(name, e)
+            except Exception as e:
+                raise PriceReadError(str(e)) from e
+    finally:
+        # Недочитанный лист (ошибка чтения, брошенный генератор) в кэш не попадает
+        writer.abort()
+
+
+def benchmark_readers(filepath):
+    """Время полного чтения файла каждым читателем, который его понимает.
+
+    Список словарей reader/rows/seconds/error; строки не разбираются и в БД не пишутся.
+    """
+    extension = os.path.splitext(filepath)[1].lower()
+    names = [*ROUTES.get(extension, ()), 'pandas']
+    results = []
+    for name in names:
+        result = {'reader': name, 'rows': 0, 'seconds': None, 'error': None}
+        started = time.perf_counter()
+        try:
+            for _ in READERS[name](filepath):
+                result['rows'] += 1
+            result['seconds'] = round(time.perf_counter() - started, 3)
+        except Exception as e:
+            result['error'] = str(e)
+        results.append(result)
+    return results
@@ -0,0 +1,190 @@
+# parser/reporting.py
+"""Общий вывод команд загрузки: уровни подробности, строка прогресса и журнал событий.
+
+Уровень берётся из -v/--verbosity команды Django:
+  0 - только ошибки, 1 - файлы, итоги и строка прогресса (по умолчанию),
+  2 - ещё и каждая строка файла, 3 - отладка.
+С --events те же события (с учётом уровня) дописываются в файл JSON Lines:
+одно событие - одна строка с полями ts, event, level, message и данными события.
+Модуль не обращается к Django и может использоваться в процессах-обработчиках.
+"""
+import json
+import sys
+import time
+from contextlib import contextmanager
+
+from termcolor import colored
+
+QUIET, NORMAL, DETAIL, DEBUG = 0, 1, 2, 3
+# Как часто перерисовывать строку прогресса в терминале и печатать её в лог (вывод не в терминал), с
+PROGRESS_INTERVAL = 0.5
+PROGRESS_LOG_INTERVAL = 10
+
+_active = []
+
+
+def add_reporting_arguments(parser):
+    parser.add_argument(
+        '--events',
+        metavar='FILE',
+        help='Дописывать события в файл JSON Lines (для разбора программами)'
+    )
+
+
+def format_duration(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}" if hours else f"{minutes:02d}:{seconds:02d}"
+
+
+class Progress:
+    """Счётчик одной длинной операции: сделано из total, строки и скорость.
+
+    total и done - в единицах unit (файлы, строки, товары); rows - сколько
+    строк обработано, если единица не строка. ETA считается по done/total.
+    """
+
+    def __init__(self, reporter, label, total=None, unit='строк'):
+        self.reporter = reporter
+        self.label = label
+        self.total = total
+        self.unit = unit
+        self.done = 0
+        self.rows = 0
+        self.started = time.perf_counter()
+        self.shown_at = self.started
+
+    def advance(self, done=1, rows=0):
+        self.done += done
+        self.rows += rows
+        self.reporter.show_progress(self)
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def rate(self):
+        elapsed = self.elapsed
+        return (self.rows or self.done) / elapsed if elapsed else 0
+
+    def eta(self):
+        if not self.total or not self.done:
+            return None
+        return self.elapsed * (self.total - self.done) / self.done
+
+    def fields(self):
+        return {
+            'label': self.label, 'done': self.done, 'total': self.total, 'unit': self.unit,
+            'rows': self.rows, 'rate': round(self.rate(), 1), 'seconds': round(self.elapsed, 3),
+        }
+
+    def text(self):
+        done = f"{self.done}/{self.total}" if self.total else f"{self.done}"
+        line = f"⏳ {self.label}: {done} {self.unit}"
+        if self.rows:
+            line += f", {self.rows} строк"
+        line += f" · {self.rate():.0f} {'строк' if self.rows else self.unit}/с"
+        eta = self.eta()
+        if eta is not None:
+            line += f" · осталось ~{format_duration(eta)}"
+        return line
+
+    def finish(self):
+        self.reporter.end_progress()
+        self.reporter.emit('progress_done', level=NORMAL, **self.fields())
+
+
+class Reporter:
+    """Вывод команды: сообщения по уровням, строка прогресса, журнал событий"""
+
+    def __init__(self, verbosity=NORMAL, sink=None, stream=None):
+        self.verbosity = verbosity
+        self.sink = sink
+        self.stream = stream or sys.stdout
+        self.tty = self.stream.isatty()
+        self.progress_line = False  # в терминале сейчас строка прогресса
+
+    def enabled(self, level):
+        return level <= self.verbosity
+
+    def emit(self, event, text=None, color=None, level=NORMAL, attrs=None, **fields):
+        """Сообщение text (если задано) и событие event с полями fields"""
+        if level > self.verbosity:
+            return
+        if text is not None:
+            self.end_progress()
+            self.stream.write(colored(text, color, attrs=attrs) + '\n')
+        if self.sink is not None:
+            record = {'ts': round(time.time(), 3), 'event': event, 'level': level}
+            if text is not None:
+                record['message'] = text.strip()
+            record.update(fields)
+            self.sink.write(json.dumps(record, ensure_ascii=False, default=str) + '\n')
+            if level <= NORMAL:
+                self.sink.flush()
+
+    def info(self, event, text, color=None, attrs=None, **fields):
+        self.emit(event, text, color, NORMAL, attrs, **fields)
+
+    def detail(self, event, text, color=None, **fields):
+        """Построчные сообщения - только с -v 2 и выше"""
+        self.emit(event, text, color, DETAIL, **fields)
+
+    def error(self, event, text, **fields):
+        self.emit(event, text, 'red', QUIET, **fields)
+
+    def progress(self, label, total=None, unit='строк'):
+        return Progress(self, label, total, unit)
+
+    def show_progress(self, progress):
+        """Строка прогресса: в терминале перерисовывается на месте, в лог - изредка"""
+        if not self.enabled(NORMAL):
+            return
+        now = time.perf_counter()
+        interval = PROGRESS_INTERVAL if self.tty else PROGRESS_LOG_INTERVAL
+        if now - progress.shown_at < interval and progress.done != progress.total:
+            return
+        progress.shown_at = now
+        if self.tty:
+            self.stream.write('\r' + progress.text() + '\033[K')
+            self.stream.flush()
+            self.progress_line = True
+        else:
+            self.stream.write(progress.text() + '\n')
+        if self.sink is not None:
+            self.emit('progress', level=NORMAL, **progress.fields())
+
+    def end_progress(self):
+        """Убирает строку прогресса перед обычным сообщением"""
+        if self.progress_line:
+            self.stream.write('\r\033[K')
+            self.progress_line = False
+
+
+def get_reporter():
+    """Reporter выполняющейся команды; вне команды - вывод по умолчанию"""
+    return _active[-1] if _active else Reporter()
+
+
+@contextmanager
+def reporting(options):
+    """Reporter команды на время handle: уровень из -v, журнал событий из --events.
+
+    Команда, вызванная из другой (call_command), без своего --events пишет
+    события в журнал вызвавшей команды.
+    """
+    parent = _active[-1] if _active else None
+    path = options.get('events')
+    if path:
+        sink = open(path, 'a', encoding='utf-8')
+    else:
+        sink = parent.sink if parent else None
+    reporter = Reporter(options.get('verbosity', NORMAL), sink)
+    _active.append(reporter)
+    try:
+        yield reporter
+    finally:
+        reporter.end_progress()
+        _active.pop()
+        if path:
+            sink.close()
@@ -0,0 +1,324 @@
+# parser/sheet_cache.py
+"""Кэш прочитанных листов Excel в колоночном виде (NumPy .npz).
+
+Повторная загрузка того же файла (перезапуск, повтор после ошибки, upsert
+прайса) берёт строки отсюда, а не разбирает XML заново. Ключ - sha256
+содержимого файла и версия читателя: имя читателя, версия его разбора и
+версия библиотеки, так что исправление читателя или обновление openpyxl
+не подсунет старый результат. Лист записывается, только если прочитан
+до конца. Размер папки ограничен CACHE_MAX_BYTES: при переполнении удаляются
+давно не использованные листы (время использования - mtime файла).
+
+Лист пишется и читается кусками по CHUNK_ROWS строк, так что память не
+растёт с размером листа. В куске колонка хранится как массив видов значений
+и отдельные массивы целых, дробных и строк - без pickle. Значения других
+типов (время и т.п.) не кэшируются. Модуль не обращается к Django и работает
+в процессах-обработчиках.
+"""
+import os
+import tempfile
+import zipfile
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from parser.files import file_sha256
+
+CACHE_DIR = 'parser/cache/sheets'
+CACHE_MAX_BYTES = 256 * 1024 * 1024
+# Версия формата .npz; меняется вместе с encode_column/decode_column и раскладкой кусков
+FORMAT_VERSION = 2
+# Строк листа в одном куске .npz: столько держится в памяти при записи и чтении
+CHUNK_ROWS = 5000
+
+NONE, INT, FLOAT, STR, BOOL, DATETIME = range(6)
+EPOCH = datetime(1970, 1, 1)
+MICROSECOND = timedelta(microseconds=1)
+
+_enabled = True
+
+
+class Uncacheable(Exception):
+    """Значение нельзя сохранить в кэш"""
+
+
+def add_cache_arguments(parser):
+    parser.add_argument(
+        '--no-cache',
+        action='store_true',
+        help=f'Не брать прочитанные листы из кэша {CACHE_DIR} и не сохранять их туда'
+    )
+
+
+def configure(options):
+    """Включает или выключает кэш по --no-cache команды.
+
+    Действует на весь процесс и на процессы-обработчики, созданные после через fork.
+    """
+    global _enabled
+    _enabled = not options.get('no_cache')
+
+
+def entry_path(content_hash, reader_key):
+    return os.path.join(CACHE_DIR, f"{content_hash}-{reader_key}-f{FORMAT_VERSION}.npz")
+
+
+def encode_column(values):
+    """Колонка -> (виды, целые, дробные, строки)"""
+    kinds = np.empty(len(values), dtype=np.uint8)
+    ints, floats, strings = [], [], []
+    for i, value in enumerate(values):
+        kind = type(value)
+        if value is None:
+            kinds[i] = NONE
+        elif kind is str:
+            kinds[i] = STR
+            strings.append(value)
+        elif kind is float:
+            kinds[i] = FLOAT
+            floats.append(value)
+        elif kind is int:
+            kinds[i] = INT
+            ints.append(value)
+        elif kind is bool:
+            kinds[i] = BOOL
+            ints.append(int(value))
+        elif kind is datetime and value.tzinfo is None:
+            kinds[i] = DATETIME
+            ints.append((value - EPOCH) // MICROSECOND)
+        else:
+            raise Uncacheable(f"{kind.__name__}: {value!r}")
+    try:
+        ints = np.array(ints, dtype=np.int64)
+    except OverflowError as e:
+        raise Uncacheable(str(e))
+    return kinds, ints, np.array(floats, dtype=np.float64), np.array(strings, dtype=np.str_)
+
+
+def decode_column(kinds, ints, floats, strings):
+    ints, floats, strings = iter(ints.tolist()), iter(floats.tolist()), iter(strings.tolist())
+    values = []
+    for kind in kinds.tolist():
+        if kind == NONE:
+            values.append(None)
+        elif kind == STR:
+            values.append(next(strings))
+        elif kind == FLOAT:
+            values.append(next(floats))
+        elif kind == INT:
+            values.append(next(ints))
+        elif kind == BOOL:
+            values.append(bool(next(ints)))
+        else:
+            values.append(EPOCH + next(ints) * MICROSECOND)
+    return values
+
+
+def encode_chunk(rows):
+    """Кусок строк -> {имя массива: массив}; Uncacheable, если значение не сохранить"""
+    width = max((len(values) for _, values in rows), default=0)
+    arrays = {
+        'rows': np.array([number for number, _ in rows], dtype=np.int64),
+        'lengths': np.array([len(values) for _, values in rows], dtype=np.int64),
+        'columns': np.array(width),
+    }
+    for i in range(width):
+        column = [values[i] if i < len(values) else None for _, values in rows]
+        for name, array in zip(('kinds', 'ints', 'floats', 'strings'), encode_column(column)):
+            arrays[f'{name}{i}'] = array
+    return arrays
+
+
+def decode_chunk(data, prefix):
+    """Строки (номер, значения) куска prefix из открытого .npz"""
+    row_numbers = data[f'{prefix}rows'].tolist()
+    lengths = data[f'{prefix}lengths']
+    columns = [
+        decode_column(*(data[f'{prefix}{name}{i}'] for name in ('kinds', 'ints', 'floats', 'strings')))
+        for i in range(int(data[f'{prefix}columns']))
+    ]
+    rows = list(zip(row_numbers, zip(*columns))) if columns else [(number, ()) for number in row_numbers]
+    # Короткие строки (xlrd отдаёт строку до последней заполненной ячейки) - прежней длины
+    if len(columns) and (lengths != len(columns)).any():
+        rows = [(number, values[:length]) for (number, values), length in zip(rows, lengths.tolist())]
+    return rows
+
+
+class CachedSheet:
+    """Лист из кэша: len() - число строк, строки декодируются по куску при обходе.
+
+    Файл открыт с момента load, поэтому вытеснение листа другим процессом
+    не мешает дочитать его.
+    """
+
+    def __init__(self, data):
+        self.data = data
+        self.chunks = int(data['chunks'])
+        self.count = int(data['count'])
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        try:
+            for n in range(self.chunks):
+                yield from decode_chunk(self.data, f'c{n}_')
+        finally:
+            self.data.close()
+
+
+def load(path):
+    """Лист из кэша (CachedSheet) или None"""
+    try:
+        data = np.load(path, allow_pickle=False)
+    except (OSError, ValueError):
+        return None
+    try:
+        sheet = CachedSheet(data)
+    except (KeyError, ValueError, zipfile.BadZipFile):
+        data.close()
+        return None
+    # Отметка об использовании для вытеснения
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+    return sheet
+
+
+class SheetWriter:
+    """Пишет лист в кэш кусками по мере чтения; в памяти - не больше CHUNK_ROWS строк.
+
+    Лист собирается во временном файле и появляется в кэше только после
+    commit: параллельный читатель не увидит половину. Ошибки записи и
+    значения, которые нельзя сохранить, только отменяют запись в кэш.
+    """
+
+    def __init__(self, content_hash):
+        self.content_hash = content_hash
+        self.active = _enabled and content_hash is not None
+        self.rows = []
+        self.chunks = 0
+        self.count = 0
+        self.tmp_path = None
+        self.archive = None
+
+    def add(self, row):
+        if not self.active:
+            return
+        self.rows.append(row)
+        if len(self.rows) >= CHUNK_ROWS:
+            self.flush()
+
+    def write_arrays(self, arrays):
+        if self.archive is None:
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            fd, self.tmp_path = tempfile.mkstemp(dir=CACHE_DIR, suffix='.tmp')
+            os.close(fd)
+            self.archive = zipfile.ZipFile(self.tmp_path, 'w', compression=zipfile.ZIP_DEFLATED, allowZip64=True)
+        for name, array in arrays.items():
+            with self.archive.open(f'{name}.npy', 'w', force_zip64=True) as f:
+                np.lib.format.write_array(f, np.asanyarray(array), allow_pickle=False)
+
+    def flush(self):
+        try:
+            arrays = encode_chunk(self.rows)
+            self.write_arrays({f'c{self.chunks}_{name}': array for name, array in arrays.items()})
+        except (Uncacheable, OSError):
+            self.abort()
+            return
+        self.chunks += 1
+        self.count += len(self.rows)
+        self.rows = []
+
+    def commit(self, reader_key):
+        """Сохраняет лист, прочитанный до конца, под ключом reader_key и вытесняет старые"""
+        if not self.active:
+            return
+        if self.rows or not self.chunks:
+            self.flush()
+        if not self.active:
+            return
+        try:
+            self.write_arrays({'chunks': np.array(self.chunks), 'count': np.array(self.count)})
+            self.archive.close()
+            os.replace(self.tmp_path, entry_path(self.content_hash, reader_key))
+        except OSError:
+            self.abort()
+            return
+        self.active = False
+        self.archive = self.tmp_path = None
+        evict()
+
+    def abort(self):
+        """Отменяет незавершённую запись: лист не сохраняется (после commit ничего не делает)"""
+        self.active = False
+        self.rows = []
+        if self.archive is not None:
+            try:
+                self.archive.close()
+            except (OSError, ValueError):
+                pass
+        if self.tmp_path is not None and os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+        self.tmp_path = None
+
+
+def evict(max_bytes=None):
+    """Удаляет давно не использованные листы, пока папка больше max_bytes"""
+    max_bytes = CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    try:
+        entries = [entry for entry in os.scandir(CACHE_DIR) if entry.name.endswith('.npz')]
+    except OSError:
+        return
+    stats = []
+    for entry in entries:
+        try:
+            stats.append((entry.stat().st_mtime, entry.stat().st_size, entry.path))
+        except OSError:
+            continue
+    total = sum(size for _, size, _ in stats)
+    for _, size, path in sorted(stats):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= size
+
+
+def lookup(filepath, reader_keys):
+    """Лист файла из кэша: (ключ, строки, sha256) для первого найденного ключа.
+
+    Если листа нет - (None, None, sha256): хэш нужен, чтобы потом сохранить
+    лист через save или recording. При выключенном кэше - (None, None, None).
+    """
+    if not _enabled:
+        return None, None, None
+    content_hash = file_sha256(filepath)
+    for reader_key in reader_keys:
+        rows = load(entry_path(content_hash, reader_key))
+        if rows is not None:
+            return reader_key, rows, content_hash
+    return None, None, content_hash
+
+
+def save(content_hash, reader_key, rows):
+    """Сохраняет лист, прочитанный до конца (ничего не делает без хэша из lookup)"""
+    writer = SheetWriter(content_hash)
+    for row in rows:
+        writer.add(row)
+    writer.commit(reader_key)
+
+
+def recording(rows, content_hash, reader_key):
+    """Отдаёт строки как есть и пишет лист в кэш по мере чтения; сохраняет, когда он прочитан до конца"""
+    writer = SheetWriter(content_hash)
+    try:
+        for row in rows:
+            writer.add(row)
+            yield row
+        writer.commit(reader_key)
+    finally:
+        writer.abort()
@@ -0,0 +1,81 @@
+# parser/tests/test_ingest.py
+import os
+import shutil
+import tempfile
+
+from django.test import TestCase, override_settings
+
+from parser.files import file_sha256
+from parser.ingest import find_duplicates, ingest_file, sync_ledger
+from parser.models import ExcelFile, IngestionRecord, Product
+from parser.reporting import reporting
+
+
+class DuplicateFileTests(TestCase):
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media)
+        settings = override_settings(MEDIA_ROOT=self.media)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+        # Содержимое файла здесь не читается: строки передаются готовыми, как из пула
+        self.path = os.path.join(self.media, 'page.xlsx')
+        with open(self.path, 'wb') as f:
+            f.write(b'invoice page')
+        self.content_hash = file_sha256(self.path)
+
+    def ingest(self, filename):
+        record = sync_ledger({filename: self.content_hash})[filename]
+        parsed = {
+            'filepath': self.path, 'rows': [(2, f'100 AB-1 Товар из {filename}', 1.0, 10.0)],
+            'errors': [], 'messages': [], 'error': None, 'reader': 'test', 'row_count': 1, 'seconds': 0.001,
+        }
+        with reporting({'verbosity': 0}):
+            result = ingest_file(record, parsed)
+        record.refresh_from_db()
+        return record, result
+
+    def test_same_name_is_skipped(self):
+        _, (first, _) = self.ingest('500_01-06-2025_1.xlsx')
+        IngestionRecord.objects.all().delete()
+
+        record, result = self.ingest('500_01-06-2025_1.xlsx')
+        self.assertIsNone(result)
+        self.assertEqual((record.state, record.excel_file), ('done', first))
+        self.assertEqual(ExcelFile.objects.count(), 1)
+        self.assertEqual(Product.objects.count(), 1)
+
+    def test_same_content_under_other_name_is_loaded(self):
+        _, (first, _) = self.ingest('500_01-06-2025_1.xlsx')
+        for filename, ttn_number, page in [('501_01-06-2025_1.xlsx', '501', 1), ('500_01-06-2025_2.xlsx', '500', 2)]:
+            record, result = self.ingest(filename)
+            self.assertIsNotNone(result)
+            excel_file = ExcelFile.objects.get(pk=result[0].pk)
+            self.assertEqual((record.state, record.excel_file), ('done', excel_file))
+            self.assertEqual((excel_file.ttn.number, excel_file.page_number), (ttn_number, page))
+            self.assertEqual(excel_file.products.get().name, f'100 AB-1 Товар из {filename}')
+            # В хранилище один файл на содержимое
+            self.assertEqual(excel_file.file.name, first.file.name)
+
+        self.assertEqual(ExcelFile.objects.count(), 3)
+        self.assertEqual(len(os.listdir(os.path.dirname(first.file.path))), 1)
+
+    def test_find_duplicates_keys(self):
+        self.ingest('500_01-06-2025_1.xlsx')
+        excel_file = ExcelFile.objects.get()
+        hashes = {
+            '500_01-06-2025_1.xlsx': self.content_hash,
+            '500_02-06-2025_1.xlsx': self.content_hash,  # та же ТТН и страница, другая дата
+            '500_01-06-2025_2.xlsx': self.content_hash,
+            '501_01-06-2025_1.xlsx': self.content_hash,
+            '500_01-06-2025_01.xlsx': '0' * 64,
+            'not-an-invoice.xlsx': self.content_hash,
+        }
+        self.assertEqual(
+            find_duplicates(hashes),
+            {'500_01-06-2025_1.xlsx': excel_file, '500_02-06-2025_1.xlsx': excel_file}
+        )
+
+        ExcelFile.objects.update(processed=False)
+        self.assertEqual(find_duplicates(hashes), {})
@@ -0,0 +1,150 @@
+# parser/tests/test_invoices.py
+import math
+import random
+
+from django.test import SimpleTestCase
+
+from parser.invoices import validate_invoice_rows
+
+
+# Построчная проверка, как она была в load_excels до проверки по колонкам;
+# скопирована сюда, чтобы эталон не менялся вместе с parser.invoices
+def baseline_strict_float_conversion(value, row_index, field_name):
+    if value is None:
+        raise ValueError(f"Пустое значение в поле {field_name} (строка {row_index})")
+
+    original_value = str(value).strip()
+    if not original_value:
+        raise ValueError(f"Пустое значение в поле {field_name} (строка {row_index})")
+
+    try:
+        cleaned_value = original_value.replace(',', '.').replace(' ', '')
+        return float(cleaned_value)
+    except ValueError:
+        raise ValueError(
+            f"Невозможно преобразовать '{original_value}' в число "
+            f"(строка {row_index}, поле {field_name})"
+        )
+
+
+def baseline_validate_price_quantity_total(row, row_index):
+    try:
+        quantity = baseline_strict_float_conversion(row[2], row_index, "Количество")
+        price = baseline_strict_float_conversion(row[3], row_index, "Цена")
+        total = baseline_strict_float_conversion(row[4], row_index, "Стоимость")
+
+        calculated_price = total / quantity if quantity != 0 else 0
+        if not math.isclose(price, calculated_price, rel_tol=1e-4):
+            raise ValueError(
+                f"Несоответствие цены и стоимости (строка {row_index}): "
+                f"цена={price}, но {total}/{quantity}≈{calculated_price:.2f}"
+            )
+    except (ValueError, ZeroDivisionError) as e:
+        raise ValueError(f"Ошибка проверки цены/стоимости: {e}")
+
+
+def baseline_validate_header_row(row):
+    expected_headers = ['1', '2', '3', '4']
+    return all(str(cell).strip() == expected_headers[i] for i, cell in enumerate(row[:4]) if cell)
+
+
+def baseline_validate(rows):
+    """(принятые строки, ошибки, сообщения) построчной проверки"""
+    accepted, errors, messages = [], [], []
+    for row_index, row in rows:
+        if not any(row[:4]):
+            continue
+
+        if baseline_validate_header_row(row):
+            messages.append((row_index, f" ⚠️ Пропущена строка с номерами колонок (строка {row_index})"))
+            continue
+
+        try:
+            name = str(row[0]).strip() if row[0] else None
+            if not name:
+                raise ValueError(f"Пустое наименование товара (строка {row_index})")
+
+            quantity = baseline_strict_float_conversion(row[2], row_index, "Количество")
+            price = baseline_strict_float_conversion(row[3], row_index, "Цена")
+
+            if len(row) > 4 and row[4]:
+                baseline_validate_price_quantity_total(row, row_index)
+
+            accepted.append((row_index, name, quantity, price))
+        except Exception as e:
+            messages.append((row_index, f"❌ ОШИБКА ВАЛИДАЦИИ (строка {row_index}): {e}"))
+            messages.append((row_index, f"    Содержимое строки: {row[:5]}"))
+            errors.append(f"Строка {row_index}: {e}")
+    return accepted, errors, messages
+
+
+def comparable(rows):
+    """Строки с float через repr: nan != nan, а 1 и 1.0 должны различаться"""
+    return [tuple(repr(value) if isinstance(value, float) else value for value in row) for row in rows]
+
+
+NAMES = ['Товар 1 арт-1', '  Товар с пробелами  ', None, '', '   ', 0, 5, 1.5, True, False, '1']
+NUMBERS = [
+    None, '', '   ', 0, 1, 2.5, -3, 10 ** 20, 1e-9, True, False,
+    '1,5', ' 2 ', '1 000', '1_000', '1__0', '_1', '1e3', '1,5e2', '0', '0,0', '-0',
+    'nan', 'NaN', '-nan', 'inf', '-Infinity', 'infinity', float('nan'), float('inf'), float('-inf'),
+    'abc', '1.2.3', '1,2,3', '١٢', '½', '0x10', '+5', '.5', '5.',
+]
+
+
+class ValidateInvoiceRowsTests(SimpleTestCase):
+    def assertSameAsBaseline(self, rows):
+        result = {'rows': [], 'errors': [], 'messages': [], 'row_count': 0}
+        validate_invoice_rows(rows, result)
+        accepted, errors, messages = baseline_validate(rows)
+
+        self.assertEqual(comparable(result['rows']), comparable(accepted))
+        self.assertEqual(result['errors'], errors)
+        self.assertEqual([(row_index, text) for row_index, _, _, text, _ in result['messages']], messages)
+        self.assertEqual(result['row_count'], len(rows))
+
+    def test_examples(self):
+        rows = [
+            (1, ('1', '2', '3', '4', '5')),
+            (2, (None, '2', '3', '4')),
+            (3, ('Товар 1 арт-1', None, '1,5', '2', '3')),
+            (4, ('Товар 2', None, '1_000', '1', '1000')),
+            (5, ('Товар 3', None, 2, '1 000,5', 2001)),
+            (6, ('Товар 4', None, 'nan', 1, None)),
+            (7, ('Товар 5', None, 'inf', 1, 5)),
+            (8, ('Товар 6', None, True, 1.5, 1.5)),
+            (9, ('Товар 7', None, 0, 1, 5)),
+            (10, ('Товар 8', None, 2, 1, 'abc')),
+            (11, ('Товар 9', None, 3)),
+            (12, ('Товар 10',)),
+            (13, (None, None, None, None, 7)),
+            (14, ('', 'x', 1, 1)),
+            (15, ('Товар 11', None, 3, 1, 3.0003)),
+            (16, ('Товар 12', None, 3, 1, 3.01)),
+            # Граница допуска rel_tol=1e-4
+            (17, ('Товар 13', None, 3, 1, 3.0006)),
+            (18, ('Товар 14', None, 3, '1,0001', 3)),
+            (19, ('Товар 15', None, 0, 0, 5)),
+            (20, ('Товар 16', None, 1, 'inf', 'inf')),
+            (21, ('Товар 17', None, 'inf', 0, 'inf')),
+        ]
+        self.assertSameAsBaseline(rows)
+
+    def test_random_rows(self):
+        rnd = random.Random(16)
+        for length in range(0, 7):
+            with self.subTest(length=length):
+                rows = []
+                for row_index in range(1, 400):
+                    row = [rnd.choice(NAMES)] + [rnd.choice(NUMBERS) for _ in range(5)]
+                    if rnd.random() < 0.3 and all(type(value) in (int, float) for value in row[2:4]):
+                        # Стоимость - произведение, чтобы проверка цены чаще проходила
+                        row[4] = row[2] * row[3]
+                    rows.append((row_index, tuple(row[:length])))
+                self.assertSameAsBaseline(rows)
+
+    def test_all_numeric_columns(self):
+        # Быстрый путь float_column: все ячейки уже числа
+        rows = [(i, (f"Товар {i}", None, i, 1.25, i * 1.25)) for i in range(1, 200)]
+        rows.append((200, ('Товар 200', None, 4, 1.25, 6)))
+        self.assertSameAsBaseline(rows)
@@ -0,0 +1,233 @@
+# parser/tests/test_prices.py
+import io
+import os
+import random
+import shutil
+import tempfile
+from contextlib import redirect_stdout
+from datetime import date, timedelta
+from decimal import Context, Decimal
+from unittest import mock
+
+import numpy as np
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
+from django.utils import timezone
+from openpyxl import Workbook
+
+from parser import sheet_cache
+from parser.management.commands import watch_input
+from parser.models import Price, PriceList
+from parser.prices.importer import PRICE_FIELDS, clean_chunk, stored_decimals, version_frame
+from parser.reporting import reporting
+
+
+def row(code, **values):
+    """Строка файла прайса: значения ячеек в порядке PRICE_FIELDS"""
+    cells = {
+        'code': code, 'type': 'Тип', 'article': f'ART-{code}', 'name': f'Товар {code}', 'price1': 10,
+        'price2': None, 'stock': 'есть', 'quantity': 1, 'price_clear': 9.5,
+    }
+    cells.update(values)
+    return tuple(cells[field] for field in PRICE_FIELDS)
+
+
+class PriceUpsertTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.price_list = PriceList.objects.create(valid_from=date(2025, 8, 1))
+        cls.other_list = PriceList.objects.create(valid_from=date(2025, 9, 1))
+
+    def upsert(self, *rows, price_list=None):
+        """Кусок строк в режиме upsert, как в import_price_file; (вставлено, обновлено, без изменений)"""
+        stats = {'new': 0, 'exists': 0, 'updated': 0, 'unchanged': 0, 'errors': []}
+        price_list = price_list or self.price_list
+        current = version_frame(price_list)
+        prices = clean_chunk(list(enumerate(rows, start=2)), stats, set(), None, price_list, current)
+        Price.objects.upsert(prices)
+        self.assertEqual(len(prices), stats['new'] + stats['updated'])
+        return stats['new'], stats['updated'], stats['unchanged']
+
+    def stored(self, code, field):
+        return Price.objects.filter(price_list=self.price_list, code=code).values_list(field, flat=True).get()
+
+    def test_counts(self):
+        self.assertEqual(self.upsert(), (0, 0, 0))
+        self.assertEqual(self.upsert(row('1'), row('2')), (2, 0, 0))
+        self.assertEqual(self.upsert(row('1'), row('2', name='Новое имя'), row('3')), (1, 1, 1))
+        self.assertEqual(Price.objects.filter(price_list=self.price_list).count(), 3)
+        updated = Price.objects.get(price_list=self.price_list, code='2')
+        self.assertEqual(updated.name, 'Новое имя')
+        self.assertEqual(updated.name_tokens, 'новое имя')
+
+    def test_versions_are_separate(self):
+        self.upsert(row('1'))
+        self.assertEqual(self.upsert(row('1', price1=11), price_list=self.other_list), (1, 0, 0))
+        self.assertEqual(self.stored('1', 'price1'), Decimal('10.00'))
+
+    def test_decimal_compared_at_stored_precision(self):
+        self.upsert(row('1'), row('2'), row('3', price1=12.345))
+        self.assertEqual(self.stored('3', 'price1'), Decimal('12.34'))
+        # 10,004 и 10.0 в БД - те же 10.00; 9.505 и 12.345 - половина, к чётному: 9.50 и 12.34
+        self.assertEqual(
+            self.upsert(
+                row('1', price1='10,004', price_clear=9.505),
+                row('2', price1=10.0, quantity='1'),
+                row('3', price1=12.345),
+            ),
+            (0, 0, 3)
+        )
+        self.assertEqual(self.upsert(row('3', price1='12,34')), (0, 0, 1))
+        self.assertEqual(self.upsert(row('1', price1='10,006'), row('3', price1=12.355)), (0, 2, 0))
+        self.assertEqual(self.stored('1', 'price1'), Decimal('10.01'))
+        self.assertEqual(self.stored('3', 'price1'), Decimal('12.36'))
+
+    def test_none_differs_from_value(self):
+        # Позиция, записанная до импорта по колонкам: price2 пустой
+        Price.objects.create(
+            price_list=self.price_list, code='1', type='Тип', article='ART-1', name='Товар 1',
+            price1=Decimal('10.00'), price2=None, stock='есть', quantity=1, price_clear=Decimal('9.50')
+        )
+        self.assertEqual(self.upsert(row('1')), (0, 1, 0))
+        self.assertEqual(self.stored('1', 'price2'), Decimal('0.00'))
+        self.assertEqual(self.upsert(row('1', article=None)), (0, 1, 0))
+        self.assertIsNone(self.stored('1', 'article'))
+        self.assertEqual(self.upsert(row('1', article='')), (0, 0, 1))
+
+    def test_unchanged_rows_keep_updated_at(self):
+        self.upsert(row('1'), row('2'))
+        # Сдвигаем updated_at в прошлое, чтобы любое сохранение было заметно
+        old = timezone.now() - timedelta(days=1)
+        Price.objects.update(updated_at=old)
+
+        self.assertEqual(self.upsert(row('1'), row('2', stock='нет')), (0, 1, 1))
+        self.assertEqual(Price.objects.get(code='1').updated_at, old)
+        self.assertGreater(Price.objects.get(code='2').updated_at, old)
+
+
+class StoredDecimalsTests(SimpleTestCase):
+    def test_same_as_decimal_field(self):
+        field = Price._meta.get_field('price1')
+        rnd = random.Random(25)
+        values = [12.345, 9.505, 10.005, 2.675, 0.0, -0.0, 1e-300, 1234567.8945, -4.125]
+        for _ in range(2000):
+            values.append(round(rnd.uniform(-1e6, 1e6), rnd.choice([2, 3, 4])))
+            # Ровно половина копейки до и после округления float
+            values.append(rnd.randint(0, 10 ** 7) / 100 + 0.005)
+        expected = [float(field.to_python(value).quantize(Decimal('0.01'))) for value in values]
+        self.assertEqual(stored_decimals(field, np.array(values)).tolist(), expected)
+
+        # Чтение из SQLite: Decimal из 15 значащих цифр
+        read = Context(prec=15).create_decimal_from_float
+        expected = [float(read(value).quantize(Decimal('0.01'))) for value in values]
+        self.assertEqual(stored_decimals(field, np.array(values), digits=15).tolist(), expected)
+
+    def test_not_finite(self):
+        field = Price._meta.get_field('price1')
+        stored = stored_decimals(field, np.array([float('inf'), float('-inf'), float('nan'), 1.0]))
+        self.assertTrue(np.isnan(stored[:3]).all())
+        self.assertEqual(stored[3], 1.0)
+
+
+class PriceListInEffectTests(TestCase):
+    def test_version_in_effect(self):
+        self.assertIsNone(PriceList.objects.in_effect(date(2025, 8, 1)))
+        april = PriceList.objects.create(valid_from=date(2025, 4, 22))
+        june = PriceList.objects.create(valid_from=date(2025, 6, 24))
+
+        self.assertEqual(PriceList.objects.in_effect(date(2025, 4, 22)), april)
+        self.assertEqual(PriceList.objects.in_effect(date(2025, 6, 23)), april)
+        self.assertEqual(PriceList.objects.in_effect(date(2025, 8, 1)), june)
+        # Раньше всех версий: более поздний прайс не подставляется
+        self.assertIsNone(PriceList.objects.in_effect(date(2025, 4, 21)))
+
+
+class WatchPriceFileTests(TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.addCleanup(sheet_cache.configure, {})
+        self.path = os.path.join(directory, 'price_01-08-2025.xlsx')
+        self.write_prices([row('100'), row('200')])
+
+        self.command = watch_input.Command()
+        self.command.price_mode = 'upsert'
+        self.command.no_cache = True
+
+    def write_prices(self, rows):
+        workbook = Workbook()
+        workbook.active.append(PRICE_FIELDS)
+        for values in rows:
+            workbook.active.append(values)
+        workbook.save(self.path)
+
+    def load(self):
+        """Загружает прайс как watch_input; возвращает, дошло ли до импорта"""
+        # Ошибки импорта печатаются и при -v 0
+        with redirect_stdout(io.StringIO()), reporting({'verbosity': 0}) as reporter, \
+                mock.patch.object(watch_input, 'call_command', wraps=watch_input.call_command) as spy:
+            self.command.reporter = reporter
+            self.command.load_prices(self.path)
+        return spy.called
+
+    def test_unchanged_file_is_not_imported_again(self):
+        self.assertTrue(self.load())
+        price_list = PriceList.objects.get(valid_from=date(2025, 8, 1))
+        self.assertEqual(len(price_list.content_hash), 64)
+        self.assertEqual(price_list.prices.count(), 2)
+
+        # Перезапуск watch_input: файл тот же - импорт не нужен
+        self.assertFalse(self.load())
+
+        self.write_prices([row('100'), row('200'), row('300')])
+        self.assertTrue(self.load())
+        self.assertEqual(price_list.prices.count(), 3)
+        self.assertFalse(self.load())
+
+    def test_failed_import_keeps_previous_hash(self):
+        self.load()
+        previous = PriceList.objects.get().content_hash
+        with open(self.path, 'wb') as f:
+            f.write(b'not a workbook')
+        self.assertTrue(self.load())
+        self.assertEqual(PriceList.objects.get().content_hash, previous)
+        self.assertTrue(self.load())
+
+
+class DropDuplicateCodesMigrationTests(TransactionTestCase):
+    """0008 удаляет повторы кодов перед уникальным индексом; откатывается без восстановления"""
+
+    def migrate(self, target):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate([('parser', target)])
+        return executor.loader.project_state([('parser', target)]).apps
+
+    def setUp(self):
+        super().setUp()
+        self.addCleanup(lambda: self.migrate(MigrationExecutor(connection).loader.graph.leaf_nodes('parser')[0][1]))
+        apps = self.migrate('0007_product_totals_in_db')
+        OldPrice = apps.get_model('parser', 'Price')
+        self.ids = {}
+        for code, name in [('1', 'первая'), ('2', 'единственная'), ('1', 'повтор'), (None, 'без кода'),
+                           (None, 'без кода 2'), ('1', 'ещё повтор')]:
+            self.ids.setdefault(code, []).append(OldPrice.objects.create(
+                code=code, name=name, price1=1, price_clear=1, stock='', quantity=0
+            ).id)
+
+    def remaining(self, apps):
+        return sorted(apps.get_model('parser', 'Price').objects.values_list('id', 'name'))
+
+    def test_keeps_first_row_per_code(self):
+        apps = self.migrate('0008_price_code_unique')
+        self.assertEqual(
+            self.remaining(apps),
+            sorted([(self.ids['1'][0], 'первая'), (self.ids['2'][0], 'единственная'),
+                    (self.ids[None][0], 'без кода'), (self.ids[None][1], 'без кода 2')])
+        )
+
+    def test_reverse_does_not_restore_rows(self):
+        self.migrate('0008_price_code_unique')
+        apps = self.migrate('0007_product_totals_in_db')
+        self.assertEqual(len(self.remaining(apps)), 4)
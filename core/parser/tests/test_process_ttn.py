@@ -0,0 +1,192 @@
+# parser/tests/test_process_ttn.py
+import logging
+from datetime import date
+from decimal import Decimal
+from unittest import mock
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from parser.management.commands import process_ttn
+from parser.matching import catalog_version, clear_index_cache, match_products
+from parser.models import TTN, ExcelFile, FinalSample, Invoice, MatchMemory, Price, PriceList, Product
+
+# Полное совпадение, частичное по артикулу, по тексту и без совпадений
+PRODUCT_NAMES = [
+    '100 AB-1 Болт стальной',
+    '200 CDX-9 Гайка латунная',
+    '300 ZZZ шайба пружинная',
+    '999 XX Неизвестный товар',
+]
+
+
+class ProcessTTNMixin:
+    @classmethod
+    def setUpTestData(cls):
+        cls.price_list = PriceList.objects.create(valid_from=date(2025, 1, 1))
+        for code, article, name in [('100', 'AB-1', 'Болт стальной'), ('200', 'CD-2', 'Гайка латунная'),
+                                    ('300', 'EF-3', 'Шайба пружинная')]:
+            cls.add_price(code, article, name)
+        cls.ttn = cls.make_ttn('900', PRODUCT_NAMES)
+
+    @classmethod
+    def add_price(cls, code, article, name):
+        return Price.objects.create(
+            price_list=cls.price_list, code=code, type='Тип', article=article, name=name,
+            price1=Decimal('10.00'), stock='есть', quantity=1, price_clear=Decimal('9.00')
+        )
+
+    @classmethod
+    def make_ttn(cls, number, names):
+        ttn = TTN.objects.create(number=number, date=date(2025, 6, 1))
+        invoice = Invoice.objects.create(number=f'{number}-1', date=date(2025, 6, 1), ttn=ttn)
+        excel_file = ExcelFile.objects.create(file=f'uploads/{number}.xlsx', invoice=invoice, ttn=ttn)
+        for name in names:
+            Product.objects.create(invoice=invoice, excel_file=excel_file, ttn=ttn, name=name, quantity=2, price=5)
+        return ttn
+
+    def setUp(self):
+        super().setUp()
+        # Индексы прайса кэшируются в процессе по id версии, а id в тестах повторяются
+        clear_index_cache()
+        self.addCleanup(clear_index_cache)
+        # Команда пишет подробный лог в файл репозитория
+        logging.disable(logging.WARNING)
+        self.addCleanup(logging.disable, logging.NOTSET)
+
+    def run_ttn(self, number='900', **options):
+        """Запускает process_ttn; возвращает названия товаров, которые пришлось сопоставлять"""
+        with mock.patch.object(process_ttn, 'match_products', wraps=match_products) as spy:
+            call_command('process_ttn', ttn_numbers=[number], verbosity=0, **options)
+        return [name for call in spy.call_args_list for _, name in call.args[0]]
+
+    def samples(self, number='900'):
+        """{название товара: (id строки, статус)}"""
+        return {
+            name: (sample_id, status)
+            for sample_id, name, status in FinalSample.objects.filter(ttn_number=number)
+            .values_list('id', 'product_name', 'match_status')
+        }
+
+    def statuses(self, number='900'):
+        return {name: status for name, (_, status) in self.samples(number).items()}
+
+
+class MatchMemoryTests(ProcessTTNMixin, TestCase):
+    def test_first_run_fills_memory(self):
+        self.assertEqual(self.run_ttn(), PRODUCT_NAMES)
+        self.assertEqual(
+            self.statuses(),
+            dict(zip(PRODUCT_NAMES, ['full', 'partial', 'textual', 'none']))
+        )
+        version = catalog_version(self.price_list)
+        self.assertEqual(MatchMemory.objects.filter(catalog_version=version).count(), len(PRODUCT_NAMES))
+        self.assertIsNone(MatchMemory.objects.get(match_status='none').price_id)
+
+    def test_same_products_come_from_memory(self):
+        self.run_ttn()
+        # Те же названия (с другим регистром и пробелами - ключ тот же) в другой TTN
+        self.make_ttn('901', [name.upper() if i == 0 else f'  {name}' for i, name in enumerate(PRODUCT_NAMES)])
+        self.assertEqual(self.run_ttn('901'), [])
+        self.assertEqual(list(self.statuses('901').values()), list(self.statuses().values()))
+        self.assertEqual(
+            FinalSample.objects.get(ttn_number='901', match_status='partial').price_code, '200'
+        )
+
+    def test_force_still_uses_memory(self):
+        self.run_ttn()
+        self.assertEqual(self.run_ttn(force=True), [])
+        self.assertEqual(len(self.samples()), len(PRODUCT_NAMES))
+
+    def test_no_memory_matches_everything(self):
+        self.run_ttn()
+        self.assertEqual(self.run_ttn(force=True, no_memory=True), PRODUCT_NAMES)
+        self.assertEqual(MatchMemory.objects.count(), len(PRODUCT_NAMES))
+
+    def test_catalog_change_invalidates_memory(self):
+        self.run_ttn()
+        old_version = catalog_version(self.price_list)
+        # Новая позиция: товар без совпадений теперь находится, память прежней версии не годится
+        self.add_price('999', 'QQ-7', 'Неизвестный товар')
+
+        self.assertEqual(self.run_ttn(), PRODUCT_NAMES)
+        self.assertEqual(self.statuses()['999 XX Неизвестный товар'], 'textual')
+        self.assertFalse(MatchMemory.objects.filter(catalog_version=old_version).exists())
+        self.assertEqual(
+            MatchMemory.objects.filter(catalog_version=catalog_version(self.price_list)).count(),
+            len(PRODUCT_NAMES)
+        )
+
+
+
+class IncrementalReprocessingTests(ProcessTTNMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.run_ttn()
+        self.first = self.samples()
+
+    def ids(self):
+        return {name: sample_id for name, (sample_id, _) in self.samples().items()}
+
+    def test_unchanged_products_are_skipped(self):
+        self.assertEqual(self.run_ttn(no_memory=True), [])
+        self.assertEqual(self.samples(), self.first)
+
+    def test_changed_product_is_rematched(self):
+        product = Product.objects.get(name='300 ZZZ шайба пружинная')
+        product.name = '300 EF-3 шайба пружинная'
+        product.save()
+
+        self.assertEqual(self.run_ttn(), ['300 EF-3 шайба пружинная'])
+        samples = self.samples()
+        self.assertEqual(samples['300 EF-3 шайба пружинная'][1], 'full')
+        self.assertNotIn('300 ZZZ шайба пружинная', samples)
+        for name in PRODUCT_NAMES[:2] + PRODUCT_NAMES[3:]:
+            self.assertEqual(samples[name], self.first[name])
+
+    def test_changed_quantity_replaces_only_its_row(self):
+        product = Product.objects.get(name='100 AB-1 Болт стальной')
+        product.quantity = 7
+        product.save()
+
+        # Название то же - результат берётся из памяти, но строка пересобирается
+        self.assertEqual(self.run_ttn(), [])
+        sample = FinalSample.objects.get(product=product)
+        self.assertNotEqual(sample.id, self.first[product.name][0])
+        self.assertEqual(sample.product_quantity, 7)
+        self.assertEqual(FinalSample.objects.filter(ttn_number='900').count(), len(PRODUCT_NAMES))
+        for name in PRODUCT_NAMES[1:]:
+            self.assertEqual(self.samples()[name], self.first[name])
+
+    def test_price_list_change_rematches_all(self):
+        self.add_price('999', 'QQ-7', 'Неизвестный товар')
+
+        self.assertEqual(self.run_ttn(), PRODUCT_NAMES)
+        ids = self.ids()
+        self.assertFalse(set(ids.values()) & {sample_id for sample_id, _ in self.first.values()})
+        self.assertEqual(self.statuses()['999 XX Неизвестный товар'], 'textual')
+
+    def test_stale_rows_are_removed(self):
+        duplicate = FinalSample.objects.get(product_name=PRODUCT_NAMES[0])
+        duplicate.pk = None
+        duplicate.save()
+        orphan = FinalSample.objects.get(product_name=PRODUCT_NAMES[1])
+        orphan.pk = None
+        orphan.product = None
+        orphan.save()
+        Product.objects.filter(name=PRODUCT_NAMES[3]).update(ttn=self.make_ttn('901', []))
+
+        self.assertEqual(self.run_ttn(), [])
+        self.assertEqual(self.ids(), {name: self.first[name][0] for name in PRODUCT_NAMES[:3]})
+
+    def test_force_replaces_all_rows(self):
+        self.assertEqual(self.run_ttn(force=True, no_memory=True), PRODUCT_NAMES)
+        self.assertEqual(self.statuses(), {name: status for name, (_, status) in self.first.items()})
+        self.assertFalse(set(self.ids().values()) & {sample_id for sample_id, _ in self.first.values()})
+
+    def test_failed_force_keeps_previous_rows(self):
+        # Ошибка после вставки новых строк откатывает и удаление старых
+        with mock.patch.object(process_ttn.Command, 'remember_matches', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                self.run_ttn(force=True)
+        self.assertEqual(self.samples(), self.first)
@@ -0,0 +1,52 @@
+# parser/tests/test_products.py
+from datetime import date
+
+from django.test import TestCase
+
+from parser.models import ExcelFile, Invoice, Product, round_amount
+
+# (количество, цена): половины копейки, числа без точного двоичного представления, минус, ноль
+AMOUNTS = [
+    (1, 0.125), (1, 0.005), (1, 1.005), (1, 2.675), (3, 0.335), (1, -0.005), (0.1, 0.35),
+    (0, 5), (2.5, -4661.99), (638, 2156.3025), (25, 1167.5122), (97.815, -2787.0), (3, 1 / 3),
+]
+
+
+class ProductTotalsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.invoice = Invoice.objects.create(number='1', date=date(2025, 6, 24))
+        cls.excel_file = ExcelFile.objects.create(file='uploads/1.xlsx', invoice=cls.invoice)
+
+    def product(self, quantity, price):
+        return Product(invoice=self.invoice, excel_file=self.excel_file, name='Товар', quantity=quantity, price=price)
+
+    def test_save_matches_fill_totals(self):
+        saved = []
+        for quantity, price in AMOUNTS:
+            product = self.product(quantity, price)
+            with self.assertNumQueries(1):
+                product.save()
+            saved.append(product)
+
+        Product.objects.fill_totals()
+        for product in saved:
+            with self.subTest(quantity=product.quantity, price=product.price):
+                in_db = Product.objects.get(pk=product.pk)
+                self.assertEqual((product.total, product.full_price), (in_db.total, in_db.total))
+                self.assertEqual(in_db.full_price, in_db.total)
+
+    def test_half_cent_rounds_away_from_zero(self):
+        self.assertEqual(round_amount(2.675), 2.68)
+        self.assertEqual(round_amount(-0.005), -0.01)
+        self.assertEqual(round_amount(1 / 3), 0.33)
+        self.assertIsNone(round_amount(float('nan')))
+        self.assertEqual(round_amount(float('inf')), float('inf'))
+
+    def test_update_fields_include_totals(self):
+        product = self.product(2, 1.5)
+        product.save()
+        product.price = 1.255
+        product.save(update_fields=['price'])
+        in_db = Product.objects.get(pk=product.pk)
+        self.assertEqual((in_db.total, in_db.full_price), (2.51, 2.51))
@@ -0,0 +1,148 @@
+# parser/tests/test_sheet_cache.py
+import os
+import tempfile
+from datetime import date, datetime, timezone
+from decimal import Decimal
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from parser import sheet_cache
+from parser.tests.test_xlsx_stream import typed
+
+
+def typed_rows(rows):
+    return typed(dict(rows))
+
+
+class ColumnEncodingTests(SimpleTestCase):
+    def round_trip(self, values):
+        return sheet_cache.decode_column(*sheet_cache.encode_column(values))
+
+    def test_round_trip(self):
+        values = [
+            None, 0, -5, 2 ** 62, 1.5, -0.0, 1e-300, float('inf'), '', 'строка', '  с пробелами  ',
+            True, False, datetime(2025, 6, 24, 13, 5, 7, 123456), datetime(1899, 12, 30), None,
+        ]
+        decoded = self.round_trip(values)
+        self.assertEqual([(type(value), value) for value in decoded], [(type(value), value) for value in values])
+
+    def test_nan_and_empty(self):
+        self.assertEqual(self.round_trip([]), [])
+        decoded = self.round_trip([float('nan'), None])
+        self.assertNotEqual(decoded[0], decoded[0])
+        self.assertIsNone(decoded[1])
+
+    def test_uncacheable(self):
+        for value in (datetime(2025, 1, 1, tzinfo=timezone.utc), date(2025, 1, 1), Decimal('1.5'), 2 ** 70, b'x'):
+            with self.subTest(value=value):
+                with self.assertRaises(sheet_cache.Uncacheable):
+                    sheet_cache.encode_column([1, value])
+
+
+class CacheFilesTests(SimpleTestCase):
+    def setUp(self):
+        super().setUp()
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        patcher = mock.patch.object(sheet_cache, 'CACHE_DIR', os.path.join(self.tmp.name, 'sheets'))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def path(self, name):
+        return os.path.join(sheet_cache.CACHE_DIR, name)
+
+    def round_trip(self, rows, key='stream-1'):
+        sheet_cache.save('hash', key, rows)
+        sheet = sheet_cache.load(sheet_cache.entry_path('hash', key))
+        self.assertEqual(len(sheet), len(rows))
+        return list(sheet)
+
+    def test_save_and_load(self):
+        rows = [(1, ('Код', 'Наименование', 'Цена')), (2, ('100', 'Товар', 12.5)), (7, ('200', None, 3))]
+        self.assertEqual(typed_rows(self.round_trip(rows)), typed_rows(rows))
+
+    def test_short_rows_keep_length(self):
+        # xlrd отдаёт строку до последней заполненной ячейки: длина должна сохраниться
+        rows = [(1, ('a', 1, 2.5)), (2, ('b',)), (3, ()), (5, (None, True, 'x', None))]
+        self.assertEqual(typed_rows(self.round_trip(rows)), typed_rows(rows))
+        self.assertEqual(self.round_trip([(1, ()), (2, ())], 'empty'), [(1, ()), (2, ())])
+        self.assertEqual(self.round_trip([], 'none'), [])
+
+    def test_sheet_is_written_and_read_in_chunks(self):
+        rows = [(number, (f'строка {number}',) * (number % 4) + (number,)) for number in range(1, 12)]
+        with mock.patch.object(sheet_cache, 'CHUNK_ROWS', 3):
+            writer = sheet_cache.SheetWriter('hash')
+            buffered = []
+            for row in rows:
+                writer.add(row)
+                buffered.append(len(writer.rows))
+            writer.commit('stream-1')
+        self.assertLess(max(buffered), 3)
+
+        sheet = sheet_cache.load(sheet_cache.entry_path('hash', 'stream-1'))
+        self.assertEqual((sheet.chunks, len(sheet)), (4, 11))
+        # Куски декодируются по мере обхода
+        with mock.patch.object(sheet_cache, 'decode_chunk', wraps=sheet_cache.decode_chunk) as decode:
+            iterator = iter(sheet)
+            first = [next(iterator) for _ in range(3)]
+            self.assertEqual(decode.call_count, 1)
+            self.assertEqual(typed_rows(first + list(iterator)), typed_rows(rows))
+            self.assertEqual(decode.call_count, 4)
+
+    def test_uncacheable_sheet_is_not_stored(self):
+        with mock.patch.object(sheet_cache, 'CHUNK_ROWS', 2):
+            sheet_cache.save('hash', 'stream-1', [(1, ('a', 1)), (2, ('b', 2)), (3, ('a', date(2025, 1, 1)))])
+        self.assertEqual(os.listdir(sheet_cache.CACHE_DIR), [])
+
+    def test_broken_file(self):
+        self.assertIsNone(sheet_cache.load(self.path('missing.npz')))
+        os.makedirs(sheet_cache.CACHE_DIR)
+        with open(self.path('broken.npz'), 'wb') as f:
+            f.write(b'not a zip')
+        self.assertIsNone(sheet_cache.load(self.path('broken.npz')))
+
+    def test_evict_least_recently_used(self):
+        rows = [(number, (f'строка {number}' * 20, number)) for number in range(50)]
+        paths = {}
+        for age, name in enumerate(['new', 'middle', 'old']):
+            sheet_cache.save(name, 'stream-1', rows)
+            paths[name] = sheet_cache.entry_path(name, 'stream-1')
+            os.utime(paths[name], (1_000_000 - age, 1_000_000 - age))
+        size = os.path.getsize(paths['new'])
+        # Чтение отмечает лист как использованный: самым старым становится middle
+        sheet_cache.load(paths['old'])
+
+        sheet_cache.evict(max_bytes=size * 2)
+        kept = sorted(os.path.basename(paths[name]) for name in ('new', 'old'))
+        self.assertEqual(sorted(os.listdir(sheet_cache.CACHE_DIR)), kept)
+        sheet_cache.evict(max_bytes=size * 2)
+        self.assertEqual(len(os.listdir(sheet_cache.CACHE_DIR)), 2)
+        sheet_cache.evict(max_bytes=0)
+        self.assertEqual(os.listdir(sheet_cache.CACHE_DIR), [])
+
+    def test_lookup_and_recording(self):
+        source = os.path.join(self.tmp.name, 'price.xlsx')
+        with open(source, 'wb') as f:
+            f.write(b'content')
+        rows = [(1, ('a', 1)), (2, ('b', 2.0))]
+
+        key, cached, content_hash = sheet_cache.lookup(source, ['stream-1'])
+        self.assertEqual((key, cached), (None, None))
+        # Недочитанный лист не сохраняется, и его временный файл удаляется
+        with mock.patch.object(sheet_cache, 'CHUNK_ROWS', 1):
+            partial = sheet_cache.recording(iter(rows), content_hash, 'stream-1')
+            next(partial)
+            next(partial)
+            self.assertEqual(len(os.listdir(sheet_cache.CACHE_DIR)), 1)
+            partial.close()
+        self.assertEqual(os.listdir(sheet_cache.CACHE_DIR), [])
+        self.assertEqual(sheet_cache.lookup(source, ['stream-1'])[:2], (None, None))
+
+        self.assertEqual(list(sheet_cache.recording(iter(rows), content_hash, 'stream-1')), rows)
+        key, cached, _ = sheet_cache.lookup(source, ['openpyxl-1', 'stream-1'])
+        self.assertEqual(key, 'stream-1')
+        self.assertEqual(typed_rows(cached), typed_rows(rows))
+
+        with mock.patch.object(sheet_cache, '_enabled', False):
+            self.assertEqual(sheet_cache.lookup(source, ['stream-1']), (None, None, None))
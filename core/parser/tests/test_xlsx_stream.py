@@ -0,0 +1,189 @@
+# parser/tests/test_xlsx_stream.py
+import os
+import tempfile
+from datetime import datetime
+from unittest import mock
+
+from django.test import SimpleTestCase
+from openpyxl import Workbook
+
+from parser import sheet_cache
+from parser.invoices import iter_invoice_chunks, openpyxl_rows, parse_invoice_file
+from parser.prices.readers import PRICE_COLUMNS, READERS as PRICE_READERS, iter_price_rows
+from parser.tests.workbooks import openpyxl_values, shared, write_xlsx
+from parser.xlsx_stream import UnsupportedWorkbook, XlsxStreamReader
+
+
+def stream_values(path, max_columns):
+    """Непустые строки листа по XlsxStreamReader, как openpyxl_values"""
+    return {
+        row_number: values
+        for row_number, values in XlsxStreamReader(path, max_columns=max_columns)
+        if any(value is not None for value in values)
+    }
+
+
+def typed(rows):
+    """Значения вместе с типами: 3 и 3.0 (а также 1 и True) для читателей - разные значения"""
+    return {row_number: tuple((type(value), value) for value in values) for row_number, values in rows.items()}
+
+
+class TempDirMixin:
+    def setUp(self):
+        super().setUp()
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        # Кэш листов не должен подменять результат читателя
+        patcher = mock.patch.object(sheet_cache, '_enabled', False)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def path(self, name):
+        return os.path.join(self.tmp.name, name)
+
+
+class XlsxStreamReaderTests(TempDirMixin, SimpleTestCase):
+    def assertSameAsOpenpyxl(self, path, max_columns=5):
+        self.assertEqual(typed(stream_values(path, max_columns)), typed(openpyxl_values(path, max_columns)))
+
+    def test_openpyxl_written_workbook(self):
+        wb = Workbook()
+        ws = wb.active
+        ws.append(['1', '2', '3', '4', '5'])
+        ws.append(['Товар 1 арт-1', None, 3, 12.5, 37.5])
+        ws.append(['Товар 2', 'шт', -1, 0.1, True])
+        ws.append([None, None, None, None, None])
+        ws.append(['  пробелы  ', '', 10 ** 12, 1e-7, False])
+        ws.append(['Короткая'])
+        ws['G7'] = 'за пределами max_columns'
+        path = self.path('openpyxl.xlsx')
+        wb.save(path)
+        self.assertSameAsOpenpyxl(path)
+        self.assertSameAsOpenpyxl(path, max_columns=9)
+
+    def test_shared_and_inline_strings(self):
+        path = write_xlsx(
+            self.path('strings.xlsx'),
+            [
+                '<row r="1"><c r="A1" t="s"><v>0</v></c><c r="B1" t="s"><v>1</v></c><c r="C1" t="s"><v>2</v></c></row>',
+                '<row r="2"><c r="A2" t="inlineStr"><is><t>inline</t></is></c>'
+                '<c r="B2" t="inlineStr"><is><r><t>rich </t></r><r><rPr><b/></rPr><t>inline</t></r></is></c>'
+                '<c r="C2" t="str"><v>формула</v></c><c r="D2" t="e"><v>#N/A</v></c></row>',
+            ],
+            [
+                shared('простая строка'),
+                '<si><r><t>жирный </t></r><r><rPr><i/></rPr><t>курсив</t></r></si>',
+                '<si><t>текст</t><rPh sb="0" eb="1"><t>фонетика</t></rPh></si>',
+            ]
+        )
+        self.assertSameAsOpenpyxl(path)
+        self.assertEqual(stream_values(path, 5)[1][:3], ('простая строка', 'жирный курсив', 'текст'))
+
+    def test_empty_cells_and_gaps(self):
+        path = write_xlsx(
+            self.path('gaps.xlsx'),
+            [
+                '<row r="1"><c r="A1"><v>1</v></c><c r="C1"><v>3</v></c><c r="E1"><v>5</v></c></row>',
+                '<row r="2"><c r="A2"/><c r="B2" t="s"/><c r="D2"><v>4.0</v></c></row>',
+                '<row r="3"/>',
+                '<row r="5"><c r="B5"><v>1.5E3</v></c></row>',
+                # Без ссылок r: позиция - следом за предыдущей ячейкой
+                '<row><c><v>7</v></c><c t="b"><v>1</v></c><c t="b"><v>0</v></c></row>',
+            ]
+        )
+        self.assertSameAsOpenpyxl(path)
+        self.assertEqual(stream_values(path, 5)[6], (7, True, False, None, None))
+
+    def test_short_rows_are_padded(self):
+        path = write_xlsx(
+            self.path('short.xlsx'),
+            [
+                '<row r="1"><c r="A1" t="inlineStr"><is><t>одна ячейка</t></is></c></row>',
+                '<row r="2"><c r="A2"><v>1</v></c><c r="B2"><v>2</v></c></row>',
+                '<row r="3"><c r="A3"><v>1</v></c><c r="B3"><v>2</v></c><c r="C3"><v>3</v></c>'
+                '<c r="D3"><v>4</v></c><c r="E3"><v>5</v></c><c r="F3"><v>6</v></c></row>',
+            ]
+        )
+        rows = list(XlsxStreamReader(path, max_columns=5))
+        self.assertEqual([len(values) for _, values in rows], [5, 5, 5])
+        self.assertEqual(rows[0], (1, ('одна ячейка', None, None, None, None)))
+        self.assertEqual(rows[2], (3, (1, 2, 3, 4, 5)))
+        self.assertSameAsOpenpyxl(path)
+
+    def test_dates_are_unsupported(self):
+        for style in ('1', '2'):  # встроенный формат даты и свой dd/mm/yyyy
+            with self.subTest(style=style):
+                path = write_xlsx(
+                    self.path(f'date{style}.xlsx'),
+                    [
+                        '<row r="1"><c r="A1" t="inlineStr"><is><t>до даты</t></is></c></row>',
+                        f'<row r="2"><c r="A2" s="{style}"><v>45832</v></c></row>',
+                    ]
+                )
+                reader = iter(XlsxStreamReader(path))
+                self.assertEqual(next(reader), (1, ('до даты', None, None, None, None)))
+                with self.assertRaises(UnsupportedWorkbook):
+                    next(reader)
+                self.assertEqual(openpyxl_values(path, 5)[2][0], datetime(2025, 6, 24))
+
+    def test_not_a_workbook(self):
+        path = self.path('broken.xlsx')
+        with open(path, 'wb') as f:
+            f.write(b'not a zip file')
+        with self.assertRaises(UnsupportedWorkbook):
+            list(XlsxStreamReader(path))
+
+
+class ReaderFallbackTests(TempDirMixin, SimpleTestCase):
+    def invoice(self, date_cell=False):
+        """Страница накладной: строка номеров колонок и три товара; дата - в неиспользуемой колонке B"""
+        rows = ['<row r="1"><c r="A1" t="inlineStr"><is><t>1</t></is></c><c r="B1" t="inlineStr"><is><t>2</t></is></c>'
+                '<c r="C1" t="inlineStr"><is><t>3</t></is></c><c r="D1" t="inlineStr"><is><t>4</t></is></c></row>']
+        for number in range(2, 5):
+            b_cell = f'<c r="B{number}" s="1"><v>45832</v></c>' if date_cell and number == 3 else ''
+            rows.append(
+                f'<row r="{number}"><c r="A{number}" t="s"><v>{number - 2}</v></c>{b_cell}'
+                f'<c r="C{number}"><v>{number}</v></c><c r="D{number}" t="inlineStr"><is><t>1,5</t></is></c>'
+                f'<c r="E{number}"><v>{number * 1.5}</v></c></row>'
+            )
+        strings = [shared(f"Товар {i} арт-{i}") for i in range(3)]
+        return write_xlsx(self.path(f"1_24-06-2025_{int(date_cell)}.xlsx"), rows, strings)
+
+    def openpyxl_result(self, path):
+        chunks = list(iter_invoice_chunks(path, openpyxl_rows))
+        return [row for chunk in chunks for row in chunk['rows']], [e for chunk in chunks for e in chunk['errors']]
+
+    def test_invoice_read_by_stream(self):
+        path = self.invoice()
+        result = parse_invoice_file(path)
+        self.assertEqual(result['reader'], 'stream')
+        self.assertIsNone(result['error'])
+        self.assertEqual((result['rows'], result['errors']), self.openpyxl_result(path))
+        self.assertEqual(len(result['rows']), 3)
+
+    def test_invoice_with_date_falls_back_to_openpyxl(self):
+        path = self.invoice(date_cell=True)
+        result = parse_invoice_file(path)
+        self.assertEqual(result['reader'], 'openpyxl')
+        self.assertIsNone(result['error'])
+        self.assertEqual((result['rows'], result['errors']), self.openpyxl_result(path))
+        self.assertEqual(len(result['rows']), 3)
+
+    def test_price_reader_resumes_after_date(self):
+        rows = ['<row r="1"><c r="A1" t="inlineStr"><is><t>Код</t></is></c></row>']
+        for number in range(2, 8):
+            style = ' s="2"' if number == 5 else ''
+            rows.append(
+                f'<row r="{number}"><c r="A{number}" t="inlineStr"><is><t>{number}00</t></is></c>'
+                f'<c r="B{number}" t="s"><v>0</v></c><c r="E{number}"{style}><v>{number}.25</v></c></row>'
+            )
+        path = write_xlsx(self.path('price_01-01-2025.xlsx'), rows, [shared('тип')])
+
+        fallbacks = []
+        result = list(iter_price_rows(path, on_fallback=lambda name, error: fallbacks.append(name)))
+        expected = [(row, tuple(values)) for row, values in PRICE_READERS['openpyxl'](path)]
+        self.assertEqual([name for name in fallbacks], ['stream'])
+        self.assertEqual([row for row, _ in result], [2, 3, 4, 5, 6, 7])
+        self.assertEqual(typed(dict(result)), typed(dict(expected)))
+        self.assertIsInstance(result[3][1][4], datetime)
+        self.assertEqual(len(result[0][1]), PRICE_COLUMNS)
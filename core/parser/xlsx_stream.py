@@ -0,0 +1,194 @@
+# parser/xlsx_stream.py
+"""Потоковое чтение значений с активного листа .xlsx без openpyxl.
+
+XML листа разбирается прямо из zip-архива через iterparse, обработанные
+строки сразу выбрасываются, поэтому память не растёт с размером листа.
+Поддерживается только то, что встречается в наших файлах; всё остальное
+(даты, strict OOXML, нестандартная структура) - UnsupportedWorkbook, и
+вызывающий код переходит на openpyxl.
+"""
+import posixpath
+import re
+import zipfile
+from xml.etree.ElementTree import iterparse
+
+MAIN_NS = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+REL_NS = '{http://schemas.openxmlformats.org/officeDocument/2006/relationships}'
+PKG_REL_NS = '{http://schemas.openxmlformats.org/package/2006/relationships}'
+
+# Встроенные форматы дат Excel (numFmtId)
+BUILTIN_DATE_FORMATS = set(range(14, 23)) | {45, 46, 47}
+DATE_FORMAT_RE = re.compile(r'[dmyhs]', re.IGNORECASE)
+CELL_REF_RE = re.compile(r'^([A-Z]+)(\d+)$')
+# Версия разбора: увеличивается, если меняются значения, которые отдаёт читатель
+# (входит в ключ кэша листов parser.sheet_cache)
+VERSION = 1
+
+
+class UnsupportedWorkbook(Exception):
+    """Книгу нельзя прочитать потоково - нужен openpyxl"""
+
+
+def column_index(letters):
+    index = 0
+    for letter in letters:
+        index = index * 26 + ord(letter) - 64
+    return index - 1
+
+
+def cast_number(value):
+    """Число из <v> так же, как это делает openpyxl: int без точки и экспоненты"""
+    if '.' in value or 'E' in value or 'e' in value:
+        return float(value)
+    return int(value)
+
+
+def element_text(element):
+    """Текст строки: все <t>, включая rich-text фрагменты, без фонетики <rPh>"""
+    parts = []
+    for child in element:
+        if child.tag == f'{MAIN_NS}t':
+            parts.append(child.text or '')
+        elif child.tag == f'{MAIN_NS}r':
+            parts.extend(t.text or '' for t in child.iter(f'{MAIN_NS}t'))
+    return ''.join(parts)
+
+
+def is_date_format(code):
+    # Убираем литералы в кавычках и секции в [] (цвет, локаль), затем ищем d/m/y/h/s
+    code = re.sub(r'"[^"]*"|\[[^\]]*\]|\\.', '', code)
+    return bool(DATE_FORMAT_RE.search(code))
+
+
+class XlsxStreamReader:
+    """Потоковый читатель первых max_columns колонок активного листа"""
+
+    def __init__(self, path, max_columns=5):
+        self.path = path
+        self.max_columns = max_columns
+
+    def read_xml(self, archive, name):
+        try:
+            return archive.open(name)
+        except KeyError:
+            raise UnsupportedWorkbook(f"В архиве нет {name}")
+
+    def sheet_path(self, archive):
+        """Путь к XML активного листа по workbook.xml и его связям"""
+        active_tab = 0
+        sheet_ids = []
+        with self.read_xml(archive, 'xl/workbook.xml') as f:
+            for _, element in iterparse(f):
+                if element.tag == f'{MAIN_NS}workbookView':
+                    active_tab = int(element.get('activeTab', 0))
+                elif element.tag == f'{MAIN_NS}sheet':
+                    sheet_ids.append(element.get(f'{REL_NS}id'))
+        if not sheet_ids:
+            raise UnsupportedWorkbook("Не найдены листы (возможно, strict OOXML)")
+        sheet_id = sheet_ids[min(active_tab, len(sheet_ids) - 1)]
+
+        with self.read_xml(archive, 'xl/_rels/workbook.xml.rels') as f:
+            for _, element in iterparse(f):
+                if element.tag == f'{PKG_REL_NS}Relationship' and element.get('Id') == sheet_id:
+                    target = element.get('Target')
+                    if target.startswith('/'):
+                        return target.lstrip('/')
+                    return posixpath.normpath(posixpath.join('xl', target))
+        raise UnsupportedWorkbook(f"Не найден лист {sheet_id}")
+
+    def shared_strings(self, archive):
+        if 'xl/sharedStrings.xml' not in archive.namelist():
+            return []
+        strings = []
+        with archive.open('xl/sharedStrings.xml') as f:
+            for _, element in iterparse(f):
+                if element.tag == f'{MAIN_NS}si':
+                    strings.append(element_text(element))
+                    element.clear()
+        return strings
+
+    def date_styles(self, archive):
+        """Индексы стилей ячеек с форматом даты"""
+        if 'xl/styles.xml' not in archive.namelist():
+            return set()
+        custom_formats = {}
+        style_formats = []
+        in_cell_xfs = False
+        with archive.open('xl/styles.xml') as f:
+            for event, element in iterparse(f, events=('start', 'end')):
+                if element.tag == f'{MAIN_NS}cellXfs':
+                    in_cell_xfs = event == 'start'
+                elif event == 'end' and element.tag == f'{MAIN_NS}numFmt':
+                    custom_formats[int(element.get('numFmtId'))] = element.get('formatCode', '')
+                elif event == 'end' and in_cell_xfs and element.tag == f'{MAIN_NS}xf':
+                    style_formats.append(int(element.get('numFmtId', 0)))
+        return {
+            style for style, format_id in enumerate(style_formats)
+            if format_id in BUILTIN_DATE_FORMATS
+            or (format_id in custom_formats and is_date_format(custom_formats[format_id]))
+        }
+
+    def cell_value(self, cell, strings, date_styles):
+        cell_type = cell.get('t', 'n')
+        if cell_type == 'inlineStr':
+            inline = cell.find(f'{MAIN_NS}is')
+            return element_text(inline) if inline is not None else None
+
+        value_element = cell.find(f'{MAIN_NS}v')
+        value = value_element.text if value_element is not None else None
+        if value is None:
+            return None
+
+        if cell_type == 's':
+            return strings[int(value)]
+        if cell_type in ('str', 'e'):
+            return value
+        if cell_type == 'b':
+            return value == '1'
+        if cell_type == 'n':
+            if int(cell.get('s', 0)) in date_styles:
+                raise UnsupportedWorkbook("Ячейка с датой: нужен openpyxl")
+            return cast_number(value)
+        raise UnsupportedWorkbook(f"Неизвестный тип ячейки: {cell_type}")
+
+    def __iter__(self):
+        """(номер строки, кортеж значений) для каждой непустой строки листа"""
+        try:
+            archive = zipfile.ZipFile(self.path)
+        except (zipfile.BadZipFile, OSError) as e:
+            raise UnsupportedWorkbook(str(e))
+
+        with archive:
+            strings = self.shared_strings(archive)
+            date_styles = self.date_styles(archive)
+            row_tag, cell_tag = f'{MAIN_NS}row', f'{MAIN_NS}c'
+
+            with self.read_xml(archive, self.sheet_path(archive)) as f:
+                row_number = 0
+                sheet_data = None
+                for event, element in iterparse(f, events=('start', 'end')):
+                    if event == 'start':
+                        if element.tag == f'{MAIN_NS}sheetData':
+                            sheet_data = element
+                        continue
+                    if element.tag != row_tag:
+                        continue
+
+                    row_number = int(element.get('r', row_number + 1))
+                    values = [None] * self.max_columns
+                    position = 0
+                    for cell in element.iter(cell_tag):
+                        ref = cell.get('r')
+                        if ref:
+                            match = CELL_REF_RE.match(ref)
+                            if not match:
+                                raise UnsupportedWorkbook(f"Неожиданная ссылка на ячейку: {ref}")
+                            position = column_index(match.group(1))
+                        if position < self.max_columns:
+                            values[position] = self.cell_value(cell, strings, date_styles)
+                        position += 1
+
+                    # Разобранные строки выбрасываем, чтобы память не росла
+                    if sheet_data is not None:
+                        sheet_data.clear()
+                    yield row_number, tuple(values)